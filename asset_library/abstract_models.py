@@ -1,17 +1,18 @@
-import os
-from PIL import Image
-
 from django.conf import settings
-from django.contrib.staticfiles import finders
-from django.contrib.staticfiles.storage import staticfiles_storage
-from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models import get_model
 from django.utils.translation import ugettext_lazy as _
 
-from model_utils.managers import InheritanceManager
-
+from .cache import invalidate_assets
+from .fields import InspectedImageField
+from .managers import AssetManager, TagManager, \
+    TransformationResultManager
+from .storage import get_asset_storage
 from .validators import validate_file_extension, validate_image_extension
-from .utils import get_extension
+from .thumbnails import generate_thumbnails, get_file_icon_url, \
+    schedule_thumbnails
+from .utils import create_job_id, get_checksum, get_content_type, \
+    get_extension, inspect_image, reverse_pk
 
 IMAGE_GLOBAL_PERMISSION = 'global_image_assets'
 FILE_GLOBAL_PERMISSION = 'global_file_assets'
@@ -21,6 +22,8 @@ SNIPPET_GLOBAL_PERMISSION = 'global_snippet_assets'
 class AbstractTag(models.Model):
     name = models.CharField(max_length=50, unique=True)
 
+    objects = TagManager()
+
     class Meta:
         abstract = True
 
@@ -40,10 +43,15 @@ class AbstractAsset(models.Model):
                                   null=True, blank=True)
 
     # When fetching assets, automatically downcast them
-    objects = InheritanceManager()
+    objects = AssetManager()
 
     class Meta:
         abstract = True
+        # Access paths of listings, see indexes.py
+        index_together = [
+            ('creator', 'is_global', 'shared_by', 'date_created'),
+            ('is_global', 'date_created'),
+        ]
 
     def __unicode__(self):
         return self.name
@@ -83,14 +91,40 @@ class AbstractAsset(models.Model):
         initials.update(kwargs)
         # Create a new asset
         asset = model.objects.create(**initials)
-        asset.tags = tags
+        asset.set_tags(tags)
         return asset
 
+    def set_tags(self, tags):
+        """ Replace tags of asset, write only the changed ones
+
+        Unlike assigning to the tags field, which deletes all tags and
+        inserts the new ones, unchanged tags are kept.
+
+        :param tags: tags, e.g. from Tag.objects.get_or_create_many()
+        """
+        AssetTag = type(self).tags.through
+        new = set(tag.pk for tag in tags)
+        current = set(AssetTag.objects.filter(asset=self.pk)
+                      .values_list('tag_id', flat=True))
+        if current - new:
+            self.tags.remove(*(current - new))
+        if new - current:
+            self.tags.add(*(new - current))
+
     def share(self, shared_by, shared_with):
         """ Share asset
 
         DB schema requires that shared_with becomes creator (owner) of
-        the asset and shared_by becomes shared_by field"""
+        the asset and shared_by becomes shared_by field.
+
+        With ASSET_SHARING_MODE 'reference' the asset is not copied, it gets
+        into inbox of shared_with as SharedAsset instead and is copied only
+        when accepted. Returns the copy or the SharedAsset. """
+        if settings.ASSET_SHARING_MODE == 'reference':
+            SharedAsset = get_model('asset_library', 'SharedAsset')
+            return SharedAsset.objects.get_or_create(
+                asset=self, shared_with=shared_with,
+                defaults={'shared_by': shared_by})[0]
         return self._create_deep_copy(creator=shared_with, shared_by=shared_by)
 
     def accept_shared(self):
@@ -103,10 +137,132 @@ class AbstractAsset(models.Model):
         self.delete()
 
 
+class AbstractSharedAsset(models.Model):
+    """ Reference to an asset in inbox of a user, see AbstractAsset.share()
+
+    Inbox costs one row per share instead of a deep copy of the asset. """
+    asset = models.ForeignKey('asset_library.Asset', related_name='shares')
+    shared_with = models.ForeignKey('auth.User', related_name='asset_inbox')
+    shared_by = models.ForeignKey('auth.User', related_name='+')
+    date_shared = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        abstract = True
+        # Index for listing inbox of a user
+        unique_together = ('shared_with', 'asset')
+
+    def __unicode__(self):
+        return u"%s for %s" % (self.asset, self.shared_with)
+
+    def accept(self):
+        """ Copy the asset to assets of the user and remove it from inbox
+
+        Accepted assets can be edited by the user, the copy is needed only
+        now. Returns the copy. """
+        Asset = get_model('asset_library', 'Asset')
+        asset = Asset.objects.get_subclass(pk=self.asset_id)
+        copy = asset._create_deep_copy(
+            creator=self.shared_with, shared_by=None)
+        self.delete()
+        return copy
+
+    def reject(self):
+        """ Remove asset from inbox, the asset itself is kept """
+        self.delete()
+
+
+class AbstractSearchToken(models.Model):
+    """ Word of an asset for InvertedIndexSearchBackend, see search.py """
+    asset = models.ForeignKey('asset_library.Asset', related_name='+')
+    token = models.CharField(max_length=50)
+    # Sum of weights of fields containing the word
+    weight = models.PositiveSmallIntegerField()
+
+    class Meta:
+        abstract = True
+        # Prefix of token is looked up as a range, asset_id from the index
+        index_together = [('token', 'asset')]
+
+
+class AbstractSearchDocument(models.Model):
+    """ Text of an asset for PostgresSearchBackend, see search.py """
+    asset = models.OneToOneField('asset_library.Asset', primary_key=True,
+                                 related_name='+')
+    name = models.CharField(max_length=255)
+    # Description, tags and contents of snippets
+    text = models.TextField()
+
+    class Meta:
+        abstract = True
+
+
+class AbstractUserSearchEntry(models.Model):
+    """ Lowercased representation of user, see usersearch.py """
+    user = models.OneToOneField('auth.User', primary_key=True,
+                                related_name='+')
+    text = models.CharField(max_length=255)
+
+    class Meta:
+        abstract = True
+
+
+class AbstractUserSearchGram(models.Model):
+    """ Substring of user representation, see usersearch.py """
+    user = models.ForeignKey('auth.User', related_name='+')
+    gram = models.CharField(max_length=3)
+
+    class Meta:
+        abstract = True
+        index_together = [('gram', 'user')]
+
+
+class AbstractTransformationResult(models.Model):
+    """ Image written by the image editor, see transformations.py """
+    # Digest of contents of the source and of the operations
+    key = models.CharField(max_length=64, unique=True)
+    path = models.CharField(max_length=255)
+    width = models.IntegerField()
+    height = models.IntegerField()
+    date_used = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = TransformationResultManager()
+
+    class Meta:
+        abstract = True
+
+
+class AbstractTransformationJob(models.Model):
+    """ Edit of an image rendered by a worker thread, see transformations.py
+    """
+    QUEUED, RUNNING, DONE, FAILED = ('queued', 'running', 'done', 'failed')
+    STATUSES = (
+        (QUEUED, _('Queued')),
+        (RUNNING, _('Running')),
+        (DONE, _('Done')),
+        (FAILED, _('Failed')),
+    )
+    id = models.CharField(max_length=32, primary_key=True,
+                          default=create_job_id)
+    creator = models.ForeignKey('auth.User', related_name='+')
+    status = models.CharField(max_length=10, choices=STATUSES,
+                              default=QUEUED)
+    # Percentage of applied operations
+    progress = models.PositiveSmallIntegerField(default=0)
+    path = models.CharField(max_length=255, blank=True)
+    width = models.IntegerField(null=True)
+    height = models.IntegerField(null=True)
+    error = models.TextField(blank=True)
+    date_created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        abstract = True
+
+
 class ImageMixin(models.Model):
-    image = models.ImageField(upload_to='asset_library/images/',
-                              width_field='width', height_field='height',
-                              validators=[validate_image_extension])
+    image = InspectedImageField(upload_to='asset_library/images/',
+                                storage=get_asset_storage(),
+                                width_field='width', height_field='height',
+                                validators=[validate_image_extension])
     width = models.IntegerField()
     height = models.IntegerField()
     # Size of the image in bytes
@@ -115,6 +271,11 @@ class ImageMixin(models.Model):
     # Copyright information
     copyright_holder = models.CharField(max_length=255, blank=True)
     copyright_date = models.CharField(max_length=255, blank=True)
+    # URL of thumbnail in ASSET_IMAGE_THUMBNAIL_SIZE, see update_thumbnail()
+    thumbnail_url = models.CharField(max_length=255, blank=True)
+    # SHA-256 of the contents for finding duplicates
+    checksum = models.CharField(max_length=64, blank=True, db_index=True)
+    content_type = models.CharField(max_length=100, blank=True)
 
     class Meta:
         abstract = True
@@ -127,24 +288,26 @@ class ImageMixin(models.Model):
     def save(self, *args, **kwargs):
         self.populate_fields()
         super(ImageMixin, self).save(*args, **kwargs)
+        if not self.thumbnail_url:
+            schedule_thumbnails(self)
 
     def get_absolute_url(self):
-        return reverse('asset_library:image_detail', args=[self.id])
+        return reverse_pk('asset_library:image_detail', self.id)
 
     def get_update_url(self):
-        return reverse('asset_library:image_update', args=[self.id])
+        return reverse_pk('asset_library:image_update', self.id)
 
     def get_share_url(self):
-        return reverse('asset_library:image_share', args=[self.id])
+        return reverse_pk('asset_library:image_share', self.id)
 
     def get_delete_url(self):
-        return reverse('asset_library:image_delete', args=[self.id])
+        return reverse_pk('asset_library:image_delete', self.id)
 
     def get_accept_shared_url(self):
-        return reverse('asset_library:image_accept', args=[self.id])
+        return reverse_pk('asset_library:image_accept', self.id)
 
     def get_reject_shared_url(self):
-        return reverse('asset_library:image_reject', args=[self.id])
+        return reverse_pk('asset_library:image_reject', self.id)
 
     @property
     def path(self):
@@ -158,15 +321,32 @@ class ImageMixin(models.Model):
 
     def get_extension(self):
         """ Return real image extension """
-        im = Image.open(self.image)
-        return im.format.upper()
+        return inspect_image(self.image).format
+
+    def update_thumbnail(self):
+        """ Generate thumbnails and store URL of the main one
+
+        Listings can use the stored URL instead of asking sorl for every image
+        which means a key-value store lookup and possibly resizing the image.
+        The image has to be saved in storage already. """
+        self.thumbnail_url = generate_thumbnails(self.image.name)
+        type(self).objects.filter(pk=self.pk).update(
+            thumbnail_url=self.thumbnail_url)
+        invalidate_assets([self])
 
     def populate_fields(self):
-        """ Set derived fields extensions & size """
+        """ Set derived fields extensions, size, checksum & content type
+
+        Uploaded files come with checksum and content type computed by the
+        upload handler, the file isn't read again then. """
         if not self.extension:
             self.extension = self.get_extension()
         if not self.size:
             self.size = self.image.size
+        if not self.checksum:
+            self.checksum = get_checksum(self.image)
+        if not self.content_type:
+            self.content_type = get_content_type(self.image)
 
 
 class SnippetMixin(models.Model):
@@ -181,31 +361,35 @@ class SnippetMixin(models.Model):
     GLOBAL_PERMISSION = "asset_library.%s" % SNIPPET_GLOBAL_PERMISSION
 
     def get_absolute_url(self):
-        return reverse('asset_library:snippet_detail', args=[self.id])
+        return reverse_pk('asset_library:snippet_detail', self.id)
 
     def get_update_url(self):
-        return reverse('asset_library:snippet_update', args=[self.id])
+        return reverse_pk('asset_library:snippet_update', self.id)
 
     def get_share_url(self):
-        return reverse('asset_library:snippet_share', args=[self.id])
+        return reverse_pk('asset_library:snippet_share', self.id)
 
     def get_delete_url(self):
-        return reverse('asset_library:snippet_delete', args=[self.id])
+        return reverse_pk('asset_library:snippet_delete', self.id)
 
     def get_accept_shared_url(self):
-        return reverse('asset_library:snippet_accept', args=[self.id])
+        return reverse_pk('asset_library:snippet_accept', self.id)
 
     def get_reject_shared_url(self):
-        return reverse('asset_library:snippet_reject', args=[self.id])
+        return reverse_pk('asset_library:snippet_reject', self.id)
 
 
 class FileMixin(models.Model):
     file = models.FileField(
         upload_to='asset_library/files/',
+        storage=get_asset_storage(),
         validators=[validate_file_extension])
     # Size of the file in bytes
     size = models.IntegerField()
-    extension = models.CharField(max_length=50)
+    extension = models.CharField(max_length=50, db_index=True)
+    # SHA-256 of the contents for finding duplicates
+    checksum = models.CharField(max_length=64, blank=True, db_index=True)
+    content_type = models.CharField(max_length=100, blank=True)
 
     class Meta:
         abstract = True
@@ -220,22 +404,22 @@ class FileMixin(models.Model):
         super(FileMixin, self).save(*args, **kwargs)
 
     def get_absolute_url(self):
-        return reverse('asset_library:file_detail', args=[self.id])
+        return reverse_pk('asset_library:file_detail', self.id)
 
     def get_update_url(self):
-        return reverse('asset_library:file_update', args=[self.id])
+        return reverse_pk('asset_library:file_update', self.id)
 
     def get_share_url(self):
-        return reverse('asset_library:file_share', args=[self.id])
+        return reverse_pk('asset_library:file_share', self.id)
 
     def get_delete_url(self):
-        return reverse('asset_library:file_delete', args=[self.id])
+        return reverse_pk('asset_library:file_delete', self.id)
 
     def get_accept_shared_url(self):
-        return reverse('asset_library:file_accept', args=[self.id])
+        return reverse_pk('asset_library:file_accept', self.id)
 
     def get_reject_shared_url(self):
-        return reverse('asset_library:file_reject', args=[self.id])
+        return reverse_pk('asset_library:file_reject', self.id)
 
     @property
     def path(self):
@@ -250,20 +434,18 @@ class FileMixin(models.Model):
     @property
     def thumbnail_url(self):
         """ URL of icon representing file """
-        base_path = settings.ASSET_FILE_THUMBNAILS_PATH
-        default_thumbnail = base_path + 'default.png'
-
-        thumbnail = base_path + self.extension.lower() + '.png'
-        thumbnail_path = finders.find(thumbnail)
-
-        if not thumbnail_path or not os.path.exists(thumbnail_path):
-            thumbnail = default_thumbnail
-
-        return staticfiles_storage.url(thumbnail)
+        return get_file_icon_url(self.extension)
 
     def populate_fields(self):
-        """ Set derived fields extensions & size """
+        """ Set derived fields extensions, size, checksum & content type
+
+        Uploaded files come with checksum and content type computed by the
+        upload handler, the file isn't read again then. """
         if not self.extension:
             self.extension = get_extension(self.file.name)
         if not self.size:
             self.size = self.file.size
+        if not self.checksum:
+            self.checksum = get_checksum(self.file)
+        if not self.content_type:
+            self.content_type = get_content_type(self.file)
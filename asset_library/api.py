@@ -1,24 +1,43 @@
 from PIL import Image
 from PIL import ImageOps
-import json
+from functools import partial, wraps
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+import base64
+import hashlib
+import math
 import os
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
-from django.core.serializers.json import DjangoJSONEncoder
 from django.core.urlresolvers import reverse
 from django.db.models import get_model
 from django.db.models.query_utils import Q
-from django.http import HttpResponse, HttpResponseBadRequest
+from django.http import HttpResponse, HttpResponseBadRequest, \
+    HttpResponseNotModified, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import available_attrs
+from django.utils.http import parse_etags, quote_etag
 from django.views.generic.base import View
 
 from . import forms
-from .utils import thumbnail, copy_to_campaign, \
-    path_to_media_uri, create_copy_name
+from .cache import ALL_SCOPES, GLOBAL_SCOPE, cache_chunks, \
+    get_asset_cache, get_user_scope, get_versions, invalidate_assets, make_key
+from .encoding import dumps, format_value, iter_json
+from .pagination import KeysetPaginator
+from .search import get_search_backend
+from .thumbnails import get_preview_image, get_thumbnail_url
+from .transactions import atomic
+from .transformations import fail_stale_jobs, get_result, \
+    get_transformation_key, store_result, submit_job
+from .uploadhandler import HashingUploadViewMixin
+from .usersearch import get_user_representation, search_users
+from .utils import copy_to_campaign, path_to_media_uri, create_copy_name, \
+    draft_image, find_duplicates, reverse_pk
 
 Tag = get_model('asset_library', 'Tag')
+Asset = get_model('asset_library', 'Asset')
 ImageAsset = get_model('asset_library', 'ImageAsset')
 FileAsset = get_model('asset_library', 'FileAsset')
 SnippetAsset = get_model('asset_library', 'SnippetAsset')
@@ -30,6 +49,7 @@ def api_login_required(view_func):
 
     Instead of Django's standard login_required which 302 redirect to login
     page, return 401 - authentication required code """
+    @wraps(view_func, assigned=available_attrs(view_func))
     def _wrapped_view(request, *args, **kwargs):
         if request.user.is_authenticated():
             return view_func(request, *args, **kwargs)
@@ -38,23 +58,145 @@ def api_login_required(view_func):
     return _wrapped_view
 
 
+def format_errors(errors):
+    """ Convert form or model errors into JSON serializable dictionary """
+    return dict((field, [unicode(error) for error in field_errors])
+                for field, field_errors in errors.items())
+
+
 def JsonResponse(response, **kwargs):
-    """  Return JSON response """
-    json_dump = json.dumps(response, cls=DjangoJSONEncoder)
-    return HttpResponse(json_dump, mimetype="application/json", **kwargs)
+    """  Return JSON response, see encoding.py """
+    return HttpResponse(dumps(response), mimetype="application/json",
+                        **kwargs)
+
+
+def make_etag(*parts):
+    """ Return ETag identifying response by the parts """
+    data = u':'.join(unicode(part) for part in parts)
+    return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+
+def get_library_etag(request, *parts):
+    """ Return ETag of response made of global and user's assets
+
+    The ETag changes with versions of the library, see cache.py, which are
+    bumped when assets are created, changed, deleted or (re)tagged. None
+    without ASSET_CACHE keeping the versions. """
+    if settings.ASSET_CACHE is None:
+        return None
+    scopes = [ALL_SCOPES, GLOBAL_SCOPE, get_user_scope(request.user.pk)]
+    return make_etag(request.path, request.META.get('QUERY_STRING', ''),
+                     request.user.pk, *(get_versions(scopes) + list(parts)))
+
+
+class ConditionalGetMixin(object):
+    """ Answer GET by 304 Not Modified if client has the current response
+
+    Polling clients send ETag of the response they have in If-None-Match.
+    get_etag() finds out the current one without running queries of the
+    response. """
+
+    def get_etag(self, request, *args, **kwargs):
+        """ Return ETag of response, None when it is unknown """
+        return None
+
+    def dispatch(self, request, *args, **kwargs):
+        etag = None
+        if request.method in ('GET', 'HEAD'):
+            etag = self.get_etag(request, *args, **kwargs)
+        if etag is not None:
+            etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+            if etag in etags:
+                response = HttpResponseNotModified()
+                response['ETag'] = quote_etag(etag)
+                return response
+
+        dispatch = super(ConditionalGetMixin, self).dispatch
+        response = dispatch(request, *args, **kwargs)
+        if etag is not None and response.status_code == 200:
+            response['ETag'] = quote_etag(etag)
+        return response
 
 
-class Resource(View):
+class Resource(ConditionalGetMixin, View):
+    # Attributes of assets
     fields = None
+    # Values computed by compute_<field>(asset) methods
+    computed_fields = ()
+    # Model fields needed by fields which aren't model fields themselves
+    field_columns = {}
+    # Fields requested by client, None for all of them
+    selected_fields = None
+
+    def get_available_fields(self):
+        return list(self.fields) + list(self.computed_fields)
+
+    def select_fields(self, request):
+        """ Select fields listed by comma separated fields parameter
+
+        Clients needing only some of the fields, e.g. names of assets, don't
+        get the rest and the rest isn't fetched from the database. Primary
+        key is always included.
+
+        :returns: False if unknown fields are requested
+        """
+        requested = request.GET.get('fields', '')
+        names = set(name.strip() for name in requested.split(','))
+        names.discard('')
+        if not names:
+            self.selected_fields = None
+            return True
+        available = self.get_available_fields()
+        if names - set(available):
+            return False
+        names.add('id')
+        self.selected_fields = [field for field in available
+                                if field in names]
+        return True
+
+    def get_columns(self):
+        """ Return model fields needed by selected fields, None for all """
+        if self.selected_fields is None:
+            return None
+        columns = []
+        for field in self.selected_fields:
+            columns.extend(self.field_columns.get(field, [field]))
+        return columns
+
+    def restrict_columns(self, queryset):
+        """ Load only model fields needed by selected fields """
+        columns = self.get_columns()
+        if columns is None:
+            return queryset
+        return queryset.only(*columns)
 
     def serialize_asset(self, asset):
-        """ Serialize object to dictionary based on fields parameter """
-        return {field: getattr(asset, field) for field in self.fields}
+        """ Serialize object to dictionary of selected fields """
+        asset_dict = {}
+        for field in self.selected_fields or self.get_available_fields():
+            if field in self.computed_fields:
+                value = getattr(self, 'compute_' + field)(asset)
+            else:
+                value = getattr(asset, field)
+            asset_dict[field] = format_value(value)
+        return asset_dict
 
 
 class DetailResource(Resource):
+    def get_etag(self, request, pk):
+        """ Version of the asset is its modification time """
+        modified = self.model.objects.filter(pk=pk).values_list(
+            'date_modified', flat=True)
+        if not modified:
+            return None
+        return make_etag(request.path, request.META.get('QUERY_STRING', ''),
+                         modified[0].isoformat())
+
     def get(self, request, pk):
-        asset = get_object_or_404(self.model, pk=pk)
+        if not self.select_fields(request):
+            return HttpResponseBadRequest('Unknown fields')
+        queryset = self.restrict_columns(self.model.objects.all())
+        asset = get_object_or_404(queryset, pk=pk)
         return JsonResponse({'object': self.serialize_asset(asset)})
 
     def post(self, request, pk):
@@ -70,53 +212,124 @@ class DetailResource(Resource):
 
 
 class AssetListResource(Resource):
-    """ Provide listing feature """
+    """ Provide listing feature
+
+    Responses are cached under versions of the library, see cache.py.
+    Listings of global assets are the same for every user and are shared by
+    them unless the response depends on the user otherwise. """
     queryset = None
     form_class = forms.FilterAPIForm
     per_page = 20
     max_per_page = 100
+    share_global_responses = True
+
+    def get_etag(self, request):
+        return get_library_etag(request)
+
+    def get_per_page(self):
+        """ Return page size requested by client but at most max_per_page """
+        if self.form.cleaned_data['limit']:
+            return min(self.form.cleaned_data['limit'], self.max_per_page)
+        else:
+            return self.per_page
 
     def get_response_data(self, request):
         """ Construct data used for response
 
-        Fetch assets via get_queryset and use paginator on them """
+        Fetch assets via get_queryset and use paginator on them. Clients
+        passing cursor parameter (empty for the first page) opt in to keyset
+        pagination which skips counting the assets. """
         asset_list = self.form.get_queryset(request.user, self.queryset)
-
-        if self.form.cleaned_data['limit']:
-            per_page = min(self.form.cleaned_data['limit'], self.max_per_page)
+        asset_list = self.restrict_columns(asset_list)
+        per_page = self.get_per_page()
+
+        if 'cursor' in self.form.data:
+            key, descending = self.form.get_sort_key()
+            paginator = KeysetPaginator(asset_list, per_page, key, descending)
+            assets = paginator.page(self.form.cleaned_data['cursor'])
+            meta = {
+                'limit': per_page,
+                'next': assets.next_cursor,
+                'prev': assets.prev_cursor,
+            }
         else:
-            per_page = self.per_page
-
-        paginator = Paginator(asset_list, per_page)
-        page = self.form.cleaned_data['page']
-        try:
-            assets = paginator.page(page)
-        except PageNotAnInteger:
-            page = 1
-            assets = paginator.page(page)
-        except EmptyPage:
-            assets = []
-
-        response = {'objects': [], 'meta': {}}
-        response['objects'] = [self.serialize_asset(asset) for asset in assets]
-        response['meta'] = {
-            'page': page,
-            'limit': per_page,
-            'num_pages': paginator.num_pages,
-        }
-        return response
+            paginator = Paginator(asset_list, per_page)
+            page = self.form.cleaned_data['page']
+            try:
+                assets = paginator.page(page)
+            except PageNotAnInteger:
+                page = 1
+                assets = paginator.page(page)
+            except EmptyPage:
+                assets = []
+            meta = {
+                'page': page,
+                'limit': per_page,
+                'num_pages': paginator.num_pages,
+            }
+
+        # Serialised while the response is written, see get()
+        objects = (self.serialize_asset(asset) for asset in assets)
+        return {'objects': objects, 'meta': meta}
+
+    def get_columns(self):
+        """ Load also the sort key used by keyset pagination """
+        columns = super(AssetListResource, self).get_columns()
+        key, descending = self.form.get_sort_key()
+        if columns is not None and key == 'date_created':
+            columns.append(key)
+        return columns
+
+    def get_cache_key(self, request):
+        """ Return key of cached response, None if it isn't cached
+
+        The key is made of normalised parameters of the listing. """
+        if settings.ASSET_CACHE is None or \
+                settings.ASSET_API_CACHE_TIMEOUT is None:
+            return None
+        data = self.form.cleaned_data
+        scopes = [ALL_SCOPES, GLOBAL_SCOPE]
+        user_pk = None
+        if data['source'] != self.form.GLOBAL_ASSETS or \
+                not self.share_global_responses:
+            scopes.append(get_user_scope(request.user.pk))
+            user_pk = request.user.pk
+        params = sorted((name, getattr(value, 'pk', value))
+                        for name, value in data.items())
+        # Empty cursor switches to keyset pagination
+        params.append(('keyset', 'cursor' in self.form.data))
+        params.append(('fields', self.selected_fields))
+        return make_key('api', scopes, request.path, user_pk,
+                        make_etag(params))
 
     def get(self, request):
         self.form = self.form_class(request.GET)
-        if not self.form.is_valid():
+        if not self.form.is_valid() or not self.select_fields(request):
             return HttpResponseBadRequest('Invalid parameters')
-        response = self.get_response_data(request)
-        return JsonResponse(response)
 
+        cache = get_asset_cache()
+        cache_key = self.get_cache_key(request)
+        if cache_key is not None:
+            content = cache.get(cache_key)
+            if content is not None:
+                return HttpResponse(content, mimetype='application/json')
+
+        chunks = iter_json(self.get_response_data(request))
+        if cache_key is not None:
+            chunks = cache_chunks(chunks, cache_key,
+                                  settings.ASSET_API_CACHE_TIMEOUT)
+        if self.get_per_page() >= settings.ASSET_API_STREAMING_PAGE_SIZE:
+            return StreamingHttpResponse(chunks, mimetype='application/json')
+        return HttpResponse(''.join(chunks), mimetype='application/json')
 
-class FileBasedAsset(object):
+
+class FileBasedAsset(HashingUploadViewMixin):
     form_class = forms.FileFilterAPIForm
+    # Extensions in meta are the ones of global and user's assets
+    share_global_responses = False
     upload_form_class = None
+    # Validates a single file of batch upload
+    file_form_class = None
 
     def get_response_data(self, request):
         response = super(FileBasedAsset, self).get_response_data(request)
@@ -125,7 +338,10 @@ class FileBasedAsset(object):
         return response
 
     def post(self, request):
-        """ Upload a new file """
+        """ Upload a new file, or several files sent as 'files' """
+        if 'files' in request.FILES:
+            return self.post_batch(request)
+
         form = self.upload_form_class(request.POST, files=request.FILES)
         if not form.is_valid():
             return HttpResponseBadRequest(
@@ -149,12 +365,101 @@ class FileBasedAsset(object):
         return JsonResponse({
             'object': asset_object,
             'campaign_copy': absolute_campaign_copy,
+            # Assets of the user with the same contents
+            'duplicates': list(
+                find_duplicates(asset).values_list('pk', flat=True)),
         })
 
+    def validate_upload(self, creator, uploaded_file):
+        """ Return unsaved asset for the uploaded file or form errors
+
+        Batch upload calls it from threads, it must not touch the database.
+        """
+        form = self.file_form_class(files={'file': uploaded_file})
+        if not form.is_valid():
+            return None, format_errors(form.errors)
+        asset = self.create_asset(creator, form.cleaned_data['file'])
+        asset.populate_fields()
+        return asset, None
+
+    def post_batch(self, request):
+        """ Upload several files at once
+
+        Files are validated in parallel, valid ones are stored in a single
+        transaction and tagged by one query. Campaign copies are made once
+        the transaction succeeds, files of rolled back assets aren't left
+        in campaigns. The response has a result for every file in order of
+        upload, either the asset or errors. """
+        form = forms.BatchUploadAPIForm(request.POST)
+        if not form.is_valid():
+            return HttpResponseBadRequest(
+                'Malformed request\n%s' % form.errors)
+
+        uploaded_files = request.FILES.getlist('files')
+        pool = ThreadPool(settings.ASSET_UPLOAD_WORKERS)
+        try:
+            validated = zip(uploaded_files, pool.map(
+                partial(self.validate_upload, request.user), uploaded_files))
+        finally:
+            # Stop the threads of the pool, nothing else would
+            pool.close()
+            pool.join()
+
+        results = []
+        assets = []
+        with atomic():
+            for uploaded_file, (asset, errors) in validated:
+                if asset is not None:
+                    try:
+                        asset.full_clean()
+                    except ValidationError, e:
+                        asset, errors = None, format_errors(e.message_dict)
+                if asset is None:
+                    results.append({
+                        'name': uploaded_file.name,
+                        'errors': errors,
+                    })
+                    continue
+
+                asset.save()
+                assets.append(asset)
+                results.append({
+                    'name': uploaded_file.name,
+                    'object': self.serialize_asset(asset),
+                    'asset': asset,
+                })
+
+            tags = Tag.objects.get_or_create_many(form.cleaned_data['tags'])
+            AssetTag = Asset.tags.through
+            AssetTag.objects.bulk_create([
+                AssetTag(asset_id=tagged.pk, tag_id=tag.pk)
+                for tagged in assets for tag in tags
+            ])
+            if tags:
+                get_search_backend().reindex(
+                    tagged.pk for tagged in assets)
+                invalidate_assets(assets)
+
+        destination = form.cleaned_data['destination']
+        for result in results:
+            asset = result.pop('asset', None)
+            if asset is None:
+                continue
+            campaign_copy = copy_to_campaign(asset.path, destination)
+            result['campaign_copy'] = request.build_absolute_uri(
+                campaign_copy)
+            # Assets of the user with the same contents
+            result['duplicates'] = list(
+                find_duplicates(asset).values_list('pk', flat=True))
+        return JsonResponse({'results': results})
+
 
-class TagResource(View):
+class TagResource(ConditionalGetMixin, View):
     """ Provide list of tags used in the system """
 
+    def get_etag(self, request):
+        return get_library_etag(request)
+
     def get(self, request):
         user = request.user
         global_or_users = Q(assets__creator=user) | Q(assets__is_global=True)
@@ -169,80 +474,51 @@ class UserResource(View):
     LIMIT_RESULTS = 10
 
     def get_user_representation(self, user):
-        name = '%s %s' % (user.first_name, user.last_name)
-        if name.strip():
-            return "%s (%s)" % (name, user.email)
-        else:
-            return user.email
-
-    def _is_matched_user(self, user, search):
-        """ Does user match the search query? """
-        return search.lower() in self.get_user_representation(user).lower()
+        return get_user_representation(user)
 
-    def search(self, search):
+    def search(self, search, exclude=None):
         """ Search for people who are on the site
 
-        Simple search in username, first_name, and last_name is not enough;
-        when searching for "John Lu" won't find me "John Luke". Doing
-        the search in a plain SQL command using concatenate would be easy, but
-        it is DB specific.
-
-        There is a nice workaround: Search by the first word of the search
-        query. It filters down the list of potential users to a smaller amount.
-        Run proper search on the set in Python.
-
-        User set shouldn't be humongous and there is no need for special
-        systems like Solr.
+        Every word of the query has to be in "First Last (email)" of the user,
+        e.g. "John Lu" finds "John Luke". The lookup is done by the index of
+        users, see usersearch.py.
 
-        :param user: User doing the search
         :param search: Search query
+        :param exclude: User left out from results
         :return: List of users satisfing the search query
         """
-        users = User.objects.all()
-        if search:
-            first_word = search.split()[0]
-            users = users.filter(
-                Q(username__icontains=first_word) |
-                Q(first_name__icontains=first_word) |
-                Q(last_name__icontains=first_word))
-
-            # Do python filtering
-            users = [
-                user for user in users
-                if self._is_matched_user(user, search)
-            ]
-
-        return users[:self.LIMIT_RESULTS]
+        return search_users(search, self.LIMIT_RESULTS, exclude)
 
     def serialize(self, user):
         """ Return either full name or username """
         return {'id': user.id, 'name': self.get_user_representation(user)}
 
     def get(self, request):
-        users = self.search(request.GET.get('search', ''))
+        users = self.search(request.GET.get('search', ''), request.user)
         return JsonResponse({
-            'objects': sorted([
-                self.serialize(user) for user in users
-                if user.pk != request.user.pk
-            ]),
+            'objects': sorted(self.serialize(user) for user in users),
         })
 
 
 class ImageListResource(FileBasedAsset, AssetListResource):
     queryset = ImageAsset.objects.all()
     upload_form_class = forms.UploadImageAPIForm
+    file_form_class = forms.UploadImageForm
     fields = (
         'id', 'name', 'description', 'height', 'width', 'size',
         'date_created', 'date_modified')
+    computed_fields = ('thumbnail', 'select_url')
+    field_columns = {
+        'thumbnail': ('thumbnail_url', 'image'),
+        'select_url': (),
+    }
 
-    def serialize_asset(self, image):
-        """ Create thumbnail """
-        asset_dict = super(ImageListResource, self).serialize_asset(image)
-        size = settings.ASSET_IMAGE_THUMBNAIL_SIZE
-        asset_dict['thumbnail'] = thumbnail(image.image.name, size).url
-        asset_dict['select_url'] = reverse('asset_library:image_api_detail',
-                                           args=[image.pk])
-        return asset_dict
+    def compute_thumbnail(self, image):
+        """ Thumbnail, or placeholder if it is not generated yet """
+        return get_thumbnail_url(image)
+
+    def compute_select_url(self, image):
+        return reverse_pk('asset_library:image_api_detail', image.pk)
 
     def create_asset(self, creator, uploaded_file):
         return ImageAsset(
@@ -252,18 +528,24 @@ class ImageListResource(FileBasedAsset, AssetListResource):
 class FileListResource(FileBasedAsset, AssetListResource):
     queryset = FileAsset.objects.all()
     upload_form_class = forms.UploadFileAPIForm
+    file_form_class = forms.UploadFileForm
     fields = (
         'id', 'name', 'description', 'thumbnail_url', 'extension', 'size',
         'date_created', 'date_modified')
-
-    def serialize_asset(self, file_asset):
-        """ Add name of file without its path,
+    computed_fields = ('filename', 'select_url')
+    field_columns = {
+        'thumbnail_url': ('extension',),
+        'filename': ('file',),
+        'select_url': (),
+    }
+
+    def compute_filename(self, file_asset):
+        """ Name of file without its path,
         e.g. /media/file.txt becomes file.txt """
-        asset_dict = super(FileListResource, self).serialize_asset(file_asset)
-        asset_dict['filename'] = os.path.basename(file_asset.file.name)
-        asset_dict['select_url'] = reverse('asset_library:file_api_detail',
-                                           args=[file_asset.pk])
-        return asset_dict
+        return os.path.basename(file_asset.file.name)
+
+    def compute_select_url(self, file_asset):
+        return reverse_pk('asset_library:file_api_detail', file_asset.pk)
 
     def create_asset(self, creator, uploaded_file):
         return FileAsset(
@@ -275,14 +557,13 @@ class SnippetListResource(AssetListResource):
     fields = (
         'id', 'name', 'description', 'contents', 'date_created',
         'date_modified')
+    computed_fields = ('length',)
+    field_columns = {
+        'length': ('contents',),
+    }
 
-    def serialize_asset(self, snippet_asset):
-        """ Add name of file without its path,
-        e.g. /media/file.txt becomes file.txt """
-        asset_dict = super(SnippetListResource, self).serialize_asset(
-            snippet_asset)
-        asset_dict['length'] = len(asset_dict['contents'])
-        return asset_dict
+    def compute_length(self, snippet_asset):
+        return len(snippet_asset.contents)
 
 
 class ImageDetailResource(DetailResource):
@@ -290,6 +571,9 @@ class ImageDetailResource(DetailResource):
     fields = (
         'id', 'name', 'description', 'url', 'height', 'width', 'size',
         'date_created', 'date_modified')
+    field_columns = {
+        'url': ('image',),
+    }
 
 
 class FileDetailResource(DetailResource):
@@ -297,6 +581,34 @@ class FileDetailResource(DetailResource):
     fields = (
         'id', 'name', 'description', 'url', 'size', 'date_created',
         'date_modified')
+    field_columns = {
+        'url': ('file',),
+    }
+
+
+def serialize_image(request, path, width, height):
+    """ Describe image written by the image editor """
+    return {
+        'src': request.build_absolute_uri(path_to_media_uri(path)),
+        'width': width,
+        'height': height,
+    }
+
+
+def serialize_job(request, job):
+    """ Describe TransformationJob, with the image once it is done """
+    data = {
+        'id': job.pk,
+        'status': job.status,
+        'progress': job.progress,
+        'url': request.build_absolute_uri(reverse(
+            'asset_library:image-editor-job', kwargs={'pk': job.pk})),
+    }
+    if job.status == job.DONE:
+        data.update(serialize_image(request, job.path, job.width, job.height))
+    elif job.status == job.FAILED:
+        data['error'] = job.error
+    return data
 
 
 class ImageEditor(View):
@@ -304,22 +616,168 @@ class ImageEditor(View):
     - crop
     - grayscale
     - rotate
+    - resize
+    - fit
+
+    Chained filters are sent as operations, see ImageEditorAPIForm. The
+    image is decoded once, the filters are applied in memory and the result
+    is encoded once.
+
+    Previews apply the filters to a small proxy of the image and return the
+    result without writing it. Only applying the edit renders the image in
+    full resolution.
      """
     def crop(self, image, x1, y1, x2, y2):
-        """ Crop an image """
-        return image.crop((x1, y1, x2, y2))
+        """ Crop an image, the box is clamped to the image """
+        return image.crop(self.clamp_box(image.size, x1, y1, x2, y2))
+
+    def clamp_box(self, size, x1, y1, x2, y2):
+        """ Return crop box within an image of size, at least a pixel """
+        width, height = size
+        x1, y1 = min(x1, width - 1), min(y1, height - 1)
+        x2, y2 = max(x1 + 1, min(x2, width)), max(y1 + 1, min(y2, height))
+        return x1, y1, x2, y2
 
     def rotate(self, image, angle):
-        """ Rotate an image """
-        return image.rotate(-angle)
+        """ Rotate an image clockwise, the result is as large as the rotated
+        image, see get_scale() """
+        # Transposing is lossless and as fast as copying
+        transposes = {
+            90: Image.ROTATE_270,
+            180: Image.ROTATE_180,
+            270: Image.ROTATE_90,
+        }
+        if angle in transposes:
+            return image.transpose(transposes[angle])
+        return image.rotate(-angle, expand=True)
 
     def grayscale(self, image):
-        """ Grayscale an image """
-        if image.format == 'PNG':
+        """ Grayscale an image, keep transparency """
+        if 'A' in image.getbands():
             return image.convert('LA')
         else:
             return ImageOps.grayscale(image)
 
+    def resize(self, image, width, height):
+        """ Resize an image, keep aspect ratio if only one size is given """
+        original_width, original_height = image.size
+        if width is None:
+            width = max(1, original_width * height // original_height)
+        elif height is None:
+            height = max(1, original_height * width // original_width)
+        return image.resize((width, height), Image.ANTIALIAS)
+
+    def fit(self, image, width, height):
+        """ Resize and crop an image to fill exactly width x height """
+        return ImageOps.fit(image, (width, height), Image.ANTIALIAS)
+
+    def get_scale(self, size, operations):
+        """ Return how much smaller the image can be decoded
+
+        Operations before the first resize or fit work the same way on a
+        smaller image if their coordinates are scaled. The resize needs the
+        image only as large as the result.
+
+        :returns: factor, 1 when the full resolution is needed
+        """
+        width, height = map(float, size)
+        for name, arguments in operations:
+            if name == 'crop':
+                x1, y1, x2, y2 = self.clamp_box(
+                    (width, height), **arguments)
+                width, height = x2 - x1, y2 - y1
+            elif name == 'rotate' and arguments['angle'] in (90, 270):
+                width, height = height, width
+            elif name in ('resize', 'fit'):
+                if not width or not height:
+                    return 1.0
+                ratios = [float(target) / current for target, current in (
+                    (arguments['width'], width), (arguments['height'], height))
+                    if target is not None]
+                return min(1.0, max(ratios))
+        return 1.0
+
+    def draft(self, image, operations):
+        """ Decode large JPEG image at reduced resolution if possible
+
+        :returns: operations with coordinates scaled to the decoded image
+        """
+        width, height = image.size
+        scale = self.get_scale(image.size, operations)
+        x_scale, y_scale = draft_image(image, (width * scale, height * scale))
+        if (x_scale, y_scale) == (1.0, 1.0):
+            return operations
+        return self.scale_operations(operations, x_scale, y_scale)
+
+    def scale_operations(self, operations, x_scale, y_scale, sizes=False):
+        """ Scale coordinates of operations to an image of another size
+
+        :param sizes: scale also sizes of resize and fit, otherwise the
+                      operations after the first of them are kept as they are
+        """
+        scaled = []
+        for i, (name, arguments) in enumerate(operations):
+            if name in ('resize', 'fit'):
+                if not sizes:
+                    # The rest works with the resized image
+                    return scaled + operations[i:]
+                arguments = {
+                    'width': arguments['width'] and
+                    max(1, int(round(arguments['width'] * x_scale))),
+                    'height': arguments['height'] and
+                    max(1, int(round(arguments['height'] * y_scale))),
+                }
+            elif name == 'crop':
+                arguments = {
+                    'x1': int(arguments['x1'] * x_scale),
+                    'y1': int(arguments['y1'] * y_scale),
+                    'x2': int(math.ceil(arguments['x2'] * x_scale)),
+                    'y2': int(math.ceil(arguments['y2'] * y_scale)),
+                }
+            scaled.append((name, arguments))
+        return scaled
+
+    def apply(self, image, operations, progress=None):
+        """ Apply operations to an image
+
+        :param progress: called with number of applied operations
+        """
+        for applied, (name, arguments) in enumerate(operations, 1):
+            image = getattr(self, name)(image, **arguments)
+            if progress is not None:
+                progress(applied)
+        return image
+
+    def preview(self, path, operations, quality=None):
+        """ Apply operations to a cached proxy of the image
+
+        Nothing is written, the result is returned as data URI.
+        """
+        image, format, scale = get_preview_image(path)
+        image = self.apply(
+            image, self.scale_operations(operations, scale, scale, True))
+        output = BytesIO()
+        self.save(image, output, format, quality)
+        src = 'data:%s;base64,%s' % (
+            Image.MIME.get(format, 'application/octet-stream'),
+            base64.b64encode(output.getvalue()))
+        width, height = image.size
+        return JsonResponse({
+            'src': src,
+            'width': width,
+            'height': height,
+            'preview': True,
+        })
+
+    def save(self, image, path, format, quality=None, progressive=False):
+        """ Encode an image, options are used by JPEG """
+        options = {}
+        if quality:
+            options['quality'] = quality
+        if progressive:
+            options['progressive'] = True
+        image.save(path, format, **options)
+
     def post(self, request):
         form = forms.ImageEditorAPIForm(request.POST)
         if not form.is_valid():
@@ -327,25 +785,64 @@ class ImageEditor(View):
                 'Malformed request\n%s' % form.errors)
 
         path = form.cleaned_data['src']
+        if form.cleaned_data['preview']:
+            return self.preview(path, form.cleaned_data['operations'],
+                                form.cleaned_data['quality'])
+
+        arguments = (path, form.cleaned_data['operations'],
+                     form.cleaned_data['quality'],
+                     form.cleaned_data['progressive'])
+        if form.cleaned_data['background']:
+            return self.submit(request, *arguments)
+        return JsonResponse(
+            serialize_image(request, *self.render(*arguments)))
+
+    def render(self, path, operations, quality=None, progressive=False,
+               progress=None):
+        """ Write edited image, identical edits reuse the image written
+        before, see transformations.py
+
+        :param progress: called with number of applied operations
+        :returns: (path, width, height) of the written image
+        """
+        key = None
+        if settings.ASSET_TRANSFORMATION_CACHE_SIZE:
+            key = get_transformation_key(path, operations, quality,
+                                         progressive)
+            result = get_result(key)
+            if result is not None:
+                return result.path, result.width, result.height
+
         image = Image.open(path)
-        if form.cleaned_data['transformation'] == form.CROP:
-            x1, y1 = form.cleaned_data['x1'], form.cleaned_data['y1']
-            x2, y2 = form.cleaned_data['x2'], form.cleaned_data['y2']
-            image = self.crop(image, x1, y1, x2, y2)
-        elif form.cleaned_data['transformation'] == form.ROTATE:
-            angle = form.cleaned_data['angle']
-            image = self.rotate(image, angle)
-        elif form.cleaned_data['transformation'] == form.GRAYSCALE:
-            image = self.grayscale(image)
-        else:
-            return HttpResponseBadRequest('Unknown transformation')
+        # Edited images have no format
+        format = image.format
+        image = self.apply(image, self.draft(image, operations), progress)
 
         result = create_copy_name(path)
-        image.save(result, image.format)
-        src = path_to_media_uri(result)
+        self.save(image, result, format, quality, progressive)
         width, height = image.size
-        return JsonResponse({
-            'src': request.build_absolute_uri(src),
-            'width': width,
-            'height': height,
-        })
+        if key is not None:
+            # Result of a concurrent identical edit wins
+            return store_result(key, result, width, height)
+        return result, width, height
+
+    def submit(self, request, *arguments):
+        """ Render the image by a worker thread, see ImageEditorJob """
+        job = submit_job(request.user, self.render, *arguments)
+        if job is None:
+            response = HttpResponse('Too many images are being edited',
+                                    status=429)
+            response['Retry-After'] = 1
+            return response
+        return JsonResponse(serialize_job(request, job), status=202)
+
+
+class ImageEditorJob(View):
+    """ Status of an image edited by a worker thread, see ImageEditor """
+
+    def get(self, request, pk):
+        TransformationJob = get_model('asset_library', 'TransformationJob')
+        jobs = TransformationJob.objects.filter(pk=pk, creator=request.user)
+        fail_stale_jobs(jobs)
+        job = get_object_or_404(jobs)
+        return JsonResponse(serialize_job(request, job))
@@ -13,6 +13,7 @@ class AssetLibraryApplication(object):
     # Common list for all assets
     library_list = views.AssetListView
     library_upload = views.AssetUploadFileView
+    library_share = views.AssetBulkShareView
     library_accept = views.AssetAcceptView
     library_reject = views.AssetRejectView
 
@@ -46,6 +47,7 @@ class AssetLibraryApplication(object):
     file_list_resource = api.FileListResource
     file_detail_resource = api.FileDetailResource
     image_editor = api.ImageEditor
+    image_editor_job = api.ImageEditorJob
 
     def __init__(self, app_name=None, **kwargs):
         self.app_name = app_name
@@ -64,6 +66,8 @@ class AssetLibraryApplication(object):
                 self.image_detail_resource.as_view(), name='image_api_detail'),
             url(r'^images/transformations/$',
                 self.image_editor.as_view(), name='image-editor'),
+            url(r'^images/transformations/(?P<pk>[0-9a-f]{32})/$',
+                self.image_editor_job.as_view(), name='image-editor-job'),
             url(r'^files/$', self.file_list_resource.as_view()),
             url(r'^files/(?P<pk>\d+)/$',
                 self.file_detail_resource.as_view(), name='file_api_detail'),
@@ -135,6 +139,8 @@ class AssetLibraryApplication(object):
         # Allow modularity for assets
         urls = patterns(
             '', url(r'^$', self.library_list.as_view(), name='library_list'),
+            url(r'^share/$', self.library_share.as_view(),
+                name='library_share'),
         )
         if settings.ASSET_IMAGES or settings.ASSET_FILES:
             urls += patterns(
@@ -0,0 +1,199 @@
+"""
+Caches
+
+Versioned cache: cached values are stored under keys containing versions of
+the data they were computed from. Changing the data bumps its version instead
+of finding and deleting every key computed from it, stale values are never
+read again and expire. A missing version, e.g. evicted one, starts from the
+current time so it never repeats a version used before.
+
+Versions of the library are kept per scope of assets: 'global' for global
+assets and 'user:<pk>' for assets of the user, 'all' covers every scope.
+Receivers in receivers.py bump them when assets or their tags change, bulk
+inserts and updates send no signals and call invalidate_assets() instead.
+
+Versions changed inside a transaction are bumped again once it commits, see
+transactions.py. Otherwise a request running before the commit would cache
+the old rows under the new versions. Transaction of the request
+(ATOMIC_REQUESTS) commits before the response is finished, when the second
+bump happens, so the old rows may be served until then but not cached
+beyond it. Transactions opened by django.db.transaction.atomic() outside
+requests aren't visible and get no second bump.
+
+Versions live in the cache of ASSET_CACHE. Every process has to see the
+bumps of the others, so it has to be a cache shared by all of them, e.g.
+memcached. A process with its own cache, e.g. local memory cache of several
+web workers, would serve stale listings and answer 304 Not Modified until it
+changes the assets itself. Without ASSET_CACHE nothing is cached and no
+ETags are sent.
+
+LRUCache keeps values in memory of the process, e.g. ones computed from
+files which don't change while the process runs.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db import transaction
+
+from .transactions import after_commit
+
+VERSION_KEY = 'asset_library:version:%s'
+
+
+_local = threading.local()
+
+ALL_SCOPES = 'all'
+GLOBAL_SCOPE = 'global'
+
+
+def get_asset_cache():
+    """ Return cache configured by ASSET_CACHE, None if there is none """
+    if settings.ASSET_CACHE is None:
+        return None
+    return get_cache(settings.ASSET_CACHE)
+
+
+def get_versions(names):
+    """ Return list of current versions of names """
+    cache = get_asset_cache()
+    keys = [VERSION_KEY % name for name in names]
+    versions = cache.get_many(keys)
+    missing = dict((key, int(time.time() * 1000)) for key in keys
+                   if key not in versions)
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(names):
+    """ Invalidate values computed from names, again once the transaction
+    commits """
+    if settings.ASSET_CACHE is None:
+        return
+    names = set(names)
+    _bump_versions(names)
+    if not transaction.get_autocommit():
+        # One bump after commit for all changes of the transaction
+        if not hasattr(_local, 'committed_names'):
+            _local.committed_names = set()
+        _local.committed_names.update(names)
+        after_commit(_bump_committed_versions)
+
+
+def _bump_committed_versions():
+    _bump_versions(_local.committed_names)
+    _local.committed_names = set()
+
+
+def _bump_versions(names):
+    cache = get_asset_cache()
+    for name in set(names):
+        key = VERSION_KEY % name
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Not cached, the next get_versions() starts a new one
+            pass
+
+
+def make_key(prefix, names, *parts):
+    """ Return cache key of value computed from names and parts """
+    versions = get_versions(names)
+    return ':'.join(['asset_library', prefix] +
+                    ['%s.%s' % pair for pair in zip(names, versions)] +
+                    [unicode(part) for part in parts])
+
+
+def cache_chunks(chunks, key, timeout):
+    """ Yield chunks, cache them joined once all of them were yielded """
+    cached = []
+    for chunk in chunks:
+        cached.append(chunk)
+        yield chunk
+    get_asset_cache().set(key, ''.join(cached), timeout)
+
+
+def get_user_scope(user_pk):
+    return 'user:%s' % user_pk
+
+
+def get_asset_scopes(is_global, creator_pk):
+    """ Return scopes of asset listed with the given details """
+    if is_global:
+        return [GLOBAL_SCOPE]
+    return [get_user_scope(creator_pk)]
+
+
+def get_listing_scopes(source, user):
+    """ Return scopes of listing of the source, None if not versioned
+
+    Sources are the ones of FilterAssetsForm and FilterAPIForm, listings
+    depend also on ALL_SCOPES.
+    """
+    user_scope = get_user_scope(user.pk)
+    if not source:
+        return [GLOBAL_SCOPE, user_scope]
+    elif source == 'inbox':
+        if settings.ASSET_SHARING_MODE == 'reference':
+            # Made of assets of other users
+            return None
+        return [user_scope]
+    elif source == 'personal':
+        return [user_scope]
+    return [GLOBAL_SCOPE]
+
+
+def invalidate_assets(assets=None):
+    """ Bump versions of listings containing the assets
+
+    :param assets: list of assets, or None for all listings
+    """
+    if assets is None:
+        bump_versions([ALL_SCOPES])
+        return
+    scopes = []
+    for asset in assets:
+        scopes += get_asset_scopes(asset.is_global, asset.creator_id)
+    bump_versions(scopes)
+
+
+class LRUCache(object):
+    """ At most maxsize recently used values, expiring after ttl seconds """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            try:
+                value, expires = self.items.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires < time.time():
+                return default
+            # Move to the end, the most recently used
+            self.items[key] = (value, expires)
+            return value
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else None
+        with self.lock:
+            self.items.pop(key, None)
+            while self.items and len(self.items) >= self.maxsize:
+                self.items.popitem(last=False)
+            self.items[key] = (value, expires)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
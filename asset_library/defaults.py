@@ -6,13 +6,73 @@ ASSET_IMAGES = True
 ASSET_SNIPPETS = True
 ASSET_FILES = True
 
+# Storage for images and files, e.g.
+# 'asset_library.storage.ContentAddressedStorage'. None for default storage
+ASSET_STORAGE = None
+# Put assets into campaigns as hardlinks ('link') or copies ('copy')
+ASSET_CAMPAIGN_COPY_METHOD = 'link'
+# Share assets as deep copies ('copy') or as references copied once accepted
+# ('reference')
+ASSET_SHARING_MODE = 'copy'
+
+# Backend searching assets, see search.py
+ASSET_SEARCH_BACKEND = 'asset_library.search.SubstringSearchBackend'
+
+# Cache of tag facets, API responses and ETags, see cache.py. It has to be
+# shared by all processes of the site, e.g. memcached, not the local memory
+# cache of a process. None not to cache them and to send no ETags
+ASSET_CACHE = None
+# Seconds tag facets of a listing are cached
+ASSET_TAG_FACETS_TIMEOUT = 60 * 60 * 24
+# Seconds API listings are cached, None not to cache them
+ASSET_API_CACHE_TIMEOUT = 60 * 60
+# Function dumping JSON of API responses, e.g. 'ujson.dumps', None for ujson
+# if installed or json, see encoding.py
+ASSET_JSON_DUMPS = None
+# Listing pages of at least this many assets are streamed
+ASSET_API_STREAMING_PAGE_SIZE = 50
+
 ASSET_IMAGE_THUMBNAIL_SIZE = '150x150'
 ASSET_IMAGE_EXTENSIONS = [
     'BMP', 'GIF', 'IM', 'JPEG', 'JPG', 'MSP', 'PCX', 'PNG',
     'PPM', 'SPIDER', 'TIF', 'TIFF', 'XBM',
 ]
 
+# Largest width or height of images resized by the image editor
+ASSET_IMAGE_EDITOR_MAX_SIZE = 5000
+# Largest width or height of proxies previewing edits and how many proxies
+# are kept in memory, see thumbnails.py
+ASSET_IMAGE_EDITOR_PREVIEW_SIZE = 800
+ASSET_IMAGE_EDITOR_PREVIEW_CACHE_SIZE = 10
+# Number of images written by the image editor that are reused by identical
+# edits, 0 to disable, see transformations.py
+ASSET_TRANSFORMATION_CACHE_SIZE = 1000
+# Number of threads rendering edits requested with background, 0 to render
+# them in the request, and number of edits waiting for them before the API
+# answers 429 Too Many Requests, see transformations.py
+ASSET_IMAGE_EDITOR_WORKERS = 2
+ASSET_IMAGE_EDITOR_QUEUE_SIZE = 20
+# Seconds after which unfinished edits are reported as failed
+ASSET_IMAGE_EDITOR_JOB_TIMEOUT = 60 * 10
+
+# Other thumbnail geometries generated ahead of time
+ASSET_IMAGE_THUMBNAIL_SIZES = []
+ASSET_IMAGE_THUMBNAIL_PLACEHOLDER = \
+    'asset_library/images/thumbnail_placeholder.png'
+# Generate thumbnails on save ('sync'), by background processes ('pool') or by
+# generate_asset_thumbnails command ('queue'), see thumbnails.py
+ASSET_THUMBNAIL_MODE = 'sync'
+# Number of worker processes, None for number of CPUs
+ASSET_THUMBNAIL_WORKERS = None
+
+# Number of threads validating files of batch upload
+ASSET_UPLOAD_WORKERS = 4
+
 ASSET_FILE_THUMBNAILS_PATH = 'asset_library/file_icons/'
+# Number of icon URLs of file extensions kept in memory and for how many
+# seconds, see thumbnails.py
+ASSET_FILE_ICON_CACHE_SIZE = 100
+ASSET_FILE_ICON_CACHE_TIMEOUT = 60 * 60
 ASSET_FILE_EXTENSIONS = [
     'DOC', 'RTF', 'PDF', 'CSV', 'XLS', 'ZIP', 'EPS', 'JPEG',
 ]
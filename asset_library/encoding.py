@@ -0,0 +1,89 @@
+"""
+JSON encoding of API responses
+
+Values of rows are formatted by format_value() while they are serialised, so
+the payload is made of plain types and any encoder can dump it without
+calling back for datetimes. ASSET_JSON_DUMPS picks the encoder, by default
+ujson when it is installed and json otherwise. Anything the encoder refuses
+is dumped by json with DjangoJSONEncoder.
+
+iter_json() yields a listing object by object so that large listings are
+streamed instead of built as one string.
+"""
+
+import datetime
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.importlib import import_module
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# (ASSET_JSON_DUMPS, function)
+_dumps = None
+
+
+def format_datetime(value):
+    """ Format datetime the same way as DjangoJSONEncoder """
+    formatted = value.isoformat()
+    if value.microsecond:
+        formatted = formatted[:23] + formatted[26:]
+    if formatted.endswith('+00:00'):
+        formatted = formatted[:-6] + 'Z'
+    return formatted
+
+
+def format_value(value):
+    """ Return value of a serialised row ready for any JSON encoder """
+    if isinstance(value, datetime.datetime):
+        return format_datetime(value)
+    elif isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def django_dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder)
+
+
+def get_dumps():
+    """ Return function configured by ASSET_JSON_DUMPS """
+    global _dumps
+    path = settings.ASSET_JSON_DUMPS
+    if _dumps is None or _dumps[0] != path:
+        if path is not None:
+            module_name, function_name = path.rsplit('.', 1)
+            function = getattr(import_module(module_name), function_name)
+        elif ujson is not None:
+            function = ujson.dumps
+        else:
+            function = django_dumps
+        _dumps = (path, function)
+    return _dumps[1]
+
+
+def dumps(data):
+    """ Return JSON of data """
+    try:
+        return get_dumps()(data)
+    except (TypeError, ValueError, OverflowError):
+        # Values the encoder doesn't know
+        return django_dumps(data)
+
+
+def iter_json(data, key='objects'):
+    """ Yield JSON of data in chunks, one for every item of data[key]
+
+    :param data: dictionary, data[key] may be any iterable, e.g. generator
+    """
+    rest = dict(data)
+    items = rest.pop(key)
+    head = dumps(rest)[:-1].rstrip()
+    yield '%s%s%s: [' % (head, ', ' if rest else '', dumps(key))
+    for i, item in enumerate(items):
+        yield (', ' if i else '') + dumps(item)
+    yield ']}'
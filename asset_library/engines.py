@@ -0,0 +1,31 @@
+"""
+Thumbnail engine for sorl-thumbnail decoding large JPEG images at reduced
+resolution, see utils.draft_image(). Enable it in settings by
+
+    THUMBNAIL_ENGINE = 'asset_library.engines.DraftEngine'
+"""
+
+from sorl.thumbnail.engines.pil_engine import Engine as PILEngine
+
+from .utils import draft_image
+
+
+class DraftEngine(PILEngine):
+
+    def create(self, image, geometry, options):
+        self.draft(image, geometry, options)
+        return super(DraftEngine, self).create(image, geometry, options)
+
+    def draft(self, image, geometry, options):
+        """ Decode image at the smallest resolution the thumbnail needs
+
+        Size of the thumbnail is computed the way scale() does it, for both
+        orientations since the image may be rotated by its EXIF yet. """
+        x_image, y_image = map(float, self.get_image_size(image))
+        factors = []
+        for width, height in ((x_image, y_image), (y_image, x_image)):
+            ratios = (geometry[0] / width, geometry[1] / height)
+            factors.append(max(ratios) if options['crop'] else min(ratios))
+        factor = max(factors)
+        if factor < 1:
+            draft_image(image, (x_image * factor, y_image * factor))
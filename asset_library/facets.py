@@ -0,0 +1,44 @@
+"""
+Tag facets of the library sidebar
+
+Tags of the listed assets with their usage counts and the number of untagged
+assets. Counting them joins and aggregates the whole listing, so they are
+cached under versions of the scopes of assets the listing is made of, see
+cache.py. The default listing, global and personal assets, is cached under
+versions of both global and user's scope.
+
+A page view costs a cache lookup and O(number of tags) to unpickle.
+Inbox of the 'reference' sharing mode is made of assets of other users and
+is counted on every request, so are all listings without ASSET_CACHE.
+"""
+
+from django.conf import settings
+from django.db.models import Count, get_model
+
+from .cache import ALL_SCOPES, get_asset_cache, get_listing_scopes, make_key
+
+
+def count_tags(assets):
+    """ Return (tags annotated by count, count of untagged) of assets """
+    Tag = get_model('asset_library', 'Tag')
+    tags = Tag.objects.filter(assets__pk__in=assets)
+    tags = tags.annotate(count=Count('pk')).order_by('name')
+    return list(tags), assets.filter(tags=None).count()
+
+
+def get_tag_facets(assets, source, user):
+    """ Return count_tags() of assets listed from source, cached
+
+    :param assets: all assets of the listing, not only paginated
+    """
+    cache = get_asset_cache()
+    scopes = get_listing_scopes(source, user)
+    if cache is None or scopes is None:
+        return count_tags(assets)
+
+    key = make_key('tag_facets', [ALL_SCOPES] + scopes, source, user.pk)
+    facets = cache.get(key)
+    if facets is None:
+        facets = count_tags(assets)
+        cache.set(key, facets, settings.ASSET_TAG_FACETS_TIMEOUT)
+    return facets
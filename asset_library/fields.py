@@ -0,0 +1,82 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models.fields.files import ImageFieldFile
+
+from .utils import inspect_image
+
+
+class InspectedImageFormField(forms.ImageField):
+    """ Image form field which leaves details about the image on the uploaded
+    file for validators and models instead of throwing them away """
+
+    def to_python(self, data):
+        # Skip forms.ImageField which opens the image on its own
+        f = super(forms.ImageField, self).to_python(data)
+        if f is None:
+            return None
+
+        try:
+            inspect_image(f)
+        except IOError:
+            raise ValidationError(
+                self.error_messages['invalid_image'], code='invalid_image')
+        return f
+
+
+class InspectedImageFieldFile(ImageFieldFile):
+    def _get_image_dimensions(self):
+        """ Take width and height from inspect_image() """
+        if not hasattr(self, '_dimensions_cache'):
+            close = self.closed
+            try:
+                info = inspect_image(self)
+                self._dimensions_cache = (info.width, info.height)
+            except IOError:
+                self._dimensions_cache = (None, None)
+            if close:
+                self.close()
+        return self._dimensions_cache
+
+    def save(self, name, content, save=True):
+        """ Storing the file replaces it by the stored copy and Django
+        measures its dimensions again. They can't differ from the dimensions
+        of the file being stored, hand them over. """
+        try:
+            info = inspect_image(content)
+            dimensions = (info.width, info.height)
+        except IOError:
+            dimensions = None
+        self.instance._stored_image_dimensions = dimensions
+        try:
+            super(InspectedImageFieldFile, self).save(name, content, save)
+        finally:
+            self.instance._stored_image_dimensions = None
+
+
+class InspectedImageField(models.ImageField):
+    """ ImageField filling width_field and height_field from
+    inspect_image() """
+    attr_class = InspectedImageFieldFile
+
+    def update_dimension_fields(self, instance, force=False, *args, **kwargs):
+        dimensions = getattr(instance, '_stored_image_dimensions', None)
+        if dimensions:
+            file = getattr(instance, self.attname)
+            file._dimensions_cache = dimensions
+        super(InspectedImageField, self).update_dimension_fields(
+            instance, force, *args, **kwargs)
+
+    def formfield(self, **kwargs):
+        defaults = {'form_class': InspectedImageFormField}
+        defaults.update(kwargs)
+        return super(InspectedImageField, self).formfield(**defaults)
+
+
+try:
+    from south.modelsinspector import add_introspection_rules
+except ImportError:
+    pass
+else:
+    add_introspection_rules(
+        [], [r"^asset_library\.fields\.InspectedImageField"])
@@ -1,3 +1,4 @@
+import json
 import os
 
 from django import forms
@@ -7,6 +8,9 @@ from django.db.models import get_model
 from django.db.models.query_utils import Q
 from django.utils.translation import ugettext_noop as _
 
+from .fields import InspectedImageFormField
+from .pagination import decode_cursor, InvalidCursor
+from .search import get_search_backend
 from .utils import media_uri_to_path
 from .validators import validate_destination_path, validate_file_extension, \
     validate_image_extension
@@ -17,6 +21,7 @@ Asset = get_model('asset_library', 'Asset')
 ImageAsset = get_model('asset_library', 'ImageAsset')
 SnippetAsset = get_model('asset_library', 'SnippetAsset')
 FileAsset = get_model('asset_library', 'FileAsset')
+SharedAsset = get_model('asset_library', 'SharedAsset')
 
 
 class AssetForm(forms.ModelForm):
@@ -59,10 +64,8 @@ class AssetForm(forms.ModelForm):
         instance.save()
 
         # Set tags
-        instance.tags = [
-            Tag.objects.get_or_create(name=tag_name)[0]
-            for tag_name in self.cleaned_data.get('tags', []) if tag_name
-        ]
+        instance.set_tags(Tag.objects.get_or_create_many(
+            self.cleaned_data.get('tags', [])))
 
         return instance
 
@@ -113,8 +116,26 @@ class ShareAssetForm(forms.Form):
         return shared_with
 
 
+class BulkShareAssetForm(ShareAssetForm):
+    """ Share several assets with several users at once """
+    assets = forms.ModelMultipleChoiceField(queryset=Asset.objects.none())
+    shared_with = forms.ModelMultipleChoiceField(queryset=User.objects.all())
+
+    def __init__(self, user=None, *args, **kwargs):
+        super(BulkShareAssetForm, self).__init__(user, *args, **kwargs)
+        self.fields['assets'].queryset = Asset.objects.filter(
+            creator=user, is_global=False)
+
+    def clean_shared_with(self):
+        """ Shared_with has to be different from user """
+        shared_with = self.cleaned_data.get('shared_with')
+        if self.user in shared_with:
+            raise ValidationError("Can't share asset to yourself")
+        return shared_with
+
+
 class UploadImageForm(forms.Form):
-    file = forms.ImageField(validators=[validate_image_extension])
+    file = InspectedImageFormField(validators=[validate_image_extension])
 
 
 class UploadFileForm(forms.Form):
@@ -200,6 +221,9 @@ class FilterAssetsForm(forms.Form):
             return queryset.filter(
                 Q(is_global=True) | Q(creator=user), shared_by__isnull=True)
         elif source == self.INBOX:
+            if settings.ASSET_SHARING_MODE == 'reference':
+                inbox = SharedAsset.objects.filter(shared_with=user)
+                return queryset.filter(pk__in=inbox.values('asset'))
             return queryset.filter(
                 is_global=False, creator=user, shared_by__isnull=False)
         elif source == self.YOUR_ASSETS:
@@ -249,7 +273,7 @@ class FilterAssetsForm(forms.Form):
             queryset = queryset.filter(tags=data['tag'])
 
         if data['search']:
-            queryset = queryset.filter(name__contains=data['search'])
+            queryset = get_search_backend().filter(queryset, data['search'])
 
         orderby = None
         if data['order_by']:
@@ -289,31 +313,58 @@ class FilterAPIForm(forms.Form):
     without_tags = forms.BooleanField(required=False)
     tag = forms.ModelChoiceField(queryset=Tag.objects.all(), required=False)
 
-    SORT_NAME, SORT_NEW_FIRST, SORT_OLD_FIRST = (
-        "name", "newest_first", "oldest_first")
+    SORT_NAME, SORT_NEW_FIRST, SORT_OLD_FIRST, SORT_RELEVANCE = (
+        "name", "newest_first", "oldest_first", "relevance")
 
     SORT_OPTIONS = (
         (SORT_NAME, SORT_NAME),
         (SORT_NEW_FIRST, SORT_NEW_FIRST),
         (SORT_OLD_FIRST, SORT_OLD_FIRST),
+        (SORT_RELEVANCE, SORT_RELEVANCE),
     )
     sort_by = forms.ChoiceField(choices=SORT_OPTIONS, required=False)
 
     limit = forms.IntegerField(min_value=0, required=False)
     page = forms.IntegerField(min_value=0, required=False)
+    # Opaque position for keyset pagination, see pagination.py
+    cursor = forms.CharField(required=False)
+
+    def clean_cursor(self):
+        """ Decode cursor into (value, pk, backwards) tuple """
+        cursor = self.cleaned_data.get('cursor')
+        if not cursor:
+            return None
+        try:
+            return decode_cursor(cursor)
+        except InvalidCursor as e:
+            raise ValidationError(str(e))
+
+    def get_sort_key(self):
+        """ Return (key, descending) pair the assets are sorted by """
+        if self.cleaned_data['sort_by'] == self.SORT_NEW_FIRST:
+            return 'date_created', True
+        elif self.cleaned_data['sort_by'] == self.SORT_OLD_FIRST:
+            return 'date_created', False
+        elif self.cleaned_data['sort_by'] == self.SORT_RELEVANCE and \
+                self.cleaned_data['search'] and \
+                get_search_backend().supports_ranking:
+            # Rank computed by search backend
+            return 'search_rank', True
+        else:
+            return 'lower_name', False
 
     def get_queryset(self, user, queryset):
         """ Get queryset based on parameters (filtering, sorting) """
         data = self.cleaned_data
 
-        if data['sort_by'] == self.SORT_NEW_FIRST:
-            queryset = queryset.order_by('-date_created')
-        elif data['sort_by'] == self.SORT_OLD_FIRST:
-            queryset = queryset.order_by('date_created')
-        else:
+        key, descending = self.get_sort_key()
+        if key == 'lower_name':
             queryset = queryset.extra(select={
-                'lower_name': 'lower("asset_library_asset"."name")'}
-            ).order_by('lower_name')
+                'lower_name': 'lower("asset_library_asset"."name")'})
+        if data['search']:
+            queryset = get_search_backend().filter(
+                queryset, data['search'], ranked=key == 'search_rank')
+        queryset = queryset.order_by(('-' if descending else '') + key)
 
         if data['source'] == self.GLOBAL_ASSETS:
             queryset = queryset.filter(is_global=True)
@@ -326,9 +377,6 @@ class FilterAPIForm(forms.Form):
                 Q(creator=user) | Q(is_global=True),
                 shared_by__isnull=True)
 
-        if data['search']:
-            queryset = queryset.filter(name__icontains=data['search'])
-
         if data['without_tags']:
             queryset = queryset.filter(tags__isnull=True)
         elif data['tag']:
@@ -346,7 +394,8 @@ class FileFilterAPIForm(FilterAPIForm):
         for extension in extensions.split(','):
             extension = extension.strip()
             if extension:
-                extension_filter |= Q(extension__iexact=extension)
+                # Extensions are stored uppercased, exact match uses index
+                extension_filter |= Q(extension=extension.upper())
         return extension_filter
 
     def get_queryset(self, user, queryset):
@@ -386,15 +435,35 @@ class UploadFileAPIForm(SelectFileAPIForm):
 
 class UploadImageAPIForm(SelectFileAPIForm):
     # Check that image is actually image
-    file = forms.ImageField()
+    file = InspectedImageFormField()
+
+
+class BatchUploadAPIForm(SelectFileAPIForm):
+    """ Options shared by all files of batch upload """
+    TAG_SEPARATOR = ','
+    tags = forms.CharField(required=False)
+
+    def clean_tags(self):
+        """ Parse tags into list """
+        tag_list = self.cleaned_data.get('tags', '')
+        tags = set(tag.strip() for tag in tag_list.split(self.TAG_SEPARATOR))
+        return sorted(tag for tag in tags if tag)
 
 
 class ImageEditorAPIForm(forms.Form):
+    """ Single transformation, or pipeline of operations
+
+    Operations are a JSON list applied in order, e.g.
+    [{"name": "crop", "x1": 0, "y1": 0, "x2": 100, "y2": 100},
+     {"name": "rotate", "angle": 90}, {"name": "grayscale"}] """
     src = forms.CharField()
-    CROP, ROTATE, GRAYSCALE = ('crop', 'rotate', 'grayscale')
+    CROP, ROTATE, GRAYSCALE, RESIZE, FIT = (
+        'crop', 'rotate', 'grayscale', 'resize', 'fit')
+    TRANSFORMATIONS = (CROP, ROTATE, GRAYSCALE, RESIZE, FIT)
 
     transformation = forms.ChoiceField(choices=(
-        (CROP, CROP), (ROTATE, ROTATE), (GRAYSCALE, GRAYSCALE)))
+        (CROP, CROP), (ROTATE, ROTATE), (GRAYSCALE, GRAYSCALE),
+        (RESIZE, RESIZE), (FIT, FIT)), required=False)
 
     # Crop options
     x1 = forms.IntegerField(min_value=0, required=False)
@@ -405,6 +474,29 @@ class ImageEditorAPIForm(forms.Form):
     # Rotation options
     angle = forms.IntegerField(required=False)
 
+    # Resize and fit options
+    width = forms.IntegerField(min_value=1, required=False)
+    height = forms.IntegerField(min_value=1, required=False)
+
+    operations = forms.CharField(required=False)
+    MAX_OPERATIONS = 20
+    # Arguments of operations and transformations
+    ARGUMENTS = {
+        CROP: ('x1', 'y1', 'x2', 'y2'),
+        ROTATE: ('angle',),
+        GRAYSCALE: (),
+        RESIZE: ('width', 'height'),
+        FIT: ('width', 'height'),
+    }
+
+    # Output options
+    quality = forms.IntegerField(min_value=1, max_value=100, required=False)
+    progressive = forms.BooleanField(required=False)
+    # Render a small proxy of the image, see ImageEditor.preview
+    preview = forms.BooleanField(required=False)
+    # Render the image by a worker thread, see ImageEditorJob
+    background = forms.BooleanField(required=False)
+
     def clean_src(self):
         """ Transform image URI into file path """
         src = self.cleaned_data['src']
@@ -425,6 +517,57 @@ class ImageEditorAPIForm(forms.Form):
             angle = angle % 360
         return angle
 
+    def clean_operations(self):
+        """ Parse operations into list of (name, arguments) pairs """
+        operations = self.cleaned_data.get('operations')
+        if not operations:
+            return []
+        try:
+            operations = json.loads(operations)
+        except ValueError:
+            raise ValidationError("Malformed operations")
+        if not isinstance(operations, list) or \
+                len(operations) > self.MAX_OPERATIONS:
+            raise ValidationError(
+                "List of at most %d operations required" %
+                self.MAX_OPERATIONS)
+
+        cleaned = []
+        for operation in operations:
+            if not isinstance(operation, dict) or \
+                    operation.get('name') not in self.ARGUMENTS:
+                raise ValidationError("Unknown operation")
+            name = operation['name']
+            arguments = {}
+            for argument in self.ARGUMENTS[name]:
+                field = self.fields[argument]
+                value = field.clean(operation.get(argument))
+                if value is None and name != self.RESIZE:
+                    raise ValidationError(
+                        "%s requires %s" % (name, argument))
+                arguments[argument] = value
+            self.validate_arguments(name, arguments)
+            cleaned.append((name, arguments))
+        return cleaned
+
+    def validate_arguments(self, name, arguments):
+        """ Check arguments of operation """
+        if name == self.CROP:
+            # The box is clamped to the image, see ImageEditor.crop
+            if (arguments['x2'] <= arguments['x1'] or
+                    arguments['y2'] <= arguments['y1']):
+                raise ValidationError("crop requires x2 > x1 and y2 > y1")
+        elif name == self.ROTATE:
+            arguments['angle'] %= 360
+        elif name in (self.RESIZE, self.FIT):
+            width, height = arguments['width'], arguments['height']
+            if width is None and height is None:
+                raise ValidationError("%s requires width or height" % name)
+            max_size = settings.ASSET_IMAGE_EDITOR_MAX_SIZE
+            if max(width, height) > max_size:
+                raise ValidationError(
+                    "Images larger than %d pixels are not allowed" % max_size)
+
     def clean(self):
         """ Require parameters based on transformation """
         cleaned_data = super(ImageEditorAPIForm, self).clean()
@@ -446,4 +589,26 @@ class ImageEditorAPIForm(forms.Form):
             if not angle:
                 self._errors['angle'] = 'Required field'
 
+        elif transformation in (self.RESIZE, self.FIT):
+            width = cleaned_data.get('width')
+            height = cleaned_data.get('height')
+            if width is None and height is None or \
+                    transformation == self.FIT and None in (width, height):
+                self._errors['width'], self._errors['height'] = (
+                    'Required field', 'Required field')
+
+        if transformation and not self._errors:
+            # Single transformation is a pipeline of one operation
+            arguments = dict((argument, cleaned_data.get(argument))
+                             for argument in self.ARGUMENTS[transformation])
+            try:
+                self.validate_arguments(transformation, arguments)
+            except ValidationError as e:
+                self._errors['transformation'] = self.error_class(e.messages)
+            else:
+                cleaned_data['operations'] = [(transformation, arguments)]
+        elif not transformation and not cleaned_data.get('operations') \
+                and 'operations' not in self._errors:
+            raise ValidationError("Transformation or operations required")
+
         return cleaned_data
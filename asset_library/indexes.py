@@ -0,0 +1,88 @@
+"""
+Indexes of asset listings
+
+Listings filter by creator, is_global and shared_by and sort by lower(name)
+or date_created. Indexes starting with the filtered columns and ending with
+the sort key let the database read rows in order instead of sorting them.
+The ones on columns are declared by AbstractAsset.Meta.index_together, the
+ones on lower(name), see FilterAPIForm.get_sort_key(), can't be declared by
+Django and are created here, after syncdb or by the migration. MySQL has no
+indexes on expressions and sorts by name without them.
+
+Query plans of the listings can be checked by
+
+    ./manage.py explain_asset_listings --user=<id>
+
+Personal and global listings should use an index of the asset table and no
+sorting, i.e. there should be no "SCAN TABLE asset_library_asset" or "USE
+TEMP B-TREE FOR ORDER BY" (SQLite), "Seq Scan on asset_library_asset" or
+"Sort" (PostgreSQL). The default listing (personal OR global) is searched by
+the shared_by index and sorted.
+"""
+
+from django.db import connections
+
+# (name, table, columns)
+FUNCTIONAL_INDEXES = [
+    ('asset_library_asset_personal_lower_name', 'asset_library_asset',
+     'creator_id, is_global, shared_by_id, lower(name)'),
+    ('asset_library_asset_global_lower_name', 'asset_library_asset',
+     'is_global, lower(name)'),
+]
+
+EXPLAIN_PREFIXES = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+    'mysql': 'EXPLAIN ',
+}
+
+
+def supports_functional_indexes(connection):
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+def index_exists(connection, name):
+    """ Return True if index of the name exists """
+    if connection.vendor == 'sqlite':
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = %s"
+    else:
+        sql = "SELECT 1 FROM pg_indexes WHERE indexname = %s"
+    cursor = connection.cursor()
+    cursor.execute(sql, [name])
+    return cursor.fetchone() is not None
+
+
+def create_functional_indexes(connection):
+    """ Create indexes on expressions unless they exist """
+    if not supports_functional_indexes(connection):
+        return
+    cursor = connection.cursor()
+    for name, table, columns in FUNCTIONAL_INDEXES:
+        if not index_exists(connection, name):
+            cursor.execute('CREATE INDEX %s ON %s (%s)' % (
+                name, table, columns))
+
+
+def drop_functional_indexes(connection):
+    if not supports_functional_indexes(connection):
+        return
+    cursor = connection.cursor()
+    for name, table, columns in FUNCTIONAL_INDEXES:
+        if index_exists(connection, name):
+            cursor.execute('DROP INDEX %s' % name)
+
+
+def create_indexes_after_syncdb(sender, db=None, **kwargs):
+    """ post_syncdb receiver """
+    create_functional_indexes(connections[db or 'default'])
+
+
+def explain(queryset):
+    """ Return query plan of queryset as list of lines """
+    connection = connections[queryset.db]
+    sql, params = queryset.query.sql_with_params()
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor, 'EXPLAIN ')
+    cursor = connection.cursor()
+    cursor.execute(prefix + sql, params)
+    return [' '.join(unicode(column) for column in row)
+            for row in cursor.fetchall()]
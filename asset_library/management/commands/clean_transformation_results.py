@@ -0,0 +1,20 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from asset_library.transformations import clean_results
+
+
+class Command(BaseCommand):
+    help = "Forget images written by the image editor that are no longer " \
+           "reused"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--days', type='int', default=None,
+                    help="Forget images not reused for this number of days"),
+    )
+
+    def handle(self, *args, **options):
+        # Files are kept, campaigns may use them
+        forgotten = clean_results(days=options['days'])
+        self.stdout.write("Forgot %d images" % forgotten)
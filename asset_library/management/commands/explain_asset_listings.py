@@ -0,0 +1,40 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import get_model
+
+from asset_library.indexes import explain
+
+User = get_model('auth', 'User')
+Asset = get_model('asset_library', 'Asset')
+
+# Import forms once models are loaded
+from asset_library.forms import FilterAPIForm  # noqa
+
+
+class Command(BaseCommand):
+    help = "Print query plans of asset listings, see asset_library/indexes.py"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--user', type='int', default=None,
+                    help="ID of user whose listings are explained "
+                         "(default: the first user)"),
+    )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['user'] is not None:
+            users = users.filter(pk=options['user'])
+        if not users:
+            raise CommandError("No such user")
+        user = users[0]
+
+        sources = [''] + [source for source, __ in FilterAPIForm.SOURCES]
+        for source in sources:
+            for sort_by, __ in FilterAPIForm.SORT_OPTIONS:
+                form = FilterAPIForm({'source': source, 'sort_by': sort_by})
+                form.is_valid()
+                queryset = form.get_queryset(user, Asset.objects.all())
+                self.stdout.write("source=%s sort_by=%s" % (source, sort_by))
+                for line in explain(queryset):
+                    self.stdout.write("    " + line)
@@ -0,0 +1,22 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from asset_library.thumbnails import process_queue
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnails of image assets waiting for them"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', type='int', default=None,
+                    help="Number of worker processes (default: number of "
+                         "CPUs, 0: generate in this process)"),
+        make_option('--limit', type='int', default=None,
+                    help="Process at most this number of images"),
+    )
+
+    def handle(self, *args, **options):
+        processed = process_queue(
+            workers=options['workers'], limit=options['limit'])
+        self.stdout.write("Generated thumbnails of %d images" % processed)
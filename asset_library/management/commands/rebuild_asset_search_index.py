@@ -0,0 +1,25 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db.models import get_model
+
+from asset_library.search import get_search_backend
+
+Asset = get_model('asset_library', 'Asset')
+
+
+class Command(BaseCommand):
+    help = "Index all assets by the search backend, see ASSET_SEARCH_BACKEND"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=500,
+                    help="Number of assets indexed at once"),
+    )
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        batch_size = options['batch_size']
+        pks = list(Asset.objects.order_by('pk').values_list('pk', flat=True))
+        for start in range(0, len(pks), batch_size):
+            backend.reindex(pks[start:start + batch_size])
+        self.stdout.write("Indexed %d assets" % len(pks))
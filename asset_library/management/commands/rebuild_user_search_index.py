@@ -0,0 +1,25 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db.models import get_model
+
+from asset_library.usersearch import index_users
+
+User = get_model('auth', 'User')
+
+
+class Command(BaseCommand):
+    help = "Index all users for autocompletion"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=1000,
+                    help="Number of users indexed at once"),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        users = User.objects.order_by('pk')
+        count = users.count()
+        for start in range(0, count, batch_size):
+            index_users(users[start:start + batch_size])
+        self.stdout.write("Indexed %d users" % count)
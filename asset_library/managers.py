@@ -0,0 +1,237 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, models
+from django.db.models import Max, get_model, sql
+
+from model_utils.managers import InheritanceManager
+
+from .cache import invalidate_assets
+from .search import get_search_backend
+from .transactions import atomic
+
+
+def copy_values(source, fields, **overrides):
+    """ Return {attname: value} of fields of source object """
+    values = dict((field.attname, getattr(source, field.attname))
+                  for field in fields)
+    values.update(overrides)
+    return values
+
+
+def bulk_insert(model, objs, using=DEFAULT_DB_ALIAS):
+    """ Insert rows of objs into the own table of model by batched INSERTs
+
+    Unlike QuerySet.bulk_create() it takes models inheriting other models,
+    only their own table is written, and it sets primary keys of objs which
+    have none (either all objs have a key or none has). PostgreSQL returns
+    keys of the inserted rows, SQLite gets a range of keys reserved while
+    the transaction locks the table. Other databases can't do either
+    without ending the transaction (LOCK TABLES of MySQL), they insert
+    such rows one by one. No signals are sent. """
+    connection = connections[using]
+    meta = model._meta
+    if not meta.has_auto_field or objs[0].pk is not None:
+        _insert(model, objs, meta.local_fields, using)
+    elif connection.vendor == 'postgresql':
+        _insert_returning_keys(model, objs, using)
+    elif connection.vendor == 'sqlite':
+        _reserve_keys(model, objs, using)
+        _insert(model, objs, meta.local_fields, using)
+    else:
+        fields = [field for field in meta.local_fields
+                  if field is not meta.auto_field]
+        for obj in objs:
+            obj.pk = _insert(model, [obj], fields, using, return_id=True)
+
+
+def _insert(model, objs, fields, using, return_id=False):
+    """ Insert objs by INSERTs of as many rows as the database takes """
+    ops = connections[using].ops
+    batch_size = max(ops.bulk_batch_size(fields, objs), 1)
+    result = None
+    for start in range(0, len(objs), batch_size):
+        query = sql.InsertQuery(model)
+        query.insert_values(fields, objs[start:start + batch_size])
+        result = query.get_compiler(using=using).execute_sql(return_id)
+    return result
+
+
+def _insert_returning_keys(model, objs, using):
+    """ Insert objs and set their keys by INSERT ... RETURNING """
+    connection = connections[using]
+    meta = model._meta
+    fields = [field for field in meta.local_fields
+              if field is not meta.auto_field]
+    batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    cursor = connection.cursor()
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        query = sql.InsertQuery(model)
+        query.insert_values(fields, batch)
+        # Rows of a multi-row VALUES are returned in its order
+        for sql_string, params in query.get_compiler(using=using).as_sql():
+            cursor.execute('%s RETURNING %s' % (
+                sql_string, connection.ops.quote_name(meta.pk.column)),
+                params)
+            for obj, (pk,) in zip(batch, cursor.fetchall()):
+                obj.pk = pk
+
+
+def _reserve_keys(model, objs, using):
+    """ Set keys of objs to the keys following the largest one
+
+    SQLite allows one writing transaction at a time. Writing nothing takes
+    the lock, nobody else inserts rows until the transaction ends. """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    column = qn(model._meta.pk.column)
+    connection.cursor().execute('UPDATE %s SET %s = %s WHERE 1 = 0' % (
+        qn(model._meta.db_table), column, column))
+    last_pk = model._base_manager.using(using).aggregate(
+        last=Max('pk'))['last'] or 0
+    for pk, obj in enumerate(objs, last_pk + 1):
+        obj.pk = pk
+
+
+class AssetManager(InheritanceManager):
+
+    def bulk_share(self, assets, shared_by, recipients):
+        """ Share every asset with every recipient
+
+        The result is the same as calling asset.share() for every pair but
+        every table is written by batched INSERTs: the asset table, the table
+        of every asset type and the tags, see bulk_insert(). No signals are
+        sent, the search index and versions of the library are updated once
+        for all copies. Deep copies of 200 assets for 30 users take a few
+        queries instead of tens of thousands.
+
+        With ASSET_SHARING_MODE 'reference' only SharedAsset references are
+        created, see AbstractAsset.share().
+
+        :param assets: assets (or queryset) owned by shared_by
+        :param recipients: users who get the assets to their inbox
+        :returns: list of primary keys of the new assets (or SharedAssets)
+        """
+        if settings.ASSET_SHARING_MODE == 'reference':
+            return self._bulk_share_references(assets, shared_by, recipients)
+
+        Asset = get_model('asset_library', 'Asset')
+        AssetTag = Asset.tags.through
+
+        # Downcast the assets to copy the tables of their types as well
+        pks = [asset.pk for asset in assets]
+        assets = list(Asset.objects.filter(pk__in=pks).select_subclasses())
+        recipients = list(recipients)
+        pairs = [(asset, user) for asset in assets for user in recipients]
+        if not pairs:
+            return []
+
+        parent_fields = [field for field in Asset._meta.local_fields
+                         if not field.primary_key]
+        with atomic():
+            parents = [Asset(**copy_values(asset, parent_fields,
+                                           creator_id=user.pk,
+                                           shared_by_id=shared_by.pk))
+                       for asset, user in pairs]
+            bulk_insert(Asset, parents, using=self.db)
+
+            children = defaultdict(list)
+            for parent, (asset, user) in zip(parents, pairs):
+                model = type(asset)
+                if model is Asset:
+                    continue
+                ptr = model._meta.get_ancestor_link(Asset)
+                fields = [field for field in model._meta.local_fields
+                          if field is not ptr]
+                values = copy_values(asset, fields, **{ptr.attname: parent.pk})
+                children[model].append(model(**values))
+            for model, objs in children.items():
+                bulk_insert(model, objs, using=self.db)
+
+            asset_tags = defaultdict(list)
+            for asset_id, tag_id in AssetTag.objects.filter(
+                    asset__in=pks).values_list('asset_id', 'tag_id'):
+                asset_tags[asset_id].append(tag_id)
+            AssetTag.objects.bulk_create([
+                AssetTag(asset_id=parent.pk, tag_id=tag_id)
+                for parent, (asset, user) in zip(parents, pairs)
+                for tag_id in asset_tags[asset.pk]
+            ])
+            new_pks = [parent.pk for parent in parents]
+            get_search_backend().reindex(new_pks)
+            invalidate_assets(parents)
+        return new_pks
+
+    def _bulk_share_references(self, assets, shared_by, recipients):
+        """ Put assets into inboxes of recipients unless they are there """
+        SharedAsset = get_model('asset_library', 'SharedAsset')
+        pks = [asset.pk for asset in assets]
+        user_pks = [user.pk for user in recipients]
+        with atomic():
+            shares = SharedAsset.objects.filter(
+                asset__in=pks, shared_with__in=user_pks)
+            existing = set(shares.values_list('asset_id', 'shared_with_id'))
+            SharedAsset.objects.bulk_create([
+                SharedAsset(asset_id=asset_pk, shared_with_id=user_pk,
+                            shared_by_id=shared_by.pk)
+                for asset_pk in pks for user_pk in user_pks
+                if (asset_pk, user_pk) not in existing
+            ])
+            # bulk_create() doesn't set primary keys, the new references are
+            # found by their unique (shared_with, asset)
+            return [pk for pk, asset_pk, user_pk in shares.order_by('pk')
+                    .values_list('pk', 'asset_id', 'shared_with_id')
+                    if (asset_pk, user_pk) not in existing]
+
+
+class TagManager(models.Manager):
+
+    def get_or_create_many(self, names):
+        """ Return tags of names, create the missing ones
+
+        Existing tags are fetched by one query and the missing ones are
+        inserted by another. When the same tags are being created
+        concurrently, the insert fails and the tags are fetched again.
+
+        :param names: tag names, blank and duplicate ones are skipped
+        :returns: list of tags in order of names
+        """
+        unique_names = []
+        for tag_name in names:
+            tag_name = tag_name.strip()
+            if tag_name and tag_name not in unique_names:
+                unique_names.append(tag_name)
+        names = unique_names
+        if not names:
+            return []
+
+        tags = dict((tag.name, tag) for tag in self.filter(name__in=names))
+        missing = [name for name in names if name not in tags]
+        if missing:
+            try:
+                with atomic():
+                    self.bulk_create([self.model(name=name)
+                                      for name in missing])
+            except IntegrityError:
+                # Created by somebody else meanwhile, create one by one
+                for name in missing:
+                    tags[name] = self.get_or_create(name=name)[0]
+            # bulk_create() doesn't set primary keys
+            tags.update((tag.name, tag) for tag in self.filter(
+                name__in=[name for name in missing if name not in tags]))
+        return [tags[name] for name in names]
+
+
+class TransformationResultManager(models.Manager):
+
+    def evict(self, size):
+        """ Delete all but size most recently used results
+
+        :returns: paths of the deleted results
+        """
+        evicted = list(self.order_by('-date_used', '-pk')
+                       .values_list('pk', 'path')[size:])
+        if evicted:
+            self.filter(pk__in=[pk for pk, __ in evicted]).delete()
+        return [path for __, path in evicted]
@@ -1,5 +1,24 @@
-from .abstract_models import \
-    AbstractTag, AbstractAsset, ImageMixin, FileMixin, SnippetMixin
+import sys
+
+from django.contrib.auth.models import User
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+    post_syncdb, pre_delete
+
+from .abstract_models import AbstractTag, AbstractAsset, \
+    AbstractSharedAsset, AbstractSearchToken, AbstractSearchDocument, \
+    AbstractUserSearchEntry, AbstractUserSearchGram, \
+    AbstractTransformationResult, AbstractTransformationJob, ImageMixin, \
+    FileMixin, SnippetMixin
+from .indexes import create_indexes_after_syncdb
+from .receivers import remember_assets_of_deleted_tag, \
+    update_search_index, update_search_index_of_deleted_tag, \
+    update_search_index_of_tags, update_library_versions, \
+    update_library_versions_of_deleted, update_library_versions_of_tags, \
+    update_user_search_index
+from .search import create_search_indexes_after_syncdb
+from .transactions import discard_commit_callbacks_of_request, \
+    run_commit_callbacks_of_request
 
 """
 Asset library currently uses the following data model:
@@ -34,6 +53,9 @@ It is generally discouraged, see book Two Scoops of Django, Chapter 6.
 Asset library takes advantage of the infrastructure. With multi-table
 inheritance asset library can show all types of assets mixed together in same
 way.
+
+Shared assets are either deep copies in inbox of the user, or SharedAsset
+references to the original asset, see ASSET_SHARING_MODE.
 """
 
 
@@ -55,3 +77,58 @@ class SnippetAsset(SnippetMixin, Asset):
 
 class FileAsset(FileMixin, Asset):
     pass
+
+
+class SharedAsset(AbstractSharedAsset):
+    pass
+
+
+class SearchToken(AbstractSearchToken):
+    pass
+
+
+class SearchDocument(AbstractSearchDocument):
+    pass
+
+
+class UserSearchEntry(AbstractUserSearchEntry):
+    pass
+
+
+class UserSearchGram(AbstractUserSearchGram):
+    pass
+
+
+class TransformationResult(AbstractTransformationResult):
+    pass
+
+
+class TransformationJob(AbstractTransformationJob):
+    pass
+
+
+# Indexes on expressions, see indexes.py and search.py
+post_syncdb.connect(create_indexes_after_syncdb, sender=sys.modules[__name__])
+post_syncdb.connect(create_search_indexes_after_syncdb,
+                    sender=sys.modules[__name__])
+
+# Keep search index up to date
+post_save.connect(update_search_index,
+                  dispatch_uid='asset_library.update_search_index')
+m2m_changed.connect(update_search_index_of_tags, sender=Asset.tags.through)
+pre_delete.connect(remember_assets_of_deleted_tag, sender=Tag)
+post_delete.connect(update_search_index_of_deleted_tag, sender=Tag)
+post_save.connect(update_user_search_index, sender=User)
+
+# Keep versions of the library up to date, see cache.py
+post_save.connect(update_library_versions,
+                  dispatch_uid='asset_library.update_library_versions')
+post_delete.connect(
+    update_library_versions_of_deleted,
+    dispatch_uid='asset_library.update_library_versions_of_deleted')
+m2m_changed.connect(update_library_versions_of_tags,
+                    sender=Asset.tags.through)
+
+# Work waiting for the transaction of the request, see transactions.py
+request_started.connect(discard_commit_callbacks_of_request)
+request_finished.connect(run_commit_callbacks_of_request)
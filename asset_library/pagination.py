@@ -0,0 +1,142 @@
+"""
+Keyset (a.k.a. seek) pagination for API listings.
+
+Django's Paginator needs COUNT(*) of the whole listing and uses OFFSET to get
+to the page. Both get slower the more assets there are and the deeper client
+pages. Keyset pagination remembers the sort key and primary key of the last
+row on the page instead and asks the database only for rows after it, e.g.
+
+    WHERE lower(name) > 'frog' OR (lower(name) = 'frog' AND id > 42)
+    ORDER BY lower(name), id
+    LIMIT 21
+
+The position is handed to clients as an opaque cursor.
+"""
+
+import base64
+import json
+
+from django.db import connection
+from django.db.models.query_utils import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk, backwards=False):
+    """ Encode position in listing into an opaque URL-safe string """
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    data = json.dumps([value, pk, backwards])
+    return base64.urlsafe_b64encode(data).rstrip('=')
+
+
+def decode_cursor(cursor):
+    """ Decode cursor created by encode_cursor
+
+    :returns: tuple (value, pk, backwards)
+    """
+    padding = '=' * (-len(cursor) % 4)
+    try:
+        data = base64.urlsafe_b64decode(str(cursor + padding))
+        value, pk, backwards = json.loads(data)
+    except (TypeError, ValueError, UnicodeEncodeError):
+        raise InvalidCursor("Malformed cursor")
+    if not isinstance(pk, (int, long)):
+        raise InvalidCursor("Malformed cursor")
+    return value, pk, bool(backwards)
+
+
+class KeysetPage(object):
+    def __init__(self, object_list, next_cursor, prev_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator(object):
+    """ Paginate queryset by a sort key and primary key as a tie-breaker
+
+    :param key: name of model field or extra select the queryset is sorted by
+    :param descending: is the listing sorted in descending order?
+    """
+
+    def __init__(self, queryset, per_page, key, descending=False):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.key = key
+        self.descending = descending
+
+    def _to_python(self, value):
+        """ Convert value from cursor back into the value of the field """
+        if self.key in self.queryset.query.extra_select:
+            return value
+        field = self.queryset.model._meta.get_field(self.key)
+        return field.to_python(value)
+
+    def _seek(self, queryset, value, pk, descending):
+        """ Filter rows strictly after (value, pk) in the sort order """
+        if self.key in self.queryset.query.extra_select:
+            # Extra selects can't be used in filter(), compare the SQL
+            sql, params = queryset.query.extra_select[self.key]
+            meta = queryset.model._meta
+            qn = connection.ops.quote_name
+            pk_column = '%s.%s' % (qn(meta.db_table), qn(meta.pk.column))
+            sign = '<' if descending else '>'
+            where = '((%(key)s %(sign)s %%s) OR ' \
+                    '(%(key)s = %%s AND %(pk)s %(sign)s %%s))' % {
+                        'key': sql, 'sign': sign, 'pk': pk_column}
+            params = list(params) + [value] + list(params) + [value, pk]
+            return queryset.extra(where=[where], params=params)
+
+        lookup = 'lt' if descending else 'gt'
+        return queryset.filter(
+            Q(**{'%s__%s' % (self.key, lookup): value}) |
+            Q(**{self.key: value, 'pk__%s' % lookup: pk}))
+
+    def page(self, cursor=None):
+        """ Return page after (or before) the position given by cursor
+
+        :param cursor: decoded cursor or None for the first page
+        """
+        if cursor is None:
+            value, pk, backwards = None, None, False
+        else:
+            value, pk, backwards = cursor
+            value = self._to_python(value)
+
+        # Walking backwards is walking forwards in the reversed order
+        descending = self.descending != backwards
+        prefix = '-' if descending else ''
+        queryset = self.queryset.order_by(prefix + self.key, prefix + 'pk')
+        if cursor is not None:
+            queryset = self._seek(queryset, value, pk, descending)
+
+        # Fetch one row more to find out whether there is another page
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if backwards:
+            object_list.reverse()
+
+        # Coming from a cursor means there is a page in the opposite direction
+        has_next = cursor is not None if backwards else has_more
+        has_prev = has_more if backwards else cursor is not None
+
+        next_cursor = prev_cursor = None
+        if object_list and has_next:
+            last = object_list[-1]
+            next_cursor = encode_cursor(getattr(last, self.key), last.pk)
+        if object_list and has_prev:
+            first = object_list[0]
+            prev_cursor = encode_cursor(
+                getattr(first, self.key), first.pk, backwards=True)
+
+        return KeysetPage(object_list, next_cursor, prev_cursor)
@@ -0,0 +1,106 @@
+from django.db.models import get_model
+
+from .cache import GLOBAL_SCOPE, bump_versions, get_user_scope, \
+    invalidate_assets
+from .search import get_search_backend
+from .usersearch import index_users
+
+
+def update_search_index(sender, instance, created=False, raw=False,
+                        **kwargs):
+    """ Index saved asset or assets of renamed tag, post_save receiver """
+    Asset = get_model('asset_library', 'Asset')
+    Tag = get_model('asset_library', 'Tag')
+    if raw:
+        return
+    if isinstance(instance, Asset):
+        get_search_backend().update(instance)
+    elif isinstance(instance, Tag) and not created:
+        get_search_backend().reindex(
+            instance.assets.values_list('pk', flat=True))
+
+
+def remember_assets_of_deleted_tag(sender, instance, **kwargs):
+    """ Keep assets of tag until it is deleted, pre_delete receiver """
+    Tag = get_model('asset_library', 'Tag')
+    if isinstance(instance, Tag):
+        instance._search_asset_pks = list(
+            instance.assets.values_list('pk', flat=True))
+
+
+def update_search_index_of_deleted_tag(sender, instance, **kwargs):
+    """ Index assets of deleted tag, post_delete receiver """
+    pks = getattr(instance, '_search_asset_pks', None)
+    if pks:
+        get_search_backend().reindex(pks)
+
+
+def update_search_index_of_tags(sender, instance, action, reverse, pk_set,
+                                **kwargs):
+    """ Index assets with changed tags, m2m_changed receiver """
+    if action == 'pre_clear' and reverse:
+        # Assets of the tag are unknown once it is cleared
+        instance._search_asset_pks = list(
+            instance.assets.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        get_search_backend().update(instance)
+    elif action == 'post_clear':
+        get_search_backend().reindex(
+            getattr(instance, '_search_asset_pks', []))
+    elif pk_set:
+        # Assets were added to (or removed from) the tag
+        get_search_backend().reindex(pk_set)
+
+
+def update_user_search_index(sender, instance, raw=False, **kwargs):
+    """ Index saved user for autocompletion, post_save receiver """
+    if not raw:
+        index_users([instance])
+
+
+def update_library_versions(sender, instance, created=False, raw=False,
+                            **kwargs):
+    """ Bump library versions of saved asset or tag, post_save receiver """
+    Asset = get_model('asset_library', 'Asset')
+    Tag = get_model('asset_library', 'Tag')
+    if isinstance(instance, Asset):
+        if created:
+            invalidate_assets([instance])
+        else:
+            # The asset may have been moved from personal to global or back
+            bump_versions([GLOBAL_SCOPE,
+                           get_user_scope(instance.creator_id)])
+    elif isinstance(instance, Tag) and not created:
+        # Renamed tag of unknown assets
+        invalidate_assets()
+
+
+def update_library_versions_of_deleted(sender, instance, **kwargs):
+    """ Bump library versions of deleted asset or tag, post_delete
+    receiver """
+    Asset = get_model('asset_library', 'Asset')
+    Tag = get_model('asset_library', 'Tag')
+    if isinstance(instance, Asset):
+        invalidate_assets([instance])
+    elif isinstance(instance, Tag):
+        invalidate_assets()
+
+
+def update_library_versions_of_tags(sender, instance, action, reverse,
+                                    pk_set, **kwargs):
+    """ Bump library versions of assets with changed tags, m2m_changed
+    receiver """
+    Asset = get_model('asset_library', 'Asset')
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_assets([instance])
+    elif pk_set:
+        invalidate_assets(Asset.objects.filter(pk__in=pk_set).only(
+            'is_global', 'creator'))
+    elif action == 'post_clear':
+        # Assets of the cleared tag are unknown
+        invalidate_assets()
@@ -0,0 +1,225 @@
+"""
+Search backends
+
+Forms search assets by the backend configured by ASSET_SEARCH_BACKEND:
+
+SubstringSearchBackend
+    Substring of the asset name, i.e. LIKE '%x%' scanning the whole table.
+    The default, it keeps the original behaviour and needs no index.
+
+InvertedIndexSearchBackend
+    Words of name, tags, description and snippet contents are stored in
+    SearchToken table. Every word of the query has to match a prefix of an
+    indexed word, so the lookup is an index range scan. Results can be ranked
+    by weights of the fields the words come from.
+
+PostgresSearchBackend
+    Text of the asset is stored in SearchDocument table with a GIN index of
+    its tsvector, the query is matched by PostgreSQL full text search.
+
+The index is updated when an asset or its tags are saved (see receivers in
+models.py) and deleted together with the asset. Run rebuild_asset_search_index
+command after switching to an indexing backend.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import get_model
+from django.utils.importlib import import_module
+
+from .transactions import atomic
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MAX_TOKEN_LENGTH = 50
+
+# Sorts after any word with the same prefix
+PREFIX_END = u'\uffff'
+
+_backend = None
+
+
+def tokenize(text):
+    """ Split text into lowercased words """
+    return [token[:MAX_TOKEN_LENGTH] for token in TOKEN_RE.findall(
+        text.lower())]
+
+
+def get_search_backend():
+    """ Return instance of backend configured by ASSET_SEARCH_BACKEND """
+    global _backend
+    path = settings.ASSET_SEARCH_BACKEND
+    if _backend is None or _backend.path != path:
+        module_name, class_name = path.rsplit('.', 1)
+        backend_class = getattr(import_module(module_name), class_name)
+        _backend = backend_class()
+        _backend.path = path
+    return _backend
+
+
+def get_pk_column(queryset):
+    """ Return quoted primary key column of queryset for extra SQL """
+    qn = connection.ops.quote_name
+    meta = queryset.model._meta
+    return '%s.%s' % (qn(meta.db_table), qn(meta.pk.column))
+
+
+class SubstringSearchBackend(object):
+    # Can filter() order results by relevance?
+    supports_ranking = False
+
+    def filter(self, queryset, query, ranked=False):
+        """ Return assets of queryset matching the query
+
+        :param ranked: add search_rank extra select, higher is better
+        """
+        return queryset.filter(name__icontains=query)
+
+    def update(self, asset):
+        """ Index the saved asset """
+        self.reindex([asset.pk])
+
+    def reindex(self, pks):
+        """ Index assets of given primary keys """
+        pass
+
+
+class IndexingSearchBackend(SubstringSearchBackend):
+    """ Base of backends which store text of assets """
+
+    def get_texts(self, asset):
+        """ Return (field, text) pairs of asset """
+        texts = [('name', asset.name), ('description', asset.description)]
+        texts += [('tags', tag.name) for tag in asset.tags.all()]
+        if hasattr(asset, 'contents'):
+            texts.append(('contents', asset.contents))
+        return texts
+
+    def reindex(self, pks):
+        Asset = get_model('asset_library', 'Asset')
+        assets = Asset.objects.filter(pk__in=list(pks)) \
+            .select_subclasses().prefetch_related('tags')
+        with atomic():
+            self.store(list(assets))
+
+    def store(self, assets):
+        """ Replace stored text of assets """
+        raise NotImplementedError
+
+
+class InvertedIndexSearchBackend(IndexingSearchBackend):
+    supports_ranking = True
+
+    # Weight of words by the field they come from
+    WEIGHTS = {
+        'name': 4,
+        'tags': 2,
+        'description': 1,
+        'contents': 1,
+    }
+
+    def get_tokens(self, asset):
+        """ Return {token: weight} of asset """
+        tokens = {}
+        for field, text in self.get_texts(asset):
+            for token in tokenize(text):
+                tokens[token] = tokens.get(token, 0) + self.WEIGHTS[field]
+        return tokens
+
+    def store(self, assets):
+        SearchToken = get_model('asset_library', 'SearchToken')
+        SearchToken.objects.filter(
+            asset__in=[asset.pk for asset in assets]).delete()
+        SearchToken.objects.bulk_create([
+            SearchToken(asset_id=asset.pk, token=token, weight=weight)
+            for asset in assets
+            for token, weight in self.get_tokens(asset).items()
+        ])
+
+    def filter(self, queryset, query, ranked=False):
+        SearchToken = get_model('asset_library', 'SearchToken')
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+
+        for token in tokens:
+            # Range instead of LIKE 'token%' can always use the index
+            matching = SearchToken.objects.filter(
+                token__gte=token, token__lt=token + PREFIX_END)
+            queryset = queryset.filter(pk__in=matching.values('asset'))
+
+        if ranked:
+            ranges = ' OR '.join(
+                ['(token >= %s AND token < %s)'] * len(tokens))
+            rank = 'SELECT SUM(weight) FROM asset_library_searchtoken ' \
+                   'WHERE asset_id = %s AND (%s)' % (
+                       get_pk_column(queryset), ranges)
+            params = []
+            for token in tokens:
+                params += [token, token + PREFIX_END]
+            queryset = queryset.extra(
+                select={'search_rank': rank}, select_params=params)
+        return queryset
+
+
+class PostgresSearchBackend(IndexingSearchBackend):
+    supports_ranking = True
+
+    # Name is weighted more than the rest of the text
+    VECTOR = "setweight(to_tsvector('simple', name), 'A') || " \
+             "to_tsvector('simple', text)"
+
+    def store(self, assets):
+        SearchDocument = get_model('asset_library', 'SearchDocument')
+        SearchDocument.objects.filter(
+            asset__in=[asset.pk for asset in assets]).delete()
+        documents = []
+        for asset in assets:
+            texts = [text for field, text in self.get_texts(asset)
+                     if field != 'name']
+            documents.append(SearchDocument(
+                asset_id=asset.pk, name=asset.name, text=' '.join(texts)))
+        SearchDocument.objects.bulk_create(documents)
+
+    def filter(self, queryset, query, ranked=False):
+        SearchDocument = get_model('asset_library', 'SearchDocument')
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.none()
+
+        # Every word is a prefix
+        tsquery = ' & '.join(token + ':*' for token in tokens)
+        matching = SearchDocument.objects.extra(
+            where=["%s @@ to_tsquery('simple', %%s)" % self.VECTOR],
+            params=[tsquery])
+        queryset = queryset.filter(pk__in=matching.values('asset'))
+
+        if ranked:
+            rank = "SELECT ts_rank(%s, to_tsquery('simple', %%s)) " \
+                   "FROM asset_library_searchdocument " \
+                   "WHERE asset_id = %s" % (
+                       self.VECTOR, get_pk_column(queryset))
+            queryset = queryset.extra(
+                select={'search_rank': rank}, select_params=[tsquery])
+        return queryset
+
+
+def create_search_indexes(connection):
+    """ Create GIN index for PostgresSearchBackend """
+    if connection.vendor != 'postgresql':
+        return
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT 1 FROM pg_indexes WHERE indexname = %s",
+        ['asset_library_searchdocument_vector'])
+    if cursor.fetchone() is None:
+        cursor.execute(
+            'CREATE INDEX asset_library_searchdocument_vector '
+            'ON asset_library_searchdocument USING gin ((%s))' % (
+                PostgresSearchBackend.VECTOR))
+
+
+def create_search_indexes_after_syncdb(sender, db=None, **kwargs):
+    """ post_syncdb receiver """
+    create_search_indexes(connections[db or 'default'])
@@ -0,0 +1,56 @@
+"""
+Content-addressed storage keeps every distinct file on disk only once.
+
+A file is stored under SHA-256 of its contents, e.g.
+
+    asset_library/files/report.pdf
+        => asset_library/files/3f/3f7a...e1.pdf
+
+Uploading the same file again (or sharing it) points to the existing copy.
+Assets referencing the file are its reference count; the file is deleted
+only when no asset references it.
+"""
+
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage, \
+    get_storage_class
+from django.db.models import get_model
+
+from .utils import get_checksum
+
+
+def get_asset_storage():
+    """ Return storage configured by ASSET_STORAGE """
+    if settings.ASSET_STORAGE:
+        return get_storage_class(settings.ASSET_STORAGE)()
+    return default_storage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_content_name(self, name, checksum):
+        """ Name of file with the given checksum in directory of name """
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, checksum[:2], checksum + extension)
+
+    def _save(self, name, content):
+        name = self.get_content_name(name, get_checksum(content))
+        if self.exists(name):
+            # Same contents are stored already
+            return name
+        return super(ContentAddressedStorage, self)._save(name, content)
+
+    def count_references(self, name):
+        """ Return number of image and file assets using the file """
+        ImageAsset = get_model('asset_library', 'ImageAsset')
+        FileAsset = get_model('asset_library', 'FileAsset')
+        return ImageAsset.objects.filter(image=name).count() + \
+            FileAsset.objects.filter(file=name).count()
+
+    def delete(self, name):
+        """ Delete file only if it is not used by any asset """
+        if self.count_references(name) == 0:
+            super(ContentAddressedStorage, self).delete(name)
@@ -0,0 +1,249 @@
+"""
+Thumbnails of image assets are generated ahead of time so that nobody pays
+for decoding and resizing images while listing them.
+
+ASSET_THUMBNAIL_MODE decides where the work happens:
+
+ - 'sync' generates thumbnails while saving the image
+ - 'pool' hands the image over to a pool of local worker processes once
+   the transaction saving it commits, see transactions.py
+ - 'queue' only leaves the image in the queue
+
+The queue is the database itself: every image without thumbnail_url is
+waiting for its thumbnails. The management command generate_asset_thumbnails
+drains it, e.g. from cron. API shows ASSET_IMAGE_THUMBNAIL_PLACEHOLDER in the
+meantime.
+
+Files are represented by static icons of their extensions. Finding an icon
+walks the static finders, URLs of the icons are kept in memory for
+ASSET_FILE_ICON_CACHE_TIMEOUT seconds, long enough for listings not to touch
+the file system and short enough to notice icons added by collectstatic.
+
+The image editor previews edits on proxies, images downscaled to
+ASSET_IMAGE_EDITOR_PREVIEW_SIZE. Proxies of recently edited images are kept
+in memory by path and modification time, so trying edits neither decodes the
+original again nor writes files.
+"""
+
+from PIL import Image
+import logging
+import multiprocessing
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.db import connections
+from django.db.models import get_model
+
+from .cache import LRUCache, invalidate_assets
+from .transactions import after_commit
+from .utils import thumbnail
+
+THUMBNAIL_SYNC, THUMBNAIL_POOL, THUMBNAIL_QUEUE = ('sync', 'pool', 'queue')
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+# Process which started the pool, forked web workers start their own
+_pool_pid = None
+_icon_urls = None
+_preview_images = None
+
+
+def get_geometries():
+    """ Return ASSET_IMAGE_THUMBNAIL_SIZE followed by any other geometries
+    worth generating ahead of time """
+    geometries = [settings.ASSET_IMAGE_THUMBNAIL_SIZE]
+    for geometry in settings.ASSET_IMAGE_THUMBNAIL_SIZES:
+        if geometry not in geometries:
+            geometries.append(geometry)
+    return geometries
+
+
+def generate_thumbnails(image_name):
+    """ Generate thumbnails of all geometries
+
+    :returns: URL of thumbnail in ASSET_IMAGE_THUMBNAIL_SIZE
+    """
+    urls = [thumbnail(image_name, geometry).url
+            for geometry in get_geometries()]
+    return urls[0]
+
+
+def _init_worker():
+    """ Forget database connections inherited from the parent process
+
+    Closing them would close them for the parent as well. The worker opens
+    its own connection once sorl needs the key-value store. """
+    for connection in connections.all():
+        connection.connection = None
+
+
+def _generate_in_worker(job):
+    """ Generate thumbnails for (pk, image_name) and never raise """
+    pk, image_name = job
+    try:
+        return pk, generate_thumbnails(image_name)
+    except Exception:
+        logger.exception("Failed to generate thumbnails of [%s]" % image_name)
+        return pk, None
+
+
+def _store_thumbnail(result):
+    """ Save thumbnail URL produced by a worker """
+    pk, url = result
+    if url:
+        ImageAsset = get_model('asset_library', 'ImageAsset')
+        images = ImageAsset.objects.filter(pk=pk)
+        images.update(thumbnail_url=url)
+        invalidate_assets(images.only('is_global', 'creator'))
+
+
+def _store_thumbnail_of_worker(result):
+    """ Save thumbnail URL in the result handler thread of the pool, which
+    has its own database connections """
+    try:
+        _store_thumbnail(result)
+    finally:
+        for connection in connections.all():
+            connection.close()
+
+
+def get_pool():
+    """ Return process pool shared by the whole process
+
+    Pool inherited from the parent, e.g. created before the web server
+    forked its workers, has no threads in this process and is replaced. """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = multiprocessing.Pool(
+            settings.ASSET_THUMBNAIL_WORKERS, initializer=_init_worker)
+        _pool_pid = os.getpid()
+    return _pool
+
+
+def _submit_to_pool(job):
+    """ Generate thumbnails for (pk, image_name) by the pool """
+    get_pool().apply_async(
+        _generate_in_worker, [job], callback=_store_thumbnail_of_worker)
+
+
+def schedule_thumbnails(image):
+    """ Get thumbnails of a freshly saved image generated """
+    mode = settings.ASSET_THUMBNAIL_MODE
+    if mode == THUMBNAIL_SYNC:
+        image.update_thumbnail()
+    elif mode == THUMBNAIL_POOL:
+        # The pool can't see the image before it is committed
+        job = (image.pk, image.image.name)
+        after_commit(lambda: _submit_to_pool(job))
+
+
+def get_thumbnail_url(image):
+    """ URL of thumbnail to show for the image in listings """
+    if image.thumbnail_url:
+        return image.thumbnail_url
+    elif settings.ASSET_THUMBNAIL_MODE == THUMBNAIL_SYNC:
+        # Image saved before thumbnails were stored
+        size = settings.ASSET_IMAGE_THUMBNAIL_SIZE
+        return thumbnail(image.image.name, size).url
+    else:
+        # Thumbnail is not ready yet
+        placeholder = settings.ASSET_IMAGE_THUMBNAIL_PLACEHOLDER
+        return staticfiles_storage.url(placeholder)
+
+
+def find_file_icon(extension):
+    """ Return static path of icon of the extension """
+    base_path = settings.ASSET_FILE_THUMBNAILS_PATH
+    icon = base_path + extension.lower() + '.png'
+    icon_path = finders.find(icon)
+    if not icon_path or not os.path.exists(icon_path):
+        icon = base_path + 'default.png'
+    return icon
+
+
+def get_file_icon_url(extension):
+    """ Return URL of icon of the extension, cached """
+    global _icon_urls
+    if _icon_urls is None:
+        _icon_urls = LRUCache(settings.ASSET_FILE_ICON_CACHE_SIZE,
+                              settings.ASSET_FILE_ICON_CACHE_TIMEOUT)
+    key = (settings.ASSET_FILE_THUMBNAILS_PATH, extension.lower())
+    url = _icon_urls.get(key)
+    if url is None:
+        url = staticfiles_storage.url(find_file_icon(extension))
+        _icon_urls.set(key, url)
+    return url
+
+
+def clear_file_icon_urls(**kwargs):
+    """ Forget cached icon URLs, e.g. after static files settings changed
+    in tests """
+    global _icon_urls
+    _icon_urls = None
+
+
+def get_preview_image(path):
+    """ Return proxy of image for previewing edits, cached
+
+    :returns: (proxy, format of the image, scale of the proxy)
+    """
+    global _preview_images
+    if _preview_images is None:
+        _preview_images = LRUCache(
+            settings.ASSET_IMAGE_EDITOR_PREVIEW_CACHE_SIZE)
+    size = settings.ASSET_IMAGE_EDITOR_PREVIEW_SIZE
+    key = (path, os.path.getmtime(path), size)
+    preview = _preview_images.get(key)
+    if preview is None:
+        image = Image.open(path)
+        format = image.format
+        width = image.size[0]
+        # Decodes JPEG at reduced resolution too
+        image.thumbnail((size, size), Image.ANTIALIAS)
+        image.load()
+        preview = (image, format, float(image.size[0]) / width)
+        _preview_images.set(key, preview)
+    return preview
+
+
+def clear_preview_images(**kwargs):
+    """ Forget cached proxies, e.g. after their size changed in tests """
+    global _preview_images
+    _preview_images = None
+
+
+def process_queue(workers=None, limit=None):
+    """ Generate thumbnails of all images waiting for them
+
+    :param workers: number of worker processes, None for number of CPUs and
+                    0 to generate thumbnails in the current process
+    :param limit: process at most this number of images
+    :returns: number of images with generated thumbnails
+    """
+    ImageAsset = get_model('asset_library', 'ImageAsset')
+    jobs = ImageAsset.objects.filter(thumbnail_url='') \
+        .order_by('pk').values_list('pk', 'image')
+    if limit:
+        jobs = jobs[:limit]
+    jobs = list(jobs)
+
+    pool = None
+    if workers == 0:
+        results = (_generate_in_worker(job) for job in jobs)
+    else:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker)
+        results = pool.imap_unordered(_generate_in_worker, jobs)
+        pool.close()
+
+    processed = 0
+    for result in results:
+        _store_thumbnail(result)
+        if result[1]:
+            processed += 1
+
+    if pool is not None:
+        pool.join()
+    return processed
@@ -0,0 +1,93 @@
+"""
+Transactions
+
+atomic() is django.db.transaction.atomic which also runs the functions
+registered by after_commit() once the outermost block commits. Work handed
+over to other threads, processes or caches has to wait for the commit,
+until then they don't see the new rows or see the old ones.
+
+Transactions opened around requests, i.e. ATOMIC_REQUESTS or
+TransactionMiddleware, aren't visible here. Functions registered in them
+run when the response is finished, by then the transaction has been
+committed or rolled back. The functions have to cope with rows that were
+rolled back, e.g. by updating nothing. Functions registered outside
+requests and outside atomic() blocks of this module are dropped when the
+next request starts.
+"""
+
+from contextlib import contextmanager
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+_local = threading.local()
+
+
+def _get_callbacks(using):
+    """ Return functions waiting for commit of the thread's connection """
+    if not hasattr(_local, 'callbacks'):
+        _local.callbacks = {}
+    return _local.callbacks.setdefault(using or DEFAULT_DB_ALIAS, [])
+
+
+def after_commit(func, using=None, discarded=None):
+    """ Call func once the current transaction commits, right away when
+    there is none. Function already waiting isn't added again.
+
+    :param discarded: called instead of func when the transaction rolls
+                      back, e.g. to release what func would release
+    """
+    if transaction.get_autocommit(using):
+        func()
+        return
+    callbacks = _get_callbacks(using)
+    if func not in [waiting for waiting, __ in callbacks]:
+        callbacks.append((func, discarded))
+
+
+def run_commit_callbacks(using=None):
+    """ Call the functions waiting for commit """
+    callbacks = _get_callbacks(using)
+    while callbacks:
+        func, __ = callbacks.pop(0)
+        func()
+
+
+def discard_commit_callbacks(using=None):
+    """ Forget the functions waiting for commit of a rolled back
+    transaction, call their discarded functions """
+    callbacks = _get_callbacks(using)
+    while callbacks:
+        __, discarded = callbacks.pop(0)
+        if discarded is not None:
+            discarded()
+
+
+@contextmanager
+def atomic(using=None):
+    """ transaction.atomic() calling after_commit() functions when the
+    outermost block commits """
+    commits = transaction.get_autocommit(using)
+    try:
+        with transaction.atomic(using):
+            yield
+    except Exception:
+        if commits:
+            discard_commit_callbacks(using)
+        raise
+    if commits:
+        run_commit_callbacks(using)
+
+
+def run_commit_callbacks_of_request(sender, **kwargs):
+    """ Call functions registered in transaction of the request,
+    request_finished receiver """
+    for using in getattr(_local, 'callbacks', {}).keys():
+        run_commit_callbacks(using)
+
+
+def discard_commit_callbacks_of_request(sender, **kwargs):
+    """ Forget functions left over outside of requests, request_started
+    receiver """
+    for using in getattr(_local, 'callbacks', {}).keys():
+        discard_commit_callbacks(using)
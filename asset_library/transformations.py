@@ -0,0 +1,258 @@
+"""
+Images written by the image editor are reused by identical edits, see
+ImageEditor.post
+
+The key of a result is a digest of the contents and the directory of the
+source image and of the operations with the options of encoding. Editing the
+same image the same way again, by another user or by a retry of the client,
+returns the image written before instead of decoding, editing and writing
+another copy. Results are written next to their source, so identical sources
+of other campaigns don't share them: cleaning images of one campaign would
+delete the result used by the other.
+
+At most ASSET_TRANSFORMATION_CACHE_SIZE results are remembered, the least
+recently used ones are forgotten. Their files are left alone, they may be
+used by campaigns. clean_transformation_results command forgets results whose
+files were deleted, results not reused for some days and old jobs; it never
+deletes files.
+
+Edits requested with background are rendered by a pool of
+ASSET_IMAGE_EDITOR_WORKERS threads of the web process, so that large images
+don't hold the request. TransformationJob in the database reports their
+progress and result to whichever process the client polls. When
+ASSET_IMAGE_EDITOR_QUEUE_SIZE edits are waiting for a thread, new ones are
+refused until the pool catches up.
+
+A job is handed to the pool once the transaction creating it commits, the
+thread wouldn't see it before. Its slot in the queue is taken right away and
+released when the transaction rolls back. Jobs are lost when the web process
+restarts, the ones unfinished after ASSET_IMAGE_EDITOR_JOB_TIMEOUT seconds
+are reported as failed.
+"""
+
+import hashlib
+import json
+from multiprocessing.pool import ThreadPool
+import datetime
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, connections
+from django.db.models import get_model
+from django.utils import timezone
+
+from .cache import LRUCache
+from .transactions import after_commit, atomic
+from .utils import file_checksum
+
+# Number of checksums of sources kept in memory
+CHECKSUM_CACHE_SIZE = 1000
+
+_checksums = LRUCache(CHECKSUM_CACHE_SIZE)
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+# Number of jobs waiting for commit, queued or running in the pool
+_pending = 0
+_lock = threading.Lock()
+
+
+def get_source_checksum(path):
+    """ Return SHA-256 hex digest of the contents of file, cached by path,
+    modification time and size """
+    stat = os.stat(path)
+    key = (path, stat.st_mtime, stat.st_size)
+    checksum = _checksums.get(key)
+    if checksum is None:
+        with open(path, 'rb') as f:
+            checksum = file_checksum(File(f))
+        _checksums.set(key, checksum)
+    return checksum
+
+
+def get_transformation_key(path, operations, quality=None, progressive=False):
+    """ Return digest of source image, its directory and normalised
+    operations """
+    data = json.dumps({
+        'source': get_source_checksum(path),
+        'directory': os.path.dirname(os.path.abspath(path)),
+        'operations': operations,
+        'quality': quality,
+        'progressive': progressive,
+    }, sort_keys=True)
+    return hashlib.sha256(data).hexdigest()
+
+
+def get_result(key):
+    """ Return TransformationResult of key if its file still exists """
+    TransformationResult = get_model('asset_library', 'TransformationResult')
+    try:
+        result = TransformationResult.objects.get(key=key)
+    except TransformationResult.DoesNotExist:
+        return None
+    if not os.path.exists(result.path):
+        result.delete()
+        return None
+    # Mark as recently used
+    TransformationResult.objects.filter(pk=result.pk).update(
+        date_used=timezone.now())
+    return result
+
+
+def store_result(key, path, width, height):
+    """ Remember image written by the image editor, forget the least recently
+    used results beyond ASSET_TRANSFORMATION_CACHE_SIZE
+
+    When a concurrent edit stored the key first, the image is deleted and the
+    result of the other edit is used instead. Nobody knows about the image
+    yet and nothing would clean it up later.
+
+    :returns: (path, width, height) of the result of the key
+    """
+    TransformationResult = get_model('asset_library', 'TransformationResult')
+    try:
+        with atomic():
+            TransformationResult.objects.create(
+                key=key, path=path, width=width, height=height)
+    except IntegrityError:
+        winner = TransformationResult.objects.get(key=key)
+        if winner.path != path and os.path.exists(path):
+            os.remove(path)
+        return winner.path, winner.width, winner.height
+    TransformationResult.objects.evict(
+        settings.ASSET_TRANSFORMATION_CACHE_SIZE)
+    return path, width, height
+
+
+def clean_results(days=None):
+    """ Forget results whose files were deleted, results not used for days
+    and results beyond ASSET_TRANSFORMATION_CACHE_SIZE
+
+    Jobs older than days are deleted too, stale ones are failed, see
+    fail_stale_jobs(). Files are kept, campaigns may use them.
+
+    :returns: number of forgotten results
+    """
+    TransformationResult = get_model('asset_library', 'TransformationResult')
+    TransformationJob = get_model('asset_library', 'TransformationJob')
+    results = TransformationResult.objects.all()
+
+    missing = [pk for pk, path in results.values_list('pk', 'path')
+               if not os.path.exists(path)]
+    results.filter(pk__in=missing).delete()
+    fail_stale_jobs(TransformationJob.objects.all())
+    forgotten = len(missing)
+    if days is not None:
+        limit = timezone.now() - datetime.timedelta(days=days)
+        TransformationJob.objects.filter(date_created__lt=limit).delete()
+        unused = results.filter(date_used__lt=limit)
+        forgotten += unused.count()
+        unused.delete()
+    forgotten += len(TransformationResult.objects.evict(
+        settings.ASSET_TRANSFORMATION_CACHE_SIZE))
+    return forgotten
+
+
+def run_job(pk, render, *args):
+    """ Render edit of job and record its progress and result
+
+    :param render: function writing edited image, see ImageEditor.render
+    """
+    TransformationJob = get_model('asset_library', 'TransformationJob')
+    jobs = TransformationJob.objects.filter(pk=pk)
+    if not jobs.filter(status=TransformationJob.QUEUED).update(
+            status=TransformationJob.RUNNING):
+        # Rolled back with the request, or failed by timeout
+        return
+    operations = args[1]
+
+    def progress(applied):
+        jobs.update(progress=100 * applied // len(operations))
+    try:
+        path, width, height = render(*args, progress=progress)
+    except Exception as e:
+        logger.exception("Failed to edit image [%s]" % args[0])
+        jobs.update(status=TransformationJob.FAILED, error=unicode(e))
+    else:
+        jobs.update(status=TransformationJob.DONE, progress=100, path=path,
+                    width=width, height=height)
+
+
+def _run_in_worker(pk, render, *args):
+    """ Run job in worker thread, which has its own database connections """
+    try:
+        run_job(pk, render, *args)
+    finally:
+        _release_slot()
+        for connection in connections.all():
+            connection.close()
+
+
+def submit_job(user, render, path, operations, quality=None,
+               progressive=False):
+    """ Create TransformationJob and render it in the pool
+
+    ASSET_IMAGE_EDITOR_WORKERS = 0 renders it right away.
+
+    :returns: job, None when ASSET_IMAGE_EDITOR_QUEUE_SIZE jobs are waiting
+    """
+    global _pool, _pending
+    TransformationJob = get_model('asset_library', 'TransformationJob')
+    args = (render, path, operations, quality, progressive)
+    workers = settings.ASSET_IMAGE_EDITOR_WORKERS
+    if not workers:
+        job = TransformationJob.objects.create(creator=user)
+        run_job(job.pk, *args)
+        return TransformationJob.objects.get(pk=job.pk)
+
+    with _lock:
+        if _pending >= workers + settings.ASSET_IMAGE_EDITOR_QUEUE_SIZE:
+            return None
+        # The slot is taken until the job finishes, also while the
+        # transaction creating it is running
+        _pending += 1
+        if _pool is None:
+            _pool = ThreadPool(workers)
+    try:
+        job = TransformationJob.objects.create(creator=user)
+    except Exception:
+        _release_slot()
+        raise
+    after_commit(lambda: _submit_to_pool(job.pk, *args),
+                 discarded=_release_slot)
+    return job
+
+
+def _release_slot():
+    """ Free the slot of a job leaving the pool or never reaching it """
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def _submit_to_pool(pk, *args):
+    """ Hand committed job over to the pool """
+    try:
+        _pool.apply_async(_run_in_worker, (pk,) + args)
+    except Exception:
+        _release_slot()
+        raise
+
+
+def fail_stale_jobs(jobs):
+    """ Report jobs unfinished after ASSET_IMAGE_EDITOR_JOB_TIMEOUT seconds
+    as failed, e.g. lost by restart of the web process
+
+    :returns: number of failed jobs
+    """
+    TransformationJob = get_model('asset_library', 'TransformationJob')
+    limit = timezone.now() - datetime.timedelta(
+        seconds=settings.ASSET_IMAGE_EDITOR_JOB_TIMEOUT)
+    return jobs.filter(
+        status__in=(TransformationJob.QUEUED, TransformationJob.RUNNING),
+        date_created__lt=limit,
+    ).update(status=TransformationJob.FAILED, error='Timed out')
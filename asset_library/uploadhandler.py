@@ -0,0 +1,70 @@
+"""
+Upload handlers computing checksum and content type of uploaded files while
+the upload streams in. Assets get the details without reading the file once
+again, see utils.get_checksum() and utils.get_content_type().
+"""
+
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, \
+    TemporaryFileUploadHandler
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from .utils import MAGIC_NUMBER_LENGTH, sniff_content_type
+
+
+class HashingUploadHandlerMixin(object):
+
+    def new_file(self, *args, **kwargs):
+        self.digest = hashlib.sha256()
+        self.header = ''
+        # MemoryFileUploadHandler raises StopFutureHandlers here
+        super(HashingUploadHandlerMixin, self).new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        data = super(HashingUploadHandlerMixin, self).receive_data_chunk(
+            raw_data, start)
+        # Only the handler which keeps the data has to compute the details
+        if data is None:
+            self.digest.update(raw_data)
+            missing = MAGIC_NUMBER_LENGTH - len(self.header)
+            if missing > 0:
+                self.header += raw_data[:missing]
+        return data
+
+    def file_complete(self, file_size):
+        file_obj = super(HashingUploadHandlerMixin, self).file_complete(
+            file_size)
+        if file_obj is not None:
+            file_obj._checksum = self.digest.hexdigest()
+            file_obj._content_type = sniff_content_type(self.header)
+        return file_obj
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandlerMixin,
+                                     MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandlerMixin,
+                                        TemporaryFileUploadHandler):
+    pass
+
+
+class HashingUploadViewMixin(object):
+    """ Parse uploaded files with the hashing upload handlers
+
+    Upload handlers can't be replaced once the request body is parsed and
+    CsrfViewMiddleware parses it when checking the token. The check is
+    postponed after the handlers are in place. """
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        if request.method == 'POST':
+            request.upload_handlers = [
+                HashingMemoryFileUploadHandler(request),
+                HashingTemporaryFileUploadHandler(request),
+            ]
+        dispatch = super(HashingUploadViewMixin, self).dispatch
+        return csrf_protect(dispatch)(request, *args, **kwargs)
@@ -0,0 +1,86 @@
+"""
+Index of users for autocompletion, see UserResource
+
+Users are found by words of their representation "First Last (email)". Every
+word of the query has to be a substring of the representation.
+
+UserSearchGram stores all 1, 2 and 3 characters long substrings of the
+representation. A word of the query is looked up by its substrings of at
+most 3 characters: users having all of them are candidates and the
+representation stored in UserSearchEntry confirms the match. Everything is
+a single SQL query with LIMIT, independent of the number of users.
+
+The index is updated when a user is saved (see receivers in models.py),
+rebuild_user_search_index command indexes existing users.
+"""
+
+from django.db.models import get_model
+
+from .transactions import atomic
+
+GRAM_LENGTH = 3
+
+
+def get_user_representation(user):
+    """ Return "First Last (email)" or just email of user """
+    name = '%s %s' % (user.first_name, user.last_name)
+    if name.strip():
+        return "%s (%s)" % (name, user.email)
+    else:
+        return user.email
+
+
+def get_grams(text):
+    """ Return set of all substrings of text up to GRAM_LENGTH long """
+    return set(text[start:start + length]
+               for length in range(1, GRAM_LENGTH + 1)
+               for start in range(len(text) - length + 1))
+
+
+def get_query_grams(word):
+    """ Return the smallest set of grams the word's users have to have """
+    length = min(len(word), GRAM_LENGTH)
+    return set(word[start:start + length]
+               for start in range(len(word) - length + 1))
+
+
+def index_users(users):
+    """ Replace index entries of users """
+    UserSearchEntry = get_model('asset_library', 'UserSearchEntry')
+    UserSearchGram = get_model('asset_library', 'UserSearchGram')
+    users = list(users)
+    pks = [user.pk for user in users]
+    with atomic():
+        UserSearchGram.objects.filter(user__in=pks).delete()
+        UserSearchEntry.objects.filter(user__in=pks).delete()
+        entries = []
+        grams = []
+        for user in users:
+            text = get_user_representation(user).lower()
+            entries.append(UserSearchEntry(user_id=user.pk, text=text))
+            grams += [UserSearchGram(user_id=user.pk, gram=gram)
+                      for gram in get_grams(text)]
+        UserSearchEntry.objects.bulk_create(entries)
+        UserSearchGram.objects.bulk_create(grams)
+
+
+def search_users(query, limit, exclude=None):
+    """ Return at most limit users matching every word of query
+
+    :param exclude: user left out from results, e.g. the one searching
+    """
+    User = get_model('auth', 'User')
+    UserSearchEntry = get_model('asset_library', 'UserSearchEntry')
+    UserSearchGram = get_model('asset_library', 'UserSearchGram')
+
+    entries = UserSearchEntry.objects.all()
+    for word in query.lower().split():
+        for gram in get_query_grams(word):
+            having_gram = UserSearchGram.objects.filter(gram=gram)
+            entries = entries.filter(user__in=having_gram.values('user'))
+        entries = entries.filter(text__contains=word)
+    if exclude is not None:
+        entries = entries.exclude(user=exclude)
+
+    pks = list(entries.values_list('user', flat=True)[:limit])
+    return User.objects.filter(pk__in=pks)
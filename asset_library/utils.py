@@ -1,15 +1,21 @@
+from collections import namedtuple
 from urlparse import urlparse, urljoin
 import base64
 import errno
+import hashlib
 import logging
+import math
 import os
 import shutil
 from uuid import uuid4
 
+from PIL import Image
 from sorl.thumbnail import get_thumbnail
 
 from django.conf import settings
+from django.core.urlresolvers import get_script_prefix, get_urlconf, reverse
 from django.db.models import get_model
+from django.db.models.fields.files import FieldFile
 from django.utils._os import safe_join
 
 ImageAsset = get_model('asset_library', 'ImageAsset')
@@ -17,6 +23,33 @@ Tag = get_model('asset_library', 'Tag')
 
 logger = logging.getLogger(__name__)
 
+ImageInfo = namedtuple('ImageInfo', 'format width height mode size')
+
+# Reversed in place of primary key to find where it goes in the URL
+PK_PLACEHOLDER = '8642097531'
+
+# {(urlconf, script prefix, URL name): (URL before pk, URL after pk)}
+_url_templates = {}
+
+# Leading bytes of files and their content types
+MAGIC_NUMBERS = [
+    ('\x89PNG\r\n\x1a\n', 'image/png'),
+    ('\xff\xd8\xff', 'image/jpeg'),
+    ('GIF87a', 'image/gif'),
+    ('GIF89a', 'image/gif'),
+    ('BM', 'image/bmp'),
+    ('II*\x00', 'image/tiff'),
+    ('MM\x00*', 'image/tiff'),
+    ('%PDF', 'application/pdf'),
+    ('PK\x03\x04', 'application/zip'),
+    # Compound document, i.e. DOC and XLS
+    ('\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/msword'),
+    ('{\\rtf', 'application/rtf'),
+    ('%!PS', 'application/postscript'),
+    ('\xc5\xd0\xd3\xc6', 'application/postscript'),
+]
+MAGIC_NUMBER_LENGTH = max(len(magic) for magic, __ in MAGIC_NUMBERS)
+
 
 def clean_images(image_urls, image_paths):
     """
@@ -57,7 +90,7 @@ def copy_media_file(file_relative_path, copy_filename):
     if not os.path.exists(new_dir):
         os.makedirs(new_dir)
 
-    shutil.copyfile(file_path, full_new_file_path)
+    link_or_copy(file_path, full_new_file_path)
 
     return rel_new_file_path
 
@@ -102,6 +135,11 @@ def create_copy_name(path):
     return os.path.join(file_dir, file_name)
 
 
+def create_job_id():
+    """ Return random identifier of a job, hard to guess """
+    return uuid4().hex
+
+
 def copy_to_campaign(filepath, destination):
     """ Copy file to campaign directory
 
@@ -125,12 +163,153 @@ def copy_to_campaign(filepath, destination):
             logger.exception("Failed to create a directory [%s]" % directory)
             raise
 
-    shutil.copyfile(filepath, final_destination)
+    link_or_copy(filepath, final_destination)
     return media_url
 
 
+def link_or_copy(source, destination):
+    """ Make file available under a new path
+
+    Hardlinks cost neither disk space nor I/O. Fall back to copying the file
+    when hardlinks are disabled by ASSET_CAMPAIGN_COPY_METHOD or not
+    supported by the filesystem (e.g. destination is on a different device).
+    Files are never modified in place (the image editor always creates
+    a new file) so the linked files can't get out of sync.
+    """
+    if settings.ASSET_CAMPAIGN_COPY_METHOD == 'link':
+        try:
+            os.link(source, destination)
+            return
+        except (OSError, AttributeError):
+            logger.debug("Can't link [%s], copying it" % source)
+    shutil.copyfile(source, destination)
+
+
+def file_checksum(file_obj):
+    """ Return SHA-256 hex digest of the contents of a file """
+    digest = hashlib.sha256()
+    for chunk in file_obj.chunks():
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def get_checksum(file_obj):
+    """ Return SHA-256 hex digest of file, computed by upload handler if
+    available, see uploadhandler.py """
+    if isinstance(file_obj, FieldFile):
+        file_obj = file_obj.file
+    checksum = getattr(file_obj, '_checksum', None)
+    if checksum is None:
+        checksum = file_checksum(file_obj)
+        file_obj._checksum = checksum
+    return checksum
+
+
+def sniff_content_type(header):
+    """ Guess content type from leading bytes of file """
+    for magic, content_type in MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return content_type
+    if header and '\x00' not in header:
+        return 'text/plain'
+    return 'application/octet-stream'
+
+
+def get_content_type(file_obj):
+    """ Return content type of file, sniffed by upload handler if available,
+    see uploadhandler.py """
+    if isinstance(file_obj, FieldFile):
+        file_obj = file_obj.file
+    content_type = getattr(file_obj, '_content_type', None)
+    if content_type is None:
+        file_obj.seek(0)
+        content_type = sniff_content_type(file_obj.read(MAGIC_NUMBER_LENGTH))
+        file_obj.seek(0)
+        file_obj._content_type = content_type
+    return content_type
+
+
+def find_duplicates(asset):
+    """ Return other assets of the creator with the same contents """
+    return type(asset).objects.filter(
+        creator=asset.creator, checksum=asset.checksum,
+    ).exclude(pk=asset.pk)
+
+
 def get_extension(filename):
     """ Return uppercased extension of file
     Example of transformation: 'image.jpg' => '.jpg' => 'jpg' """
     extension_with_dot = os.path.splitext(filename)[1]
     return extension_with_dot[1:].upper()
+
+
+def draft_image(image, size):
+    """ Let JPEG decoder scale the image down, but not below size
+
+    JPEG decoder can scale by 1/2, 1/4 or 1/8 while decoding, which is a
+    fraction of the work of decoding the whole image and resizing it. Other
+    formats and loaded images are left alone.
+
+    :param image: image opened by PIL, not loaded yet
+    :param size: (width, height) the image is going to be resized to
+    :returns: (x, y) factors the image was scaled by
+    """
+    width, height = image.size
+    requested = (int(math.ceil(size[0])), int(math.ceil(size[1])))
+    if image.format != 'JPEG' or \
+            requested[0] * 2 > width or requested[1] * 2 > height:
+        return 1.0, 1.0
+    image.draft(image.mode, requested)
+    return float(image.size[0]) / width, float(image.size[1]) / height
+
+
+def inspect_image(image):
+    """ Parse the image once and cache details about it on the file object
+
+    Uploaded images are checked by the form field, the model validator, the
+    model itself and the dimension fields. All of them ask for the details
+    here so the image is opened only once.
+
+    :param image: file object, uploaded file or FieldFile
+    :raises IOError: when the file is not a valid image
+    :returns: ImageInfo with uppercased format, dimensions, mode and size
+    """
+    # FieldFile wraps the uploaded file; cache on the uploaded file which
+    # forms and models share
+    if isinstance(image, FieldFile):
+        image = image.file
+
+    info = getattr(image, '_image_info', None)
+    if info is None:
+        try:
+            image.seek(0)
+            im = Image.open(image)
+            info = ImageInfo(im.format.upper(), im.size[0], im.size[1],
+                             im.mode, image.size)
+            # verify() must be called right after open()
+            im.verify()
+        except Exception:
+            raise IOError("Not an image")
+        finally:
+            image.seek(0)
+        image._image_info = info
+    return info
+
+
+def reverse_pk(name, pk):
+    """ Return URL of the name with the pk as the only argument
+
+    Same as reverse(name, args=[pk]) but the URL resolver is walked only once
+    per URL name, the URL is then formatted by the pk. """
+    key = (get_urlconf(), get_script_prefix(), name)
+    template = _url_templates.get(key)
+    if template is None:
+        url = reverse(name, args=[PK_PLACEHOLDER])
+        template = _url_templates[key] = tuple(url.split(PK_PLACEHOLDER, 1))
+    return '%s%s%s' % (template[0], pk, template[1])
+
+
+def clear_url_templates(**kwargs):
+    """ Forget reversed URLs, e.g. after URLconf changed in tests """
+    _url_templates.clear()
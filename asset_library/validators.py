@@ -1,10 +1,11 @@
 import os
-from PIL import Image
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils._os import safe_join
 
+from .utils import inspect_image
+
 
 def validate_file_extension(file_obj):
     """ File extension must be in ASSET_FILE_EXTENSIONS """
@@ -21,18 +22,10 @@ def validate_file_extension(file_obj):
 def validate_image_extension(image):
     """ Real image extension must be in ASSET_IMAGE_EXTENSIONS """
     try:
-        # PIL calls .read() on the image and by the nature, all following
-        # .read() return no data .seek(0) resets the state of reading so
-        # the validation doesn't change the status
-        image.seek(0)
-        im = Image.open(image)
+        ext = inspect_image(image).format
     except IOError:
         raise ValidationError("Not an image")
-    finally:
-        # Reset image again
-        image.seek(0)
 
-    ext = im.format.upper()
     # uppercase every extension in setting
     for extension in settings.ASSET_IMAGE_EXTENSIONS:
         if ext == extension.upper():
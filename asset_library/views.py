@@ -1,7 +1,7 @@
 from django.conf import settings
 from django.contrib import messages
 from django.core.urlresolvers import reverse_lazy, reverse
-from django.db.models import get_model, Count, Q
+from django.db.models import get_model, Q
 from django.http import HttpResponseRedirect
 from django.shortcuts import redirect, get_object_or_404
 from django.utils.translation import ugettext as _
@@ -9,6 +9,9 @@ from django.views.generic import ListView, CreateView, DetailView, \
     UpdateView, DeleteView, FormView, View
 
 from . import forms
+from .facets import get_tag_facets
+from .uploadhandler import HashingUploadViewMixin
+from .utils import find_duplicates
 
 User = get_model('auth', 'User')
 Tag = get_model('asset_library', 'Tag')
@@ -16,6 +19,7 @@ Asset = get_model('asset_library', 'Asset')
 ImageAsset = get_model('asset_library', 'ImageAsset')
 SnippetAsset = get_model('asset_library', 'SnippetAsset')
 FileAsset = get_model('asset_library', 'FileAsset')
+SharedAsset = get_model('asset_library', 'SharedAsset')
 
 
 #######################
@@ -51,11 +55,9 @@ class AssetListView(ListView):
 
         # All assets, not only paginated
         assets = self.form.apply_source(Asset.objects.all(), user)
-        # Related tags to those assets
-        tags = Tag.objects.filter(assets__pk__in=assets)
-        # Get usage count and order by names
-        ctx['tags'] = tags.annotate(count=Count('pk')).order_by('name')
-        ctx['untagged_count'] = assets.filter(tags=None).count()
+        # Related tags to those assets with usage count, ordered by names
+        ctx['tags'], ctx['untagged_count'] = get_tag_facets(
+            assets, self.form.cleaned_data.get('source'), user)
 
         # Asset types that can be used
         ctx['images_enabled'] = settings.ASSET_IMAGES
@@ -79,7 +81,7 @@ class AssetListView(ListView):
         return self.request.GET.get('paginateby', self.paginate_by)
 
 
-class AssetUploadFileView(View):
+class AssetUploadFileView(HashingUploadViewMixin, View):
 
     def get(self, request):
         messages.error(request, _("Missing file for file upload"))
@@ -103,6 +105,9 @@ class AssetUploadFileView(View):
                 name=file.name, creator=request.user, file=file)
 
         if asset:
+            if find_duplicates(asset).exists():
+                messages.warning(
+                    request, _("This file already exists in your library"))
             # Redirect to edit mode
             messages.info(
                 request, _("A new asset '%s' was created") % asset.name)
@@ -129,8 +134,12 @@ class AssetDetailView(DetailView):
     context_object_name = 'asset'
 
     def get_queryset(self):
+        """ Personal and global assets, and assets in inbox """
+        inbox = SharedAsset.objects.filter(shared_with=self.request.user)
         return self.model.objects.filter(
-            Q(creator=self.request.user, is_global=False) | Q(is_global=True))
+            Q(creator=self.request.user, is_global=False) |
+            Q(is_global=True) |
+            Q(pk__in=inbox.values('asset')))
 
 
 class AssetUpdateView(UpdateView):
@@ -225,10 +234,39 @@ class AssetShareView(FormView):
         return super(AssetShareView, self).form_valid(form)
 
 
+class AssetBulkShareView(FormView):
+    """ Share several assets with several users at once """
+    form_class = forms.BulkShareAssetForm
+    template_name = 'asset_library/library_share.html'
+    success_url = reverse_lazy('asset_library:library_list')
+
+    def get_form_kwargs(self):
+        """ Pass user object to form """
+        kwargs = super(AssetBulkShareView, self).get_form_kwargs()
+        kwargs['user'] = self.request.user
+        return kwargs
+
+    def form_valid(self, form):
+        """ Share the assets """
+        assets = form.cleaned_data['assets']
+        shared_with = form.cleaned_data['shared_with']
+        Asset.objects.bulk_share(assets, self.request.user, shared_with)
+
+        messages.info(
+            self.request,
+            _('%(assets)d assets were shared with %(users)d users') % {
+                'assets': len(assets), 'users': len(shared_with)})
+        return super(AssetBulkShareView, self).form_valid(form)
+
+
 class AssetAcceptView(View):
     def post(self, request, pk):
-        asset = get_object_or_404(Asset, pk=pk, creator=request.user)
-        asset.accept_shared()
+        shares = SharedAsset.objects.filter(asset=pk, shared_with=request.user)
+        if shares:
+            asset = shares[0].accept()
+        else:
+            asset = get_object_or_404(Asset, pk=pk, creator=request.user)
+            asset.accept_shared()
         messages.info(
             request,
             _("Shared asset '%s' was accepted") % asset.name)
@@ -237,11 +275,17 @@ class AssetAcceptView(View):
 
 class AssetRejectView(View):
     def post(self, request, pk):
-        asset = get_object_or_404(Asset, pk=pk, creator=request.user)
-        asset.reject_shared()
-        messages.info(
-            request,
-            _("Shared asset '%s' was rejected and deleted") % asset.name)
+        shares = SharedAsset.objects.filter(asset=pk, shared_with=request.user)
+        if shares:
+            # Reference mode, the asset itself stays with its owner
+            asset = shares[0].asset
+            shares[0].reject()
+            message = _("Shared asset '%s' was rejected")
+        else:
+            asset = get_object_or_404(Asset, pk=pk, creator=request.user)
+            asset.reject_shared()
+            message = _("Shared asset '%s' was rejected and deleted")
+        messages.info(request, message % asset.name)
         return HttpResponseRedirect(reverse('asset_library:library_list'))
 
 ####################
@@ -249,7 +293,7 @@ class AssetRejectView(View):
 ####################
 
 
-class ImageCreateView(AssetCreateView):
+class ImageCreateView(HashingUploadViewMixin, AssetCreateView):
     template_name = 'asset_library/image_create.html'
     model = ImageAsset
     form_class = forms.ImageAssetCreateForm
@@ -311,7 +355,7 @@ class SnippetShareView(AssetShareView):
 ####################
 
 
-class FileCreateView(AssetCreateView):
+class FileCreateView(HashingUploadViewMixin, AssetCreateView):
     template_name = 'asset_library/file_create.html'
     model = FileAsset
     form_class = forms.FileAssetCreateForm
@@ -76,3 +76,6 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.6/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Decode large JPEG images at reduced resolution for thumbnails
+THUMBNAIL_ENGINE = 'asset_library.engines.DraftEngine'
@@ -12,7 +12,7 @@ setup(
     long_description=open('README.rst').read(),
     packages=find_packages(exclude=["tests*", "sites*"]),
     install_requires=[
-        'django>=1.5,<1.7',
+        'django>=1.6,<1.7',
         'sorl-thumbnail>=11',
         'django-model-utils>=1.4.0',
     ],
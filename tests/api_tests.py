@@ -1,19 +1,28 @@
 from urllib import urlencode
 from urlparse import urljoin, urlparse
+from io import BytesIO
+import base64
+import hashlib
 import json
 import os
 import shutil
+import threading
 
 from PIL import Image
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
 from django.core.files.base import File
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
 from django.test.client import Client
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 
-from asset_library import models
+from asset_library import models, transformations, utils
+from asset_library.cache import get_asset_cache
+from asset_library.thumbnails import clear_preview_images
 from asset_library.utils import media_uri_to_path
 from tests.utils import create_user, get_fixture_path
 
@@ -76,6 +85,32 @@ class TestUserAutocompletion(TestCase):
         names = self.get_names("superuser")
         self.assertEqual(0, len(names))
 
+    def test_words_can_be_in_any_order(self):
+        names = self.get_names("lu pet")
+        self.assertEqual({"Peter Luke (pluke@example.com)"}, names)
+
+    def test_updates_index_on_save(self):
+        user = self.users[1]
+        user.first_name = 'Jack'
+        user.last_name = 'Black'
+        user.save()
+        self.assertEqual(set(), self.get_names("john"))
+        self.assertEqual({"Jack Black (jsmith@example.com)"},
+                         self.get_names("black"))
+
+    def test_limits_results_without_user_itself(self):
+        for i in range(12):
+            create_user(first_name="Super", last_name="Man%d" % i)
+        names = self.get_names("super")
+        self.assertEqual(10, len(names))
+
+    def test_number_of_queries_does_not_depend_on_users(self):
+        for i in range(12):
+            create_user(first_name="John", last_name="Doe%d" % i)
+        with self.assertNumQueries(4):
+            # Session, user, search and fetching found users
+            self.get_names("john d")
+
 
 class AssetResourceTestCase(TestCase):
     """
@@ -86,6 +121,8 @@ class AssetResourceTestCase(TestCase):
 
     def setUp(self):
         super(AssetResourceTestCase, self).setUp()
+        # Responses cached by previous tests
+        get_asset_cache().clear()
         self.user = self.create_user()
         self.client = Client()
 
@@ -181,6 +218,39 @@ class LogInMixin(object):
 class AssetTestsMixin(LogInMixin):
     """ Tests that are common for image, file and snippet assets """
 
+    def test_selects_fields(self):
+        self.generate_assets(['a'])
+        for fields in ('name', 'name,id', ' name , '):
+            asset = self.fetch_json(fields=fields)['objects'][0]
+            self.assertEqual({'id', 'name'}, set(asset.keys()))
+
+    def test_selected_fields_with_cursor(self):
+        self.generate_assets(['a', 'b', 'c'])
+        response = self.fetch_json(fields='name', sort_by='newest_first',
+                                   limit=2, cursor='')
+        names = [asset['name'] for asset in response['objects']]
+        response = self.fetch_json(fields='name', sort_by='newest_first',
+                                   limit=2, cursor=response['meta']['next'])
+        names += [asset['name'] for asset in response['objects']]
+        self.assertEqual(['c', 'b', 'a'], names)
+
+    @override_settings(ASSET_API_CACHE_TIMEOUT=None)
+    def test_selected_fields_with_cursor_use_one_query(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.fetch_json(fields='name', sort_by='newest_first',
+                                cursor='')
+            return len(queries)
+
+        self.generate_assets(['a'])
+        few = count_queries()
+        self.generate_assets(['b', 'c', 'd'])
+        self.assertEqual(few, count_queries())
+
+    def test_rejects_unknown_fields(self):
+        response = self.client.get(get_url(self.resource, fields='creator'))
+        self.assertEqual(400, response.status_code)
+
     def test_sort_by_name_case_insensitively(self):
         self.generate_assets(['b', 'A', 'a', 'c', 'B'])
         assets = self.fetch_names(sort_by='name')
@@ -295,6 +365,58 @@ class AssetTestsMixin(LogInMixin):
             offset = (page - 1) * LIMIT
             self.assertEqual(names[offset:offset+LIMIT], assets)
 
+    def fetch_all_by_cursor(self, **kwargs):
+        """ Walk through all pages using keyset pagination """
+        pages, cursor = [], ''
+        while cursor is not None:
+            response = self.fetch_json(cursor=cursor, **kwargs)
+            self.assertNotIn('num_pages', response['meta'])
+            pages.append([str(asset['name']) for asset in response['objects']])
+            cursor = response['meta']['next']
+        return pages
+
+    def test_cursor_paging(self):
+        names = ['b', 'A', 'a', 'c', 'B']
+        self.generate_assets(names)
+
+        pages = self.fetch_all_by_cursor(limit=2, sort_by='name')
+        self.assertEqual([['A', 'a'], ['b', 'B'], ['c']], pages)
+
+    def test_cursor_paging_by_date(self):
+        names = ["%02d" % i for i in range(7)]
+        self.generate_assets(names)
+
+        pages = self.fetch_all_by_cursor(limit=3, sort_by='oldest_first')
+        self.assertEqual(names, sum(pages, []))
+
+        pages = self.fetch_all_by_cursor(limit=3, sort_by='newest_first')
+        self.assertEqual(names[::-1], sum(pages, []))
+
+    def test_cursor_paging_backwards(self):
+        self.generate_assets(['b', 'A', 'a', 'c', 'B'])
+
+        first = self.fetch_json(cursor='', limit=2, sort_by='name')
+        self.assertEqual(None, first['meta']['prev'])
+        second = self.fetch_json(
+            cursor=first['meta']['next'], limit=2, sort_by='name')
+        third = self.fetch_json(
+            cursor=second['meta']['next'], limit=2, sort_by='name')
+        self.assertEqual(None, third['meta']['next'])
+
+        back = self.fetch_json(
+            cursor=third['meta']['prev'], limit=2, sort_by='name')
+        self.assertEqual(['b', 'B'], [a['name'] for a in back['objects']])
+        back = self.fetch_json(
+            cursor=back['meta']['prev'], limit=2, sort_by='name')
+        self.assertEqual(['A', 'a'], [a['name'] for a in back['objects']])
+        self.assertEqual(None, back['meta']['prev'])
+
+    def test_invalid_cursor(self):
+        self.generate_assets(['a'])
+        url = get_url(self.resource, cursor='not a cursor')
+        response = self.client.get(url)
+        self.assertEqual(400, response.status_code)
+
     def test_search(self):
         self.generate_assets(['car', 'parrot', 'plane'])
 
@@ -358,6 +480,83 @@ class UploadTestsMixin(object):
         self.assertEqual(1, len(self.fetch_names()))
         self.assertEqual([filename], self.fetch_names())
 
+    def test_upload_stores_checksum_and_content_type(self):
+        response = self.upload_file(self.test_file, destination='email/1/1')
+        asset = models.Asset.objects.get_subclass(pk=response['object']['id'])
+        with open(self.test_file) as fp:
+            checksum = hashlib.sha256(fp.read()).hexdigest()
+        self.assertEqual(checksum, asset.checksum)
+        self.assertEqual(self.content_type, asset.content_type)
+
+    def test_upload_is_hashed_while_streaming(self):
+        original_checksum = utils.file_checksum
+
+        def failing_checksum(file_obj):
+            raise AssertionError("File is read again")
+
+        utils.file_checksum = failing_checksum
+        try:
+            response = self.upload_file(
+                self.test_file, destination='email/1/1')
+        finally:
+            utils.file_checksum = original_checksum
+
+        asset = models.Asset.objects.get_subclass(pk=response['object']['id'])
+        self.assertEqual(64, len(asset.checksum))
+
+    def test_upload_reports_duplicates(self):
+        response1 = self.upload_file(self.test_file, destination='email/1/1')
+        self.assertEqual([], response1['duplicates'])
+
+        response2 = self.upload_file(self.test_file, destination='email/1/1')
+        self.assertEqual([response1['object']['id']], response2['duplicates'])
+
+    def upload_batch(self, filenames, **kwargs):
+        """ Upload several files at once and return response """
+        files = [open(filename) for filename in filenames]
+        try:
+            kwargs.update({'files': files})
+            response = self.client.post(get_url(self.resource), kwargs)
+        finally:
+            for fp in files:
+                fp.close()
+        self.assertEqual(200, response.status_code)
+        return json.loads(response.content)
+
+    def test_batch_upload(self):
+        filenames = [self.test_file, get_fixture_path('fake_image.jpg'),
+                     self.test_file]
+        response = self.upload_batch(
+            filenames, destination='email/1/1', tags='one, two')
+
+        results = response['results']
+        self.assertEqual(3, len(results))
+        self.assertIn('object', results[0])
+        self.assertIn('campaign_copy', results[0])
+        self.assertIn('errors', results[1])
+        self.assertEqual('fake_image.jpg', results[1]['name'])
+        self.assertIn('object', results[2])
+        self.assertEqual([results[0]['object']['id']],
+                         results[2]['duplicates'])
+
+        self.assertEqual(2, len(self.fetch_names()))
+        for result in (results[0], results[2]):
+            asset = models.Asset.objects.get(pk=result['object']['id'])
+            tags = sorted(tag.name for tag in asset.tags.all())
+            self.assertEqual(['one', 'two'], tags)
+
+    def test_batch_upload_stops_its_threads(self):
+        threads = threading.active_count()
+        self.upload_batch([self.test_file], destination='email/1/1')
+        self.assertEqual(threads, threading.active_count())
+
+    def test_batch_upload_requires_destination(self):
+        url = get_url(self.resource)
+        with open(self.test_file) as fp:
+            response = self.client.post(url, {'files': [fp]})
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(0, len(self.fetch_names()))
+
     def test_filter_extensions_are_case_insensitive(self):
         count = len(self.generate_assets(['test']))
 
@@ -427,6 +626,12 @@ class ResourceDetailMixin(LogInMixin):
             self.assertIn('object', response)
             self.assertEqual(name, response['object']['name'])
 
+    def test_selects_fields_of_details(self):
+        asset_id = self.generate_assets(['asset'])[0]
+        response = self.fetch_json(asset_id, fields='name,url')
+        self.assertEqual({'id', 'name', 'url'},
+                         set(response['object'].keys()))
+
     def test_destination_required_for_selection(self):
         asset_id = self.generate_assets(['asset'])[0]
         response = self.client.post(get_url(self.resource, asset_id))
@@ -518,6 +723,162 @@ class TestAPIAccessibility(AssetResourceTestCase):
             ['get', 'put', 'delete'], 'Image editor')
 
 
+class TestConditionalGet(LogInMixin, AssetResourceTestCase):
+    resource = 'snippets'
+
+    def create_asset(self):
+        return models.SnippetAsset(name="Generated Snippet")
+
+    def get(self, *args, **kwargs):
+        etag = kwargs.pop('etag', None)
+        url = get_url(self.resource, *args, **kwargs)
+        if etag:
+            return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        return self.client.get(url)
+
+    def assertNotModified(self, etag, *args, **kwargs):
+        response = self.get(etag=etag, *args, **kwargs)
+        self.assertEqual(304, response.status_code)
+
+    def assertModified(self, etag, *args, **kwargs):
+        response = self.get(etag=etag, *args, **kwargs)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+        return response['ETag']
+
+    def test_list_not_modified(self):
+        self.generate_assets(['a'])
+        etag = self.get()['ETag']
+        with self.assertNumQueries(2):
+            # Session and user only
+            self.assertNotModified(etag)
+        # Other parameters, other response
+        self.assertModified(etag, page=2)
+
+    def test_list_modified(self):
+        asset_id = self.generate_assets(['a'])[0]
+        etag = self.get()['ETag']
+
+        asset = models.SnippetAsset.objects.get(pk=asset_id)
+        asset.tags.add(models.Tag.objects.create(name='tag'))
+        etag = self.assertModified(etag)
+
+        asset.name = 'b'
+        asset.save()
+        etag = self.assertModified(etag)
+
+        asset.delete()
+        self.assertModified(etag)
+
+    def test_personal_assets_of_others_dont_modify_list(self):
+        etag = self.get()['ETag']
+        other = self.create_user('other')
+        self.generate_assets(['a'], creator=other)
+        self.assertNotModified(etag)
+        self.generate_assets(['b'], creator=other, is_global=True)
+        self.assertModified(etag)
+
+    @override_settings(ASSET_CACHE=None)
+    def test_no_etag_without_shared_cache(self):
+        self.generate_assets(['a'])
+        self.assertFalse(self.get().has_header('ETag'))
+
+    def test_tags_not_modified(self):
+        etag = self.client.get(get_url('tags'))['ETag']
+        self.assertEqual(304, self.client.get(
+            get_url('tags'), HTTP_IF_NONE_MATCH=etag).status_code)
+
+    def test_detail_not_modified(self):
+        self.resource = 'files'
+        test_file = File(open(get_fixture_path('TEST_FILE.txt')))
+        asset = models.FileAsset.objects.create(
+            name='file', file=test_file, creator=self.user)
+        etag = self.get(asset.pk)['ETag']
+        self.assertNotModified(etag, asset.pk)
+        asset.name = 'renamed'
+        asset.save()
+        self.assertModified(etag, asset.pk)
+
+
+class TestResponseCache(LogInMixin, AssetResourceTestCase):
+    resource = 'snippets'
+
+    def create_asset(self):
+        return models.SnippetAsset(name="Generated Snippet")
+
+    def test_cached(self):
+        self.generate_assets(['a', 'b'])
+        names = self.fetch_names()
+        with self.assertNumQueries(2):
+            # Session and user only
+            self.assertEqual(names, self.fetch_names())
+
+    def test_global_listing_shared_by_users(self):
+        other = self.create_user('other')
+        self.generate_assets(['a'], creator=other, is_global=True)
+        self.fetch_names(source='global')
+        self.client.logout()
+        self.client.login(username='other', password=self.PASSWORD)
+        with self.assertNumQueries(2):
+            self.assertEqual(['a'], self.fetch_names(source='global'))
+
+    def test_personal_listing_not_shared(self):
+        self.generate_assets(['a'])
+        self.assertEqual(['a'], self.fetch_names(source='personal'))
+        self.client.logout()
+        self.create_user('other')
+        self.client.login(username='other', password=self.PASSWORD)
+        self.assertEqual([], self.fetch_names(source='personal'))
+
+    def test_invalidated(self):
+        asset_id = self.generate_assets(['a'])[0]
+        self.assertEqual(['a'], self.fetch_names())
+        tag = models.Tag.objects.create(name='tag')
+        self.assertEqual([], self.fetch_names(tag=tag.pk))
+
+        asset = models.SnippetAsset.objects.get(pk=asset_id)
+        asset.tags.add(tag)
+        self.assertEqual(['a'], self.fetch_names(tag=tag.pk))
+        asset.name = 'b'
+        asset.save()
+        self.assertEqual(['b'], self.fetch_names())
+        asset.delete()
+        self.assertEqual([], self.fetch_names())
+
+    def test_global_listing_keeps_cache_on_personal_changes(self):
+        self.fetch_names(source='global')
+        self.generate_assets(['a'])
+        with self.assertNumQueries(2):
+            self.assertEqual([], self.fetch_names(source='global'))
+
+    def test_normalises_parameters(self):
+        self.generate_assets(['a'])
+        self.fetch_names(source='global', sort_by='name')
+        with self.assertNumQueries(2):
+            self.fetch_names(sort_by='name', source='global', search='')
+
+    def test_streams_large_pages(self):
+        self.generate_assets(['a', 'b'])
+        url = get_url(self.resource, limit=50)
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        data = json.loads(''.join(response.streaming_content))
+        self.assertEqual(['a', 'b'],
+                         [asset['name'] for asset in data['objects']])
+        # Cached once streamed
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(data, json.loads(response.content))
+
+    @override_settings(ASSET_API_CACHE_TIMEOUT=None)
+    def test_disabled(self):
+        self.generate_assets(['a'])
+        self.fetch_names()
+        asset = models.SnippetAsset.objects.get()
+        models.SnippetAsset.objects.filter(pk=asset.pk).update(name='b')
+        self.assertEqual(['b'], self.fetch_names())
+
+
 class TestTagAPI(LogInMixin, AssetResourceTestCase):
     resource = 'tags'
 
@@ -578,6 +939,7 @@ class ImagesApiTestCase(AssetTestsMixin, UploadTestsMixin,
                         AssetResourceTestCase):
     resource = 'images'
     extension = 'JpEg'
+    content_type = 'image/jpeg'
 
     def setUp(self):
         super(ImagesApiTestCase, self).setUp()
@@ -601,6 +963,20 @@ class ImagesApiTestCase(AssetTestsMixin, UploadTestsMixin,
         meta = self.fetch_json()['meta']
         self.assertEqual(set(['JPEG']), set(meta['extensions']))
 
+    def test_thumbnail_from_stored_url(self):
+        asset_id = self.generate_assets(['image'])[0]
+        models.ImageAsset.objects.filter(pk=asset_id).update(
+            thumbnail_url='/media/stored-thumbnail.jpeg')
+        image = self.fetch_json()['objects'][0]
+        self.assertEqual('/media/stored-thumbnail.jpeg', image['thumbnail'])
+
+    def test_thumbnail_without_stored_url(self):
+        asset_id = self.generate_assets(['image'])[0]
+        models.ImageAsset.objects.filter(pk=asset_id).update(
+            thumbnail_url='')
+        image = self.fetch_json()['objects'][0]
+        self.assertTrue(image['thumbnail'].startswith(settings.MEDIA_URL))
+
     def test_filter_by_extension(self):
         self.generate_assets(['image'])
         self.assertEqual(['image'], self.fetch_names(extension='JPEG'))
@@ -612,6 +988,18 @@ class ImagesApiTestCase(AssetTestsMixin, UploadTestsMixin,
         self.assertEqual(['image'], self.fetch_names(extension='JpEg'))
         self.assertEqual(['image'], self.fetch_names(extension='jpeg'))
 
+    @override_settings(ASSET_THUMBNAIL_MODE='queue')
+    def test_placeholder_until_thumbnail_is_generated(self):
+        self.generate_assets(['image'])
+        placeholder = staticfiles_storage.url(
+            settings.ASSET_IMAGE_THUMBNAIL_PLACEHOLDER)
+        image = self.fetch_json()['objects'][0]
+        self.assertEqual(placeholder, image['thumbnail'])
+
+        call_command('generate_asset_thumbnails', workers=0)
+        image = self.fetch_json()['objects'][0]
+        self.assertTrue(image['thumbnail'].startswith(settings.MEDIA_URL))
+
     def test_uploading_fake_image(self):
         filename = get_fixture_path('fake_image.jpg')
         url = get_url(self.resource)
@@ -650,6 +1038,7 @@ class FilesApiTestCase(AssetTestsMixin, UploadTestsMixin,
                        AssetResourceTestCase):
     resource = 'files'
     extension = 'TxT'
+    content_type = 'text/plain'
 
     def setUp(self):
         super(FilesApiTestCase, self).setUp()
@@ -729,6 +1118,21 @@ class SnippetsApiTestCase(AssetTestsMixin, AssetResourceTestCase):
             'date_modified'])
         self.assertEqual(expected, fields)
 
+    def test_doesnt_load_unselected_fields(self):
+        models.SnippetAsset.objects.create(
+            name='snippet', contents='long contents', creator=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            snippet = self.fetch_json(fields='name')['objects'][0]
+        self.assertEqual('snippet', snippet['name'])
+        self.assertFalse(any('contents' in query['sql']
+                             for query in queries))
+
+    def test_computes_selected_fields_only(self):
+        models.SnippetAsset.objects.create(
+            name='snippet', contents='contents', creator=self.user)
+        snippet = self.fetch_json(fields='length')['objects'][0]
+        self.assertEqual({'id': snippet['id'], 'length': 8}, snippet)
+
     def test_has_correct_length(self):
         test_strings = ['A', 'Sample string', 'A rather longer sample string']
         for string in test_strings:
@@ -762,6 +1166,7 @@ class TestImageEditor(LogInMixin, AssetResourceTestCase):
 
     def setUp(self):
         super(TestImageEditor, self).setUp()
+        clear_preview_images()
         test_file = get_fixture_path('TEST_IMAGE.jpeg')
         test_image = File(open(test_file))
         image = models.ImageAsset(name='New Image', image=test_image,
@@ -837,6 +1242,32 @@ class TestImageEditor(LogInMixin, AssetResourceTestCase):
         self.assertEqual(width, response['width'])
         self.assertEqual(height, response['height'])
 
+    def test_invalid_crop(self):
+        url = get_url('images', 'transformations')
+        for x2, y2 in ((10, 100), (100, 20)):
+            raw_response = self.client.post(url, {
+                'src': self.image_url,
+                'transformation': 'crop',
+                'x1': 10,
+                'y1': 20,
+                'x2': x2,
+                'y2': y2,
+            })
+            self.assertEqual(400, raw_response.status_code, (x2, y2))
+
+    def test_crop_is_clamped_to_image(self):
+        response = self.post_data({
+            'src': self.image_url,
+            'transformation': 'crop',
+            'x1': 10,
+            'y1': 20,
+            'x2': 100000,
+            'y2': 100000,
+        })
+        self.assertEqual(
+            (self.ORIG_WIDTH - 10, self.ORIG_HEIGHT - 20),
+            (response['width'], response['height']))
+
     def test_grayscale(self):
         response = self.post_data({
             'src': self.image_url,
@@ -882,3 +1313,251 @@ class TestImageEditor(LogInMixin, AssetResourceTestCase):
         self.assertEqual(self.ORIG_HEIGHT, height)
         self.assertEqual(width, response['width'])
         self.assertEqual(height, response['height'])
+
+    def test_pipeline(self):
+        before = set(os.listdir(os.path.dirname(
+            media_uri_to_path(self.image_url, absolute=True))))
+        response = self.post_data({
+            'src': self.image_url,
+            'operations': json.dumps([
+                {'name': 'crop', 'x1': 10, 'y1': 20, 'x2': 100, 'y2': 120},
+                {'name': 'rotate', 'angle': 90},
+                {'name': 'grayscale'},
+            ]),
+        })
+        image = Image.open(response['src'])
+        self.assertEqual((100, 90), image.size)
+        self.assertEqual('L', image.mode)
+        self.assertEqual('JPEG', image.format)
+        # No intermediate files
+        after = set(os.listdir(os.path.dirname(response['src'])))
+        self.assertEqual(1, len(after - before))
+
+    def test_resize_keeps_aspect_ratio(self):
+        response = self.post_data({
+            'src': self.image_url,
+            'transformation': 'resize',
+            'width': 115,
+        })
+        self.assertEqual((115, 109), (response['width'], response['height']))
+
+    def test_fit(self):
+        response = self.post_data({
+            'src': self.image_url,
+            'operations': json.dumps([
+                {'name': 'fit', 'width': 50, 'height': 100}]),
+        })
+        self.assertEqual((50, 100), Image.open(response['src']).size)
+
+    def test_output_options(self):
+        response = self.post_data({
+            'src': self.image_url,
+            'transformation': 'grayscale',
+            'quality': 50,
+            'progressive': True,
+        })
+        self.assertTrue(Image.open(response['src']).info.get('progressive'))
+
+    def test_invalid_operations(self):
+        url = get_url('images', 'transformations')
+        for operations in ('not json', '{}', '[{"name": "unicorns"}]',
+                           '[{"name": "rotate"}]',
+                           '[{"name": "fit", "width": 10}]',
+                           '[{"name": "resize", "width": 100000}]',
+                           '[{"name": "crop", "x1": 1000, "y1": 0, '
+                           '"x2": 10, "y2": 10}, '
+                           '{"name": "resize", "width": 100}]'):
+            raw_response = self.client.post(url, {
+                'src': self.image_url, 'operations': operations})
+            self.assertEqual(400, raw_response.status_code, operations)
+
+    def test_transformation_or_operations_required(self):
+        url = get_url('images', 'transformations')
+        raw_response = self.client.post(url, {'src': self.image_url})
+        self.assertEqual(400, raw_response.status_code)
+
+    def post_large_image(self, size, operations):
+        """ Post operations on JPEG image of size, return the response and
+        the images opened """
+        path = media_uri_to_path(self.image_url, absolute=True)
+        Image.new('RGB', size, 'red').save(path, 'JPEG')
+        opened = []
+        original_open = Image.open
+
+        def tracking_open(*args, **kwargs):
+            image = original_open(*args, **kwargs)
+            opened.append(image)
+            return image
+        Image.open = tracking_open
+        try:
+            response = self.post_data({
+                'src': self.image_url,
+                'operations': json.dumps(operations),
+            })
+        finally:
+            Image.open = original_open
+        return response, opened
+
+    def test_pipeline_decodes_large_image_at_reduced_resolution(self):
+        response, opened = self.post_large_image((2000, 1600), [
+            {'name': 'crop', 'x1': 0, 'y1': 0, 'x2': 1600, 'y2': 1600},
+            {'name': 'resize', 'width': 200},
+        ])
+        self.assertEqual((200, 200), (response['width'], response['height']))
+        self.assertEqual((250, 200), opened[0].size)
+
+    def test_pipeline_decodes_rotated_image_at_reduced_resolution(self):
+        response, opened = self.post_large_image((1000, 2000), [
+            {'name': 'rotate', 'angle': 90},
+            {'name': 'resize', 'width': 500},
+        ])
+        self.assertEqual((500, 250), (response['width'], response['height']))
+        self.assertEqual((250, 500), opened[0].size)
+
+    def test_rotate_keeps_whole_image(self):
+        response = self.post_data({
+            'src': self.image_url,
+            'transformation': 'rotate',
+            'angle': 45,
+        })
+        self.assertGreater(response['width'], self.ORIG_WIDTH)
+        self.assertGreater(response['height'], self.ORIG_HEIGHT)
+
+    def post_preview(self, data):
+        data = dict(data, src=self.image_url, preview=True)
+        response = self.post_data(data, absolute_src=False)
+        self.assertTrue(response['preview'])
+        prefix, encoded = response['src'].split(',', 1)
+        self.assertEqual('data:image/jpeg;base64', prefix)
+        image = Image.open(BytesIO(base64.b64decode(encoded)))
+        self.assertEqual((response['width'], response['height']), image.size)
+        return response
+
+    def test_preview_is_not_written(self):
+        directory = os.path.dirname(
+            media_uri_to_path(self.image_url, absolute=True))
+        files = os.listdir(directory)
+        response = self.post_preview({'transformation': 'grayscale'})
+        self.assertEqual(files, os.listdir(directory))
+        self.assertEqual((self.ORIG_WIDTH, self.ORIG_HEIGHT),
+                         (response['width'], response['height']))
+
+    def test_preview_scales_operations_to_proxy(self):
+        with self.settings(ASSET_IMAGE_EDITOR_PREVIEW_SIZE=115):
+            response = self.post_preview({
+                'operations': json.dumps([
+                    {'name': 'crop', 'x1': 10, 'y1': 20,
+                     'x2': 110, 'y2': 120},
+                    {'name': 'resize', 'width': 80},
+                ]),
+            })
+        self.assertEqual((40, 40), (response['width'], response['height']))
+
+    def test_preview_reuses_proxy(self):
+        path = media_uri_to_path(self.image_url, absolute=True)
+        opened = []
+        original_open = Image.open
+
+        def tracking_open(fp, *args, **kwargs):
+            if fp == path:
+                opened.append(fp)
+            return original_open(fp, *args, **kwargs)
+        Image.open = tracking_open
+        try:
+            self.post_preview({'transformation': 'grayscale'})
+            self.post_preview({'transformation': 'rotate', 'angle': 90})
+            self.assertEqual(1, len(opened))
+
+            # Changed image gets new proxy
+            mtime = os.path.getmtime(path) + 10
+            os.utime(path, (mtime, mtime))
+            self.post_preview({'transformation': 'grayscale'})
+            self.assertEqual(2, len(opened))
+        finally:
+            Image.open = original_open
+
+    def test_identical_edit_reuses_result(self):
+        data = {'src': self.image_url, 'transformation': 'rotate',
+                'angle': 90}
+        first = self.post_data(data)
+        directory = os.path.dirname(first['src'])
+        files = os.listdir(directory)
+        second = self.post_data(data)
+        self.assertEqual(first, second)
+        self.assertEqual(files, os.listdir(directory))
+
+        other = self.post_data(dict(data, angle=180))
+        self.assertNotEqual(first['src'], other['src'])
+
+    def test_deleted_result_is_written_again(self):
+        data = {'src': self.image_url, 'transformation': 'grayscale'}
+        first = self.post_data(data)
+        os.remove(first['src'])
+        second = self.post_data(data)
+        self.assertNotEqual(first['src'], second['src'])
+        self.assertTrue(os.path.exists(second['src']))
+
+    @override_settings(ASSET_TRANSFORMATION_CACHE_SIZE=0)
+    def test_disabled_result_cache(self):
+        data = {'src': self.image_url, 'transformation': 'grayscale'}
+        first = self.post_data(data)
+        second = self.post_data(data)
+        self.assertNotEqual(first['src'], second['src'])
+        self.assertFalse(models.TransformationResult.objects.exists())
+
+    def post_background(self, data, status_code=202):
+        url = get_url('images', 'transformations')
+        raw_response = self.client.post(url, dict(data, background=True))
+        self.assertEqual(status_code, raw_response.status_code)
+        return raw_response
+
+    @override_settings(ASSET_IMAGE_EDITOR_WORKERS=0)
+    def test_background_edit_reports_result(self):
+        job = json.loads(self.post_background({
+            'src': self.image_url, 'transformation': 'grayscale'}).content)
+        self.assertEqual('done', job['status'])
+        self.assertEqual(100, job['progress'])
+        self.assertEqual((self.ORIG_WIDTH, self.ORIG_HEIGHT),
+                         (job['width'], job['height']))
+        self.assertTrue(os.path.exists(
+            media_uri_to_path(job['src'], absolute=True)))
+
+        raw_response = self.client.get(job['url'])
+        self.assertEqual(200, raw_response.status_code)
+        self.assertEqual(job, json.loads(raw_response.content))
+
+        # Jobs lost by the web process fail after a while
+        models.TransformationJob.objects.filter(pk=job['id']).update(
+            status=models.TransformationJob.RUNNING)
+        with override_settings(ASSET_IMAGE_EDITOR_JOB_TIMEOUT=-1):
+            stale = json.loads(self.client.get(job['url']).content)
+        self.assertEqual('failed', stale['status'])
+
+        # Jobs are visible only to their creators
+        self.user = self.create_user('other-user')
+        self.login()
+        self.assertEqual(404, self.client.get(job['url']).status_code)
+
+    @override_settings(ASSET_IMAGE_EDITOR_WORKERS=0)
+    def test_background_edit_reports_failure(self):
+        path = media_uri_to_path(self.image_url, absolute=True)
+        with open(path, 'wb') as f:
+            f.write('not an image')
+        job = json.loads(self.post_background({
+            'src': self.image_url, 'transformation': 'grayscale'}).content)
+        self.assertEqual('failed', job['status'])
+        self.assertTrue(job['error'])
+        self.assertNotIn('src', job)
+
+    @override_settings(ASSET_IMAGE_EDITOR_WORKERS=1,
+                       ASSET_IMAGE_EDITOR_QUEUE_SIZE=2)
+    def test_full_queue_refuses_background_edit(self):
+        pending = transformations._pending
+        transformations._pending = 3
+        try:
+            raw_response = self.post_background({
+                'src': self.image_url, 'transformation': 'grayscale'}, 429)
+        finally:
+            transformations._pending = pending
+        self.assertIn('Retry-After', raw_response)
+        self.assertFalse(models.TransformationJob.objects.exists())
@@ -0,0 +1,103 @@
+import time
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase, TransactionTestCase
+
+from asset_library import thumbnails, utils
+from asset_library.cache import GLOBAL_SCOPE, LRUCache, get_versions, \
+    invalidate_assets
+from asset_library.transactions import atomic
+from .utils import create_snippet_asset
+
+
+class TestLRUCache(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(3, cache.get('c'))
+
+    def test_expires(self):
+        cache = LRUCache(2, ttl=0.01)
+        cache.set('a', 1)
+        time.sleep(0.02)
+        self.assertEqual('default', cache.get('a', 'default'))
+
+
+class TestFileIconUrl(TestCase):
+    def setUp(self):
+        self.find_file_icon = thumbnails.find_file_icon
+        thumbnails.clear_file_icon_urls()
+
+    def tearDown(self):
+        thumbnails.find_file_icon = self.find_file_icon
+        thumbnails.clear_file_icon_urls()
+
+    def count_lookups(self):
+        """ Count calls of find_file_icon() """
+        find_file_icon = self.find_file_icon
+        self.lookups = []
+
+        def counting_find_file_icon(extension):
+            self.lookups.append(extension)
+            return find_file_icon(extension)
+        thumbnails.find_file_icon = counting_find_file_icon
+
+    def test_finds_icon_of_extension(self):
+        self.assertTrue(thumbnails.get_file_icon_url('PDF').endswith(
+            'asset_library/file_icons/pdf.png'))
+        self.assertTrue(thumbnails.get_file_icon_url('XYZ').endswith(
+            'asset_library/file_icons/default.png'))
+
+    def test_looks_up_icon_once(self):
+        self.count_lookups()
+        url = thumbnails.get_file_icon_url('PDF')
+        self.assertEqual(url, thumbnails.get_file_icon_url('pdf'))
+        self.assertEqual(['PDF'], self.lookups)
+
+
+class TestReversePk(TestCase):
+    def test_same_as_reverse(self):
+        for name in ('asset_library:snippet_detail',
+                     'asset_library:image_api_detail'):
+            for pk in (1, 8642, 1234567):
+                self.assertEqual(reverse(name, args=[pk]),
+                                 utils.reverse_pk(name, pk))
+
+    def test_asset_urls(self):
+        asset = create_snippet_asset()
+        self.assertEqual(
+            reverse('asset_library:snippet_share', args=[asset.pk]),
+            asset.get_share_url())
+
+    def test_reverses_once(self):
+        utils.clear_url_templates()
+        original_reverse = utils.reverse
+        calls = []
+
+        def counting_reverse(*args, **kwargs):
+            calls.append(args)
+            return original_reverse(*args, **kwargs)
+        utils.reverse = counting_reverse
+        try:
+            for pk in range(5):
+                utils.reverse_pk('asset_library:file_detail', pk)
+        finally:
+            utils.reverse = original_reverse
+        self.assertEqual(1, len(calls))
+
+
+class TestVersionsOfTransaction(TransactionTestCase):
+    def test_bumped_again_after_commit(self):
+        asset = create_snippet_asset()
+        asset.is_global = True
+        with atomic():
+            invalidate_assets([asset])
+            # Read by a request which doesn't see the changes yet
+            seen = get_versions([GLOBAL_SCOPE])
+        self.assertNotEqual(seen, get_versions([GLOBAL_SCOPE]))
@@ -4,6 +4,22 @@ from django.conf import settings
 from asset_library.defaults import *
 asset_library_settings = {
     k: v for k, v in locals().items() if k.startswith('ASSET_')}
+# Tests run in one process, the local memory cache is shared by all of them
+asset_library_settings['ASSET_CACHE'] = 'default'
+
+
+def clear_caches(**kwargs):
+    """ Forget values cached in memory by asset library, setting_changed
+    receiver
+
+    Icon URLs depend on static files settings, reversed URLs on URLconf,
+    proxies on their size. """
+    from asset_library.thumbnails import clear_file_icon_urls, \
+        clear_preview_images
+    from asset_library.utils import clear_url_templates
+    clear_url_templates()
+    clear_file_icon_urls()
+    clear_preview_images()
 
 
 def configure():
@@ -40,7 +56,11 @@ def configure():
             MEDIA_ROOT=location('media'),
             ROOT_URLCONF='tests.urls',
             FIXTURE_DIRS=(location('fixtures'), ),
+            THUMBNAIL_ENGINE='asset_library.engines.DraftEngine',
             **asset_library_settings
         )
 
         settings.ASSET_FILE_EXTENSIONS += ['TXT']
+
+        from django.test.signals import setting_changed
+        setting_changed.connect(clear_caches)
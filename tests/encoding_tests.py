@@ -0,0 +1,54 @@
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from asset_library import encoding
+
+
+def broken_dumps(data):
+    raise TypeError("Not serializable")
+
+
+class TestFormatValue(TestCase):
+    def test_formats_like_django(self):
+        values = [
+            datetime.datetime(2014, 5, 6, 7, 8, 9),
+            datetime.datetime(2014, 5, 6, 7, 8, 9, 123456),
+            datetime.datetime(2014, 5, 6, 7, 8, 9, tzinfo=timezone.utc),
+            datetime.date(2014, 5, 6),
+        ]
+        for value in values:
+            self.assertEqual(
+                json.dumps(value, cls=DjangoJSONEncoder),
+                json.dumps(encoding.format_value(value)))
+
+    def test_keeps_other_values(self):
+        for value in (1, u'name', None, [1]):
+            self.assertEqual(value, encoding.format_value(value))
+
+
+class TestDumps(TestCase):
+    @override_settings(ASSET_JSON_DUMPS='json.dumps')
+    def test_configurable(self):
+        self.assertEqual('{"a": 1}', encoding.dumps({'a': 1}))
+
+    @override_settings(ASSET_JSON_DUMPS='tests.encoding_tests.broken_dumps')
+    def test_falls_back_to_django_encoder(self):
+        value = datetime.date(2014, 5, 6)
+        self.assertEqual('{"date": "2014-05-06"}',
+                         encoding.dumps({'date': value}))
+
+    def test_iter_json(self):
+        for objects in ([], [{'id': 1}, {'id': 2}]):
+            data = {'meta': {'page': 1}, 'objects': objects}
+            chunks = encoding.iter_json(
+                {'meta': {'page': 1}, 'objects': iter(objects)})
+            self.assertEqual(data, json.loads(''.join(chunks)))
+
+    def test_iter_json_of_objects_only(self):
+        chunks = encoding.iter_json({'objects': [1, 2]})
+        self.assertEqual({'objects': [1, 2]}, json.loads(''.join(chunks)))
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+
+from PIL import Image
+from sorl.thumbnail.base import ThumbnailBackend
+
+from django.test import TestCase
+
+from asset_library.engines import DraftEngine
+from asset_library.utils import draft_image
+
+
+class DraftTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'large.jpeg')
+        Image.new('RGB', (2000, 1600), 'red').save(self.path, 'JPEG')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+class TestDraftImage(DraftTestCase):
+    def test_decodes_reduced_resolution(self):
+        image = Image.open(self.path)
+        self.assertEqual((0.125, 0.125), draft_image(image, (200, 150)))
+        self.assertEqual((250, 200), image.size)
+        self.assertEqual((250, 200), image.load() and image.size)
+
+    def test_keeps_requested_size(self):
+        image = Image.open(self.path)
+        draft_image(image, (600, 500))
+        self.assertEqual((1000, 800), image.size)
+
+    def test_keeps_small_reduction(self):
+        image = Image.open(self.path)
+        self.assertEqual((1.0, 1.0), draft_image(image, (1500, 1200)))
+        self.assertEqual((2000, 1600), image.size)
+
+    def test_ignores_other_formats(self):
+        path = os.path.join(self.directory, 'large.png')
+        Image.new('RGB', (2000, 1600), 'red').save(path, 'PNG')
+        image = Image.open(path)
+        self.assertEqual((1.0, 1.0), draft_image(image, (200, 150)))
+
+
+class TestDraftEngine(DraftTestCase):
+    def create(self, geometry, crop):
+        image = Image.open(self.path)
+        # Options of get_thumbnail(), they differ by versions of sorl
+        options = dict(ThumbnailBackend.default_options, crop=crop,
+                       upscale=False, orientation=True)
+        thumbnail = DraftEngine().create(image, geometry, options)
+        return image, thumbnail
+
+    def test_scales_from_draft(self):
+        image, thumbnail = self.create((200, 200), False)
+        self.assertEqual((250, 200), image.size)
+        self.assertEqual((200, 160), thumbnail.size)
+
+    def test_crop_needs_larger_draft(self):
+        image, thumbnail = self.create((200, 200), 'center')
+        self.assertEqual((250, 200), image.size)
+        self.assertEqual((200, 200), thumbnail.size)
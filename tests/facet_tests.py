@@ -0,0 +1,99 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from asset_library import models
+from asset_library.cache import get_asset_cache
+from asset_library.facets import get_tag_facets
+from asset_library.forms import FilterAssetsForm
+from .utils import create_snippet_asset, create_user
+
+
+class TestTagFacets(TestCase):
+    def setUp(self):
+        get_asset_cache().clear()
+        self.user = create_user()
+        self.other = create_user(name='other')
+        self.red = models.Tag.objects.create(name='red')
+        self.blue = models.Tag.objects.create(name='blue')
+
+    def get_facets(self, source='', user=None):
+        user = user or self.user
+        form = FilterAssetsForm({'source': source})
+        self.assertTrue(form.is_valid())
+        assets = form.apply_source(models.Asset.objects.all(), user)
+        tags, untagged_count = get_tag_facets(assets, source, user)
+        return [(tag.name, tag.count) for tag in tags], untagged_count
+
+    def test_counts_tags_of_listing(self):
+        asset = create_snippet_asset(creator=self.user)
+        asset.tags = [self.red, self.blue]
+        create_snippet_asset(creator=self.user)
+        other_asset = create_snippet_asset(creator=self.other)
+        other_asset.tags = [self.red]
+        global_asset = create_snippet_asset(creator=self.other)
+        global_asset.is_global = True
+        global_asset.save()
+        global_asset.tags = [self.red]
+
+        self.assertEqual(([('blue', 1), ('red', 2)], 1), self.get_facets())
+        self.assertEqual(([('blue', 1), ('red', 1)], 1),
+                         self.get_facets('personal'))
+        self.assertEqual(([('red', 1)], 0), self.get_facets('global'))
+
+    def test_cached(self):
+        create_snippet_asset(creator=self.user).tags = [self.red]
+        facets = self.get_facets()
+        with self.assertNumQueries(0):
+            self.assertEqual(facets, self.get_facets())
+
+    def test_invalidated_by_new_asset(self):
+        self.assertEqual(([], 0), self.get_facets())
+        create_snippet_asset(creator=self.user)
+        self.assertEqual(([], 1), self.get_facets())
+
+    def test_invalidated_by_tags_change(self):
+        asset = create_snippet_asset(creator=self.user)
+        self.get_facets()
+        asset.tags.add(self.red)
+        self.assertEqual(([('red', 1)], 0), self.get_facets())
+        self.red.assets.remove(asset)
+        self.assertEqual(([], 1), self.get_facets())
+
+    def test_invalidated_by_deletion(self):
+        asset = create_snippet_asset(creator=self.user)
+        asset.tags = [self.red]
+        self.get_facets()
+        self.red.delete()
+        self.assertEqual(([], 1), self.get_facets())
+        asset.delete()
+        self.assertEqual(([], 0), self.get_facets())
+
+    def test_invalidated_by_moving_to_global(self):
+        asset = create_snippet_asset(creator=self.other)
+        asset.tags = [self.red]
+        self.assertEqual(([], 0), self.get_facets('global'))
+        asset.is_global = True
+        asset.save()
+        self.assertEqual(([('red', 1)], 0), self.get_facets('global'))
+
+    def test_other_users_keep_cache(self):
+        create_snippet_asset(creator=self.other)
+        self.get_facets(user=self.other)
+        create_snippet_asset(creator=self.user)
+        with self.assertNumQueries(0):
+            self.get_facets(user=self.other)
+
+    def test_invalidated_by_bulk_share(self):
+        asset = create_snippet_asset(creator=self.user)
+        asset.tags = [self.red]
+        self.assertEqual(([], 0), self.get_facets('inbox', self.other))
+        models.Asset.objects.bulk_share([asset], self.user, [self.other])
+        self.assertEqual(([('red', 1)], 0),
+                         self.get_facets('inbox', self.other))
+
+    @override_settings(ASSET_CACHE=None)
+    def test_counted_without_shared_cache(self):
+        create_snippet_asset(creator=self.user)
+        self.get_facets()
+        with self.assertNumQueries(2):
+            self.get_facets()
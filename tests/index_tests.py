@@ -0,0 +1,41 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from asset_library import models
+from asset_library.forms import FilterAPIForm
+from asset_library.indexes import explain
+from .utils import create_user
+
+
+@skipUnless(connection.vendor == 'sqlite', "Checks SQLite query plans")
+class TestListingQueryPlans(TestCase):
+    def setUp(self):
+        self.user = create_user()
+
+    def get_plan(self, **data):
+        form = FilterAPIForm(data)
+        self.assertTrue(form.is_valid())
+        queryset = form.get_queryset(self.user, models.Asset.objects.all())
+        return '\n'.join(explain(queryset))
+
+    def assertUsesIndex(self, plan):
+        self.assertIn('USING INDEX', plan)
+        self.assertNotIn('SCAN TABLE asset_library_asset', plan)
+        # Rows are read in the order of the index
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_personal_assets_by_name(self):
+        self.assertUsesIndex(self.get_plan(source='personal', sort_by='name'))
+
+    def test_personal_assets_by_date(self):
+        self.assertUsesIndex(
+            self.get_plan(source='personal', sort_by='newest_first'))
+
+    def test_global_assets_by_name(self):
+        self.assertUsesIndex(self.get_plan(source='global', sort_by='name'))
+
+    def test_global_assets_by_date(self):
+        self.assertUsesIndex(
+            self.get_plan(source='global', sort_by='oldest_first'))
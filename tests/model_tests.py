@@ -1,13 +1,20 @@
 import os
 import shutil
 
+from PIL import Image
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.files.base import File
-from django.test import TestCase
-
-from asset_library import models
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from asset_library import models, thumbnails
+from asset_library.forms import FilterAssetsForm
+from asset_library.transactions import atomic
+from asset_library.utils import thumbnail
 from .utils import create_asset, create_image_asset, create_file_asset, \
     create_snippet_asset, clean_media, create_user, get_fixture_path
 
@@ -92,6 +99,160 @@ class TestSnippetAssetSharing(TestAssetSharing):
         return create_snippet_asset(*args, **kwargs)
 
 
+class TestBulkSharing(TestCase):
+    def setUp(self):
+        self.shared_by = create_user()
+        self.recipients = [create_user(), create_user()]
+        self.tags = [models.Tag.objects.create(name=name)
+                     for name in ('a', 'b')]
+
+    def tearDown(self):
+        clean_media()
+
+    def create_assets(self):
+        assets = [
+            create_image_asset(creator=self.shared_by),
+            create_file_asset(creator=self.shared_by),
+            create_snippet_asset(creator=self.shared_by),
+        ]
+        for asset in assets:
+            asset.tags = self.tags
+        return assets
+
+    def bulk_share(self, assets):
+        return models.Asset.objects.bulk_share(
+            assets, self.shared_by, self.recipients)
+
+    def test_copies_assets_to_every_recipient(self):
+        assets = self.create_assets()
+        pks = self.bulk_share(assets)
+        self.assertEqual(6, len(pks))
+
+        copies = models.Asset.objects.filter(pk__in=pks).select_subclasses()
+        for asset in assets:
+            same = [copy for copy in copies if type(copy) is type(asset)]
+            self.assertEqual(set(self.recipients),
+                             set(copy.creator for copy in same))
+            for copy in same:
+                self.assertEqual(self.shared_by, copy.shared_by)
+                self.assertEqual(asset.name, copy.name)
+                self.assertEqual(['a', 'b'],
+                                 [tag.name for tag in copy.tags.all()])
+
+        image_copy = [c for c in copies if isinstance(c, models.ImageAsset)][0]
+        self.assertEqual(assets[0].image.name, image_copy.image.name)
+        self.assertEqual(assets[0].width, image_copy.width)
+        snippet_copy = [c for c in copies
+                        if isinstance(c, models.SnippetAsset)][0]
+        self.assertEqual(assets[2].contents, snippet_copy.contents)
+
+    def test_copies_keep_their_recipients(self):
+        assets = self.create_assets()
+        pks = self.bulk_share(assets)
+
+        copies = models.Asset.objects.in_bulk(pks)
+        expected = [(asset.name, user) for asset in assets
+                    for user in self.recipients]
+        self.assertEqual(expected, [(copies[pk].name, copies[pk].creator)
+                                    for pk in pks])
+        # Keys of the copies aren't given to assets saved later
+        later = create_snippet_asset(creator=self.shared_by)
+        self.assertGreater(later.pk, max(pks))
+
+    def test_number_of_queries_does_not_grow(self):
+        few_assets = self.create_assets()
+        many_assets = self.create_assets() + self.create_assets()
+        with CaptureQueriesContext(connection) as few:
+            self.bulk_share(few_assets)
+        with CaptureQueriesContext(connection) as many:
+            self.bulk_share(many_assets)
+        self.assertEqual(len(few), len(many))
+
+    def test_shares_nothing(self):
+        self.assertEqual([], self.bulk_share([]))
+
+
+@override_settings(ASSET_SHARING_MODE='reference')
+class TestReferenceSharing(TestCase):
+    def setUp(self):
+        self.shared_by = create_user()
+        self.shared_with = create_user()
+        self.asset = create_snippet_asset(creator=self.shared_by)
+
+    def get_inbox(self):
+        form = FilterAssetsForm({'source': FilterAssetsForm.INBOX})
+        self.assertTrue(form.is_valid())
+        return list(form.get_queryset(self.shared_with))
+
+    def test_does_not_copy_asset(self):
+        self.asset.share(self.shared_by, self.shared_with)
+        self.assertEqual(1, models.Asset.objects.count())
+        self.assertEqual([self.asset], self.get_inbox())
+
+    def test_sharing_again_keeps_one_reference(self):
+        self.asset.share(self.shared_by, self.shared_with)
+        self.asset.share(self.shared_by, self.shared_with)
+        self.assertEqual(1, models.SharedAsset.objects.count())
+
+    def test_accepting_copies_asset(self):
+        share = self.asset.share(self.shared_by, self.shared_with)
+        copy = share.accept()
+        self.assertEqual([], self.get_inbox())
+        self.assertEqual(self.shared_with, copy.creator)
+        self.assertEqual(None, copy.shared_by)
+        self.assertEqual(self.asset.contents, copy.contents)
+
+    def test_rejecting_keeps_original(self):
+        share = self.asset.share(self.shared_by, self.shared_with)
+        share.reject()
+        self.assertEqual([], self.get_inbox())
+        self.assertEqual(1, models.Asset.objects.count())
+
+    def test_bulk_share(self):
+        other = create_snippet_asset(creator=self.shared_by)
+        pks = models.Asset.objects.bulk_share(
+            [self.asset, other], self.shared_by, [self.shared_with])
+        self.assertEqual(2, len(pks))
+        self.assertEqual(2, models.Asset.objects.count())
+        self.assertEqual(set([self.asset, other]), set(self.get_inbox()))
+
+
+class TestTags(TestCase):
+    def setUp(self):
+        self.asset = create_snippet_asset()
+
+    def test_get_or_create_many(self):
+        models.Tag.objects.create(name='red')
+        tags = models.Tag.objects.get_or_create_many(
+            ['blue', ' red', '', 'blue', 'green '])
+        self.assertEqual(['blue', 'red', 'green'],
+                         [tag.name for tag in tags])
+        self.assertTrue(all(tag.pk for tag in tags))
+        self.assertEqual(3, models.Tag.objects.count())
+
+    def test_get_or_create_many_takes_constant_queries(self):
+        def count_queries(names):
+            with CaptureQueriesContext(connection) as queries:
+                models.Tag.objects.get_or_create_many(names)
+            return len(queries)
+
+        few = count_queries(['a0', 'b0', 'c0'])
+        many = count_queries(['a0'] + ['tag%d' % i for i in range(20)])
+        self.assertEqual(few, many)
+
+    def test_set_tags_writes_only_changes(self):
+        red, blue, green = models.Tag.objects.get_or_create_many(
+            ['red', 'blue', 'green'])
+        self.asset.set_tags([red, blue])
+        AssetTag = models.Asset.tags.through
+        kept = AssetTag.objects.get(asset=self.asset, tag=red)
+
+        self.asset.set_tags([red, green])
+        self.assertEqual(['green', 'red'], sorted(
+            tag.name for tag in self.asset.tags.all()))
+        self.assertTrue(AssetTag.objects.filter(pk=kept.pk).exists())
+
+
 class ImageAssetModel(TestCase):
     def setUp(self):
         super(ImageAssetModel, self).setUp()
@@ -131,6 +292,39 @@ class ImageAssetModel(TestCase):
         self.assertEqual(HEIGHT, image.image.height)
         self.assertEqual(SIZE, image.image.size)
 
+    def test_stores_thumbnail_url(self):
+        asset = models.ImageAsset(name='test', image=self.image,
+                                  creator=self.user)
+        asset.save()
+
+        image = models.ImageAsset.objects.get(pk=asset.pk)
+        size = settings.ASSET_IMAGE_THUMBNAIL_SIZE
+        expected_url = thumbnail(image.image.name, size).url
+        self.assertEqual(expected_url, image.thumbnail_url)
+
+    @override_settings(ASSET_THUMBNAIL_MODE='queue')
+    def test_image_is_opened_once(self):
+        original_open = Image.open
+        opened = []
+
+        def counting_open(*args, **kwargs):
+            opened.append(args)
+            return original_open(*args, **kwargs)
+
+        Image.open = counting_open
+        try:
+            asset = models.ImageAsset(name='test', image=self.image,
+                                      creator=self.user)
+            asset.populate_fields()
+            asset.full_clean()
+            asset.save()
+        finally:
+            Image.open = original_open
+
+        self.assertEqual(1, len(opened))
+        self.assertEqual((230, 219), (asset.width, asset.height))
+        self.assertEqual('JPEG', asset.extension)
+
     def test_accept_only_allowed_exceptions(self):
         old_settting = settings.ASSET_IMAGE_EXTENSIONS
 
@@ -173,6 +367,47 @@ class ImageAssetModel(TestCase):
         settings.ASSET_IMAGE_EXTENSIONS = old_settting
 
 
+class FakePool(object):
+    """ Runs jobs handed over to the pool right away """
+    def __init__(self):
+        self.jobs = []
+
+    def apply_async(self, func, args, callback):
+        self.jobs.append(args)
+        callback(func(*args))
+
+
+@override_settings(ASSET_THUMBNAIL_MODE='pool')
+class ThumbnailPoolTest(TransactionTestCase):
+    def setUp(self):
+        self.user = create_user()
+        self.pool = FakePool()
+        self.get_pool = thumbnails.get_pool
+        thumbnails.get_pool = lambda: self.pool
+
+    def tearDown(self):
+        thumbnails.get_pool = self.get_pool
+        clean_media()
+
+    def test_waits_for_commit(self):
+        with atomic():
+            asset = create_image_asset(creator=self.user)
+            self.assertEqual([], self.pool.jobs)
+        self.assertEqual([[(asset.pk, asset.image.name)]], self.pool.jobs)
+
+        image = models.ImageAsset.objects.get(pk=asset.pk)
+        size = settings.ASSET_IMAGE_THUMBNAIL_SIZE
+        self.assertEqual(thumbnail(image.image.name, size).url,
+                         image.thumbnail_url)
+
+    def test_skips_rolled_back_images(self):
+        with self.assertRaises(ValueError):
+            with atomic():
+                create_image_asset(creator=self.user)
+                raise ValueError
+        self.assertEqual([], self.pool.jobs)
+
+
 class FileAssetModel(TestCase):
     def setUp(self):
         super(FileAssetModel, self).setUp()
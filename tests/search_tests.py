@@ -0,0 +1,115 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from asset_library import models
+from asset_library.forms import FilterAPIForm
+from asset_library.search import get_search_backend, tokenize
+from .utils import create_snippet_asset, create_user
+
+
+class TestTokenize(TestCase):
+    def test_splits_lowercased_words(self):
+        self.assertEqual([u'red', u'car', u'2014'],
+                         tokenize(u'Red car, 2014!'))
+
+    def test_keeps_unicode_letters(self):
+        self.assertEqual([u'\u010dern\xfd', u'k\u016f\u0148'],
+                         tokenize(u'\u010cern\xfd k\u016f\u0148'))
+
+
+@override_settings(
+    ASSET_SEARCH_BACKEND='asset_library.search.InvertedIndexSearchBackend')
+class TestInvertedIndexSearch(TestCase):
+    def setUp(self):
+        self.user = create_user()
+
+    def search(self, query, ranked=False):
+        queryset = models.Asset.objects.all()
+        return get_search_backend().filter(queryset, query, ranked)
+
+    def names(self, query):
+        return sorted(asset.name for asset in self.search(query))
+
+    def test_searches_all_texts(self):
+        asset = create_snippet_asset(
+            creator=self.user, name='Header', description='Summer sale',
+            contents='Buy now')
+        asset.tags = [models.Tag.objects.create(name='newsletter')]
+
+        for query in ('header', 'summer', 'buy', 'newsletter'):
+            self.assertEqual(['Header'], self.names(query))
+
+    def test_every_word_is_prefix(self):
+        create_snippet_asset(creator=self.user, name='Red car')
+        create_snippet_asset(creator=self.user, name='Red carpet')
+        create_snippet_asset(creator=self.user, name='Blue car')
+
+        self.assertEqual(['Red car', 'Red carpet'], self.names('red car'))
+        self.assertEqual(['Red carpet'], self.names('carp'))
+        self.assertEqual([], self.names('arp'))
+
+    def test_updates_index_on_save(self):
+        asset = create_snippet_asset(creator=self.user, name='Old name')
+        asset.name = 'New name'
+        asset.save()
+        self.assertEqual([], self.names('old'))
+        self.assertEqual(['New name'], self.names('new'))
+
+    def test_updates_index_on_tags_change(self):
+        asset = create_snippet_asset(creator=self.user, name='Asset')
+        tag = models.Tag.objects.create(name='winter')
+        asset.tags.add(tag)
+        self.assertEqual(['Asset'], self.names('winter'))
+        asset.tags.remove(tag)
+        self.assertEqual([], self.names('winter'))
+
+    def test_updates_index_on_tag_rename(self):
+        asset = create_snippet_asset(creator=self.user, name='Asset')
+        tag = models.Tag.objects.create(name='winter')
+        asset.tags.add(tag)
+        tag.name = 'summer'
+        tag.save()
+        self.assertEqual([], self.names('winter'))
+        self.assertEqual(['Asset'], self.names('summer'))
+
+    def test_updates_index_on_tag_delete(self):
+        asset = create_snippet_asset(creator=self.user, name='Asset')
+        asset.tags.add(models.Tag.objects.create(name='winter'))
+        models.Tag.objects.get(name='winter').delete()
+        self.assertEqual([], self.names('winter'))
+
+    def test_updates_index_on_clearing_assets_of_tag(self):
+        asset = create_snippet_asset(creator=self.user, name='Asset')
+        tag = models.Tag.objects.create(name='winter')
+        asset.tags.add(tag)
+        tag.assets.clear()
+        self.assertEqual([], self.names('winter'))
+
+    def test_removes_deleted_assets(self):
+        asset = create_snippet_asset(creator=self.user, name='Asset')
+        asset.delete()
+        self.assertEqual(0, models.SearchToken.objects.count())
+
+    def test_ranks_name_first(self):
+        create_snippet_asset(creator=self.user, name='Other',
+                             description='Logo of the company')
+        create_snippet_asset(creator=self.user, name='Logo')
+        ranked = self.search('logo', ranked=True).order_by('-search_rank')
+        self.assertEqual(['Logo', 'Other'],
+                         [asset.name for asset in ranked])
+
+    def test_relevance_sort_in_api_form(self):
+        create_snippet_asset(creator=self.user, name='Other',
+                             description='Logo of the company')
+        create_snippet_asset(creator=self.user, name='Logo')
+        form = FilterAPIForm({'search': 'logo', 'sort_by': 'relevance'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(('search_rank', True), form.get_sort_key())
+        queryset = form.get_queryset(self.user, models.Asset.objects.all())
+        self.assertEqual(['Logo', 'Other'],
+                         [asset.name for asset in queryset])
+
+    def test_bulk_share_indexes_copies(self):
+        asset = create_snippet_asset(creator=self.user, name='Shared')
+        models.Asset.objects.bulk_share([asset], self.user, [create_user()])
+        self.assertEqual(2, len(self.names('shared')))
@@ -0,0 +1,74 @@
+import os
+import shutil
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from asset_library import models
+from asset_library.storage import ContentAddressedStorage
+from asset_library.utils import copy_to_campaign, media_uri_to_path
+from .utils import clean_media, create_user, get_fixture_path
+
+
+class TestContentAddressedStorage(TestCase):
+    def setUp(self):
+        self.storage = ContentAddressedStorage()
+
+    def tearDown(self):
+        clean_media()
+
+    def test_same_contents_are_stored_once(self):
+        name1 = self.storage.save('files/a.txt', ContentFile('contents'))
+        name2 = self.storage.save('files/b.TXT', ContentFile('contents'))
+        self.assertEqual(name1, name2)
+        self.assertTrue(name1.startswith('files/'))
+        self.assertTrue(name1.endswith('.txt'))
+
+        directory = os.path.dirname(self.storage.path(name1))
+        self.assertEqual(1, len(os.listdir(directory)))
+
+    def test_different_contents_are_stored_separately(self):
+        name1 = self.storage.save('files/a.txt', ContentFile('contents'))
+        name2 = self.storage.save('files/a.txt', ContentFile('other'))
+        self.assertNotEqual(name1, name2)
+        self.assertEqual('other', self.storage.open(name2).read())
+
+    def test_referenced_file_is_not_deleted(self):
+        with open(get_fixture_path('TEST_FILE.txt')) as fp:
+            name = self.storage.save('asset_library/files/a.txt', File(fp))
+        asset = models.FileAsset.objects.create(
+            name='asset', file=name, creator=create_user())
+
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+
+        asset.delete()
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+
+
+class TestCopyToCampaign(TestCase):
+    def setUp(self):
+        self.source = os.path.join(settings.MEDIA_ROOT, 'source.txt')
+        os.makedirs(settings.MEDIA_ROOT)
+        shutil.copyfile(get_fixture_path('TEST_FILE.txt'), self.source)
+
+    def tearDown(self):
+        clean_media()
+
+    def test_campaign_copy_is_hardlink(self):
+        url = copy_to_campaign(self.source, 'email/1/1')
+        copy_path = media_uri_to_path(url, True)
+        self.assertEqual(os.stat(self.source).st_ino,
+                         os.stat(copy_path).st_ino)
+
+    @override_settings(ASSET_CAMPAIGN_COPY_METHOD='copy')
+    def test_campaign_copy_can_be_copied(self):
+        url = copy_to_campaign(self.source, 'email/1/1')
+        copy_path = media_uri_to_path(url, True)
+        self.assertNotEqual(os.stat(self.source).st_ino,
+                            os.stat(copy_path).st_ino)
+        with open(self.source) as source, open(copy_path) as copy:
+            self.assertEqual(source.read(), copy.read())
@@ -0,0 +1,54 @@
+from django.test import TestCase, TransactionTestCase
+
+from asset_library.transactions import after_commit, atomic, \
+    discard_commit_callbacks, run_commit_callbacks
+
+
+class TestAfterCommit(TransactionTestCase):
+    def setUp(self):
+        self.calls = []
+
+    def call(self):
+        self.calls.append(True)
+
+    def test_calls_right_away_without_transaction(self):
+        after_commit(self.call)
+        self.assertEqual([True], self.calls)
+
+    def test_waits_for_commit(self):
+        with atomic():
+            with atomic():
+                after_commit(self.call)
+            self.assertEqual([], self.calls)
+        self.assertEqual([True], self.calls)
+
+    def test_calls_discarded_of_rolled_back(self):
+        with self.assertRaises(ValueError):
+            with atomic():
+                after_commit(lambda: None, discarded=self.call)
+                raise ValueError
+        self.assertEqual([True], self.calls)
+
+    def test_forgets_rolled_back(self):
+        with self.assertRaises(ValueError):
+            with atomic():
+                after_commit(self.call)
+                raise ValueError
+        self.assertEqual([], self.calls)
+        with atomic():
+            pass
+        self.assertEqual([], self.calls)
+
+
+class TestAfterCommitOfOuterTransaction(TestCase):
+    def tearDown(self):
+        discard_commit_callbacks()
+
+    def test_waits_for_transaction_of_caller(self):
+        calls = []
+        with atomic():
+            after_commit(lambda: calls.append(True))
+        # TestCase runs tests in a transaction, like ATOMIC_REQUESTS
+        self.assertEqual([], calls)
+        run_commit_callbacks()
+        self.assertEqual([True], calls)
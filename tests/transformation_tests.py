@@ -0,0 +1,197 @@
+import datetime
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from asset_library import models, transformations
+from asset_library.transactions import discard_commit_callbacks, \
+    run_commit_callbacks
+from asset_library.transformations import clean_results, \
+    get_transformation_key, run_job, store_result, submit_job
+
+
+class TransformationTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_file(self, name, content='image'):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def store(self, name):
+        path = self.create_file(name)
+        store_result(name, path, 10, 10)
+        return path
+
+    def get_keys(self):
+        return list(models.TransformationResult.objects
+                    .order_by('key').values_list('key', flat=True))
+
+
+class TestTransformationKey(TransformationTestCase):
+    def test_depends_on_contents_and_operations(self):
+        source = self.create_file('source.png')
+        copy = self.create_file('copy.png')
+        other = self.create_file('other.png', 'other image')
+        operations = [('rotate', {'angle': 90})]
+        key = get_transformation_key(source, operations)
+        self.assertEqual(key, get_transformation_key(copy, operations))
+        self.assertNotEqual(key, get_transformation_key(other, operations))
+        self.assertNotEqual(key, get_transformation_key(
+            source, [('rotate', {'angle': 180})]))
+        self.assertNotEqual(key, get_transformation_key(
+            source, operations, quality=50))
+
+    def test_depends_on_directory(self):
+        # Identical images of two campaigns, see utils.clean_images()
+        source = self.create_file('source.png')
+        os.mkdir(os.path.join(self.directory, 'campaign'))
+        copy = self.create_file(os.path.join('campaign', 'source.png'))
+        self.assertNotEqual(get_transformation_key(source, []),
+                            get_transformation_key(copy, []))
+
+    def test_notices_changed_source(self):
+        source = self.create_file('source.png')
+        key = get_transformation_key(source, [])
+        self.create_file('source.png', 'changed image')
+        self.assertNotEqual(key, get_transformation_key(source, []))
+
+
+class TestStoreResult(TransformationTestCase):
+    @override_settings(ASSET_TRANSFORMATION_CACHE_SIZE=2)
+    def test_evicts_least_recently_used(self):
+        self.store('a')
+        self.store('b')
+        models.TransformationResult.objects.filter(key='a').update(
+            date_used=timezone.now() + datetime.timedelta(seconds=1))
+        self.store('c')
+        self.assertEqual(['a', 'c'], self.get_keys())
+
+    def test_keeps_first_result_of_key(self):
+        first = self.store('a')
+        second = self.create_file('b')
+        self.assertEqual((first, 10, 10), store_result('a', second, 20, 20))
+        self.assertEqual(
+            first, models.TransformationResult.objects.get(key='a').path)
+        self.assertFalse(os.path.exists(second))
+
+
+class TestCleanResults(TransformationTestCase):
+    def test_forgets_missing_files(self):
+        os.remove(self.store('a'))
+        self.store('b')
+        self.assertEqual(1, clean_results())
+        self.assertEqual(['b'], self.get_keys())
+
+    def test_forgets_unused_results(self):
+        old = self.store('a')
+        self.store('b')
+        models.TransformationResult.objects.filter(key='a').update(
+            date_used=timezone.now() - datetime.timedelta(days=10))
+        self.assertEqual(1, clean_results(days=7))
+        self.assertEqual(['b'], self.get_keys())
+        self.assertTrue(os.path.exists(old))
+
+    def test_command(self):
+        os.remove(self.store('a'))
+        call_command('clean_transformation_results', days=7)
+        self.assertEqual([], self.get_keys())
+
+
+class TestRunJob(TransformationTestCase):
+    def setUp(self):
+        super(TestRunJob, self).setUp()
+        self.user = User.objects.create_user('dummy-user', 'dummy@example.com')
+
+    def create_job(self):
+        return models.TransformationJob.objects.create(creator=self.user)
+
+    def test_records_progress_and_result(self):
+        job = self.create_job()
+        progresses = []
+
+        def render(path, operations, quality, progressive, progress):
+            for applied in range(1, len(operations) + 1):
+                progress(applied)
+                progresses.append(models.TransformationJob.objects.get(
+                    pk=job.pk).progress)
+            return 'result.png', 20, 10
+
+        run_job(job.pk, render, 'source.png', [('grayscale', {})] * 4,
+                None, False)
+        self.assertEqual([25, 50, 75, 100], progresses)
+        job = models.TransformationJob.objects.get(pk=job.pk)
+        self.assertEqual(models.TransformationJob.DONE, job.status)
+        self.assertEqual(('result.png', 20, 10),
+                         (job.path, job.width, job.height))
+
+    def test_clean_results_deletes_old_jobs(self):
+        job = self.create_job()
+        self.create_job()
+        models.TransformationJob.objects.filter(pk=job.pk).update(
+            date_created=timezone.now() - datetime.timedelta(days=10))
+        clean_results(days=7)
+        self.assertEqual(1, models.TransformationJob.objects.count())
+
+    def test_skips_finished_jobs(self):
+        job = self.create_job()
+        models.TransformationJob.objects.filter(pk=job.pk).update(
+            status=models.TransformationJob.FAILED)
+
+        def render(*args, **kwargs):
+            raise AssertionError("Failed job is rendered")
+        run_job(job.pk, render, 'source.png', [], None, False)
+
+    def test_clean_results_fails_stale_jobs(self):
+        stale = self.create_job()
+        fresh = self.create_job()
+        models.TransformationJob.objects.filter(pk=stale.pk).update(
+            date_created=timezone.now() - datetime.timedelta(hours=1))
+        clean_results()
+        statuses = dict(models.TransformationJob.objects.values_list(
+            'pk', 'status'))
+        self.assertEqual({stale.pk: models.TransformationJob.FAILED,
+                          fresh.pk: models.TransformationJob.QUEUED},
+                         statuses)
+
+    @override_settings(ASSET_IMAGE_EDITOR_WORKERS=1)
+    def test_submits_job_after_commit(self):
+        submitted = []
+        submit_to_pool = transformations._submit_to_pool
+        pending = transformations._pending
+        transformations._submit_to_pool = \
+            lambda pk, *args: submitted.append(pk)
+        try:
+            # TestCase runs tests in a transaction, like ATOMIC_REQUESTS
+            job = submit_job(self.user, None, 'source.png', [])
+            self.assertEqual([], submitted)
+            run_commit_callbacks()
+        finally:
+            transformations._submit_to_pool = submit_to_pool
+            transformations._pending = pending
+        self.assertEqual([job.pk], submitted)
+
+    @override_settings(ASSET_IMAGE_EDITOR_WORKERS=1,
+                       ASSET_IMAGE_EDITOR_QUEUE_SIZE=0)
+    def test_uncommitted_jobs_take_queue(self):
+        pending = transformations._pending
+        try:
+            self.assertTrue(submit_job(self.user, None, 'source.png', []))
+            self.assertIsNone(submit_job(self.user, None, 'source.png', []))
+            # Rolled back job frees its slot
+            discard_commit_callbacks()
+            self.assertEqual(pending, transformations._pending)
+        finally:
+            discard_commit_callbacks()
+            transformations._pending = pending
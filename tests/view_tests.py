@@ -0,0 +1,33 @@
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from asset_library import models
+from .utils import clean_media, create_file_asset, create_snippet_asset, \
+    create_user
+
+
+class TestAssetBulkShareView(TestCase):
+    def setUp(self):
+        self.user = create_user(name='sharer', password='password')
+        self.recipients = [create_user(), create_user()]
+        self.assets = [create_snippet_asset(creator=self.user),
+                       create_file_asset(creator=self.user)]
+        self.client.login(username='sharer', password='password')
+
+    def tearDown(self):
+        clean_media()
+
+    def test_shares_assets_with_users(self):
+        response = self.client.post(reverse('asset_library:library_share'), {
+            'assets': [asset.pk for asset in self.assets],
+            'shared_with': [user.pk for user in self.recipients],
+        })
+        self.assertEqual(302, response.status_code)
+        self.assertTrue(response['Location'].endswith(
+            reverse('asset_library:library_list')))
+        for user in self.recipients:
+            inbox = models.Asset.objects.filter(
+                creator=user, shared_by=self.user).select_subclasses()
+            self.assertEqual(
+                sorted((type(asset), asset.name) for asset in self.assets),
+                sorted((type(asset), asset.name) for asset in inbox))